@@ -3,10 +3,10 @@
 
 $ python3 calllog.py
 ...
-[('calllog.py', 'level1'),
- ('calllog.py', 'level2'),
- ('calllog.py', 'level3'),
- ('/Users/alrhim/Runner/examples/calllog_subordinate.py', 'step2_1')]
+[('calllog.py', 'level1', 19),
+ ('calllog.py', 'level2', 26),
+ ('calllog.py', 'level3', 33),
+ ('/Users/alrhim/Runner/examples/calllog_subordinate.py', 'step2_1', 7)]
 """
 
 import pprint
@@ -0,0 +1,87 @@
+"""Measure how the cost of saving and restoring grows with the stack depth.
+
+Each round recurses to the given depth, snapshots the stack and pickles it,
+then unpickles the snapshot and restores it. Both costs should grow linearly
+with the depth, so the per-frame columns should stay roughly flat.
+
+$ python3 deep_recursion_benchmark.py
+   depth   save (ms)  restore (ms)  save/frame (us)  restore/frame (us)
+    1000         ...           ...              ...                 ...
+"""
+
+import os
+import pickle
+import resource
+import sys
+import time
+
+import function_checkpointing.headroom as headroom
+import function_checkpointing.save_restore as save_restore
+
+DEPTHS = [1000, 2000, 5000, 10000, 20000, 40000]
+
+# depth -> how long it took to snapshot and pickle the stack.
+save_seconds = {}
+# When the restore of the current round started.
+restore_started = 0.0
+
+
+def bottom(depth: int):
+    t0 = time.perf_counter()
+    ckpt = save_restore.save_jump()
+    if not ckpt:
+        restore_seconds = time.perf_counter() - restore_started
+        print(
+            "%8d %11.1f %13.1f %16.2f %19.2f"
+            % (
+                depth,
+                save_seconds[depth] * 1e3,
+                restore_seconds * 1e3,
+                save_seconds[depth] / depth * 1e6,
+                restore_seconds / depth * 1e6,
+            )
+        )
+        return None
+
+    data = pickle.dumps(ckpt, pickle.HIGHEST_PROTOCOL)
+    save_seconds[depth] = time.perf_counter() - t0
+    return data
+
+
+def recurse(depth: int, n: int):
+    if n:
+        return recurse(depth, n - 1)
+    return bottom(depth)
+
+
+def main():
+    global restore_started
+
+    print("   depth   save (ms)  restore (ms)  save/frame (us)  restore/frame (us)")
+    for depth in DEPTHS:
+        data = recurse(depth, depth)
+        if data:
+            restore_started = time.perf_counter()
+            save_restore.jump(pickle.loads(data))
+            # The restored program ran the remaining rounds.
+            return
+
+
+def raise_limits():
+    """Make room for the deepest round, re-executing ourselves if the C stack
+    needs to grow."""
+    sys.setrecursionlimit(2 * max(DEPTHS) + 1000)
+
+    needed = 4 * max(DEPTHS) * headroom.C_STACK_BYTES_PER_FRAME
+    soft, hard = resource.getrlimit(resource.RLIMIT_STACK)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        if hard != resource.RLIM_INFINITY and hard < needed:
+            sys.exit("The stack size limit is too low for this benchmark.")
+        resource.setrlimit(resource.RLIMIT_STACK, (needed, hard))
+        # The main thread's stack size is fixed when the process starts.
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+if __name__ == "__main__":
+    raise_limits()
+    main()
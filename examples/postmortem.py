@@ -0,0 +1,53 @@
+"""Illustrate resuming right before the call that crashed.
+
+Run this code once. It crashes in step2 and saves a post-mortem checkpoint
+right before the call to step2. Then fix step2 and rerun. The program resumes
+from the post-mortem checkpoint, so step0 and step1 don't run again.
+"""
+
+import logging
+import function_checkpointing as ckpt
+
+
+def step0():
+    print(">step 0")
+
+
+def step1():
+    print(">step 1")
+
+
+def step2():
+    print(">step 2")
+    raise RuntimeError("step2 is broken. Fix it and rerun.")
+
+
+def processing():
+    print("starting processing")
+
+    if not ckpt.save_checkpoint_and_call_log("start"):
+        print("Resuming from start")
+
+    step0()
+    step1()
+    step2()
+
+    print("done")
+
+
+def main():
+    logging.basicConfig()
+    logging.getLogger("function_checkpointing").setLevel(logging.INFO)
+
+    # Trace before resuming too, so that a crash after resuming is captured.
+    ckpt.start_call_tracing([__file__])
+    ckpt.enable_postmortem_checkpoints()
+    try:
+        ckpt.resume_from_last_unchanged_checkpoint()
+    except ckpt.CheckpointNotFound:
+        print("Starting from scratch")
+        processing()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,31 +4,120 @@
 from typing import List, Set, Tuple
 import collections
 import glob
-import importlib.util
 import itertools
 import logging
 import os
 import pickle
 import re
+import time
 
 
 import function_checkpointing.calltrace as calltrace
+import function_checkpointing.checkpoint_file as checkpoint_file
+import function_checkpointing.code_index as code_index
+import function_checkpointing.compatibility as compatibility
+import function_checkpointing.journal as journal
+import function_checkpointing.postmortem as postmortem
+import function_checkpointing.prefetch as prefetch
+import function_checkpointing.preemption as preemption
+import function_checkpointing.retention as retention
 import function_checkpointing.save_restore as save_restore
+from function_checkpointing.async_checkpoint import (
+    resume_from_checkpoint_async,
+    save_checkpoint_async,
+    set_async_checkpoint_limit,
+)
+from function_checkpointing.compatibility import IncompatibleCheckpoint
+from function_checkpointing.fingerprint import hash_function
+from function_checkpointing.headroom import set_c_stack_bytes_per_frame
+from function_checkpointing.instrumentation import (
+    Counters,
+    add_instrumentation_sink,
+    remove_instrumentation_sink,
+)
+from function_checkpointing.journal import disable_journal, enable_journal
+from function_checkpointing.memo_cache import memoize, set_memoize_cache
+from function_checkpointing.placement import placement_report
+from function_checkpointing.postmortem import (
+    disable_postmortem_checkpoints,
+    enable_postmortem_checkpoints,
+)
+from function_checkpointing.preemption import checkpoint_every, checkpoint_on_signals
+from function_checkpointing.resumable import (
+    register_iterator_adapter,
+    resumable_generator,
+    resumable_lines,
+)
+from function_checkpointing.retention import KeepExponential, KeepLast
+from function_checkpointing.size_profile import profile_checkpoint
+from function_checkpointing.transient import register_transient_type, transient_locals
 
 log = logging.getLogger(__name__)
 
 
+def check_checkpoint(fname: str):
+    """Raise IncompatibleCheckpoint if the running program can't restore the
+    checkpoint.
+
+    Only the checkpoint's header is read, so this is cheap enough to call
+    before every attempt to resume.
+    """
+    header = checkpoint_file.read_header(f"__checkpoints__/{fname}")
+    if header:
+        compatibility.check(header)
+
+
 def resume_from_checkpoint(fname: str):
-    with open(f"__checkpoints__/{fname}", "rb") as f:
-        ckpt = pickle.load(f)
+    pending = prefetch.take(fname)
+    if pending:
+        pending.wait()
+
+    check_checkpoint(fname)
+    ckpt = checkpoint_file.read_checkpoint(f"__checkpoints__/{fname}")
     log.info("jump(%s)", fname)
     return save_restore.jump(ckpt)
 
 
+def _dump(obj, path: str, *more):
+    """Pickle obj, followed by the objects in `more`, to path.
+
+    The objects are written to a temporary file that's then renamed into
+    place, so a write interrupted by a crash or a kill never clobbers the file.
+    """
+    tmp_path = os.path.join(os.path.dirname(path), "." + os.path.basename(path))
+    with open(tmp_path, "wb") as f:
+        pickle.dump(obj, f)
+        for o in more:
+            pickle.dump(o, f)
+    os.replace(tmp_path, path)
+    journal.record_write(path)
+
+
+def _dump_call_log(checkpoint_name: str, funcall_log, checkpoint_seconds: float):
+    """Save a call log, and the call statistics if they're being collected.
+
+    See placement.py for the format.
+    """
+    path = "__checkpoints__/calltrace-" + checkpoint_name
+    if not calltrace.collect_call_stats:
+        _dump(funcall_log, path)
+        return
+
+    # The time between checkpoints, not counting this one.
+    interval = time.monotonic() - calltrace.interval_start - checkpoint_seconds
+    stats = {
+        "calls": {key: tuple(s) for key, s in calltrace.call_stats.items()},
+        "interval_seconds": interval,
+        "checkpoint_seconds": checkpoint_seconds,
+        "checkpoint_bytes": os.path.getsize("__checkpoints__/" + checkpoint_name),
+    }
+    _dump(funcall_log, path, stats)
+
+
 def save_checkpoint(fname: str):
-    if fname.startswith("calltrace-"):
+    if fname.startswith(("calltrace-", ".")):
         raise ValueError(
-            '"calltrace-" is a reserved prefix in checkpoint "%s".' % fname
+            '"calltrace-" and "." are reserved prefixes in checkpoint "%s".' % fname
         )
 
     os.makedirs("__checkpoints__", exist_ok=True)
@@ -37,18 +126,46 @@ def save_checkpoint(fname: str):
     if ckpt:
         # We're actually saving instead of returning from save_jump after
         # a restore.
-        with open(f"__checkpoints__/{fname}", "wb") as f:
-            pickle.dump(ckpt, f)
+        t0 = time.monotonic()
+        checkpoint_file.write_checkpoint(f"__checkpoints__/{fname}", ckpt)
+        # Predicts whether a checkpoint on preemption fits in the grace period.
+        preemption.last_write_seconds = time.monotonic() - t0
+        retention.request_enforcement("__checkpoints__")
 
     return ckpt
 
 
+def set_retention_policy(*keep, max_bytes: int = None):
+    """Bound the disk space used by checkpoints.
+
+    `keep` are policies like KeepLast(10) or KeepExponential(). A checkpoint
+    survives if any of them selects it. The survivors are then capped to
+    `max_bytes` by deleting the oldest ones. The most recent checkpoint is
+    always kept.
+
+    The policy is enforced in a background thread after each save. Call with
+    no arguments and no `max_bytes` to keep every checkpoint again.
+    """
+    if not keep and max_bytes is None:
+        retention.policy = None
+    else:
+        retention.policy = retention.RetentionPolicy(keep, max_bytes)
+
+
+def _checkpoint_order(trace_fname: str) -> Tuple[int, float]:
+    """Sort key that orders call logs by when their checkpoint was taken."""
+    try:
+        header = checkpoint_file.read_header(checkpoint_from_trace(trace_fname))
+    except FileNotFoundError:
+        header = None
+    if header:
+        return header["sequence"], header["time"]
+    # Checkpoints saved without a header sort before the others.
+    return 0, os.path.getmtime(trace_fname)
+
+
 def sorted_calltraces():
-    for _, fname in sorted(
-        (os.path.getmtime(fname), fname)
-        for fname in glob.glob("__checkpoints__/calltrace-*")
-    ):
-        yield fname
+    yield from sorted(glob.glob("__checkpoints__/calltrace-*"), key=_checkpoint_order)
 
 
 def checkpoint_from_trace(trace_fname: str) -> str:
@@ -59,6 +176,25 @@ def checkpoint_from_trace(trace_fname: str) -> str:
     return "__checkpoints__/" + b[len("calltrace-") :]
 
 
+def _function_changed(filename: str, qualname: str, expected_hash: bytes) -> bool:
+    """Whether the function with this qualified name in the current source
+    of filename no longer hashes to expected_hash.
+
+    The source is compiled but not executed, so methods and nested functions
+    can be found too. A function that moved within its file is still matched.
+    """
+    try:
+        index = code_index.code_index(filename)
+    except (OSError, SyntaxError, ValueError) as e:
+        log.info("Can't read %s: %s", filename, e)
+        return True
+
+    return all(
+        calltrace.hash_code(code) != expected_hash
+        for code in index.by_qualname.get(qualname, ())
+    )
+
+
 def _change_point() -> str:
     """Identify a function call log whose functions have been modified.
 
@@ -70,8 +206,6 @@ def _change_point() -> str:
     found, returns the last call log. If there are no call logs at all, returns
     an empty string.
     """
-    module_cache = {}
-
     # Inspect each checkpoint in sequence to see if the code invoked has changed
     last_intact_trace_fname: str = ""
 
@@ -82,26 +216,11 @@ def _change_point() -> str:
         # Check each function the was called between this checkpoint and the previous
         # checkpoint. Determine whether the function's code has changed by comparing
         # the hash of its current bytecode against its old bytecode hash.
-        for (filename, function_name), expected_hash in functions.items():
-            # Load the file as a module. Use our own module cache to avoid polluting
-            # the module cache.
-            try:
-                module = module_cache[filename]
-            except KeyError:
-                spec = importlib.util.spec_from_file_location("temporary", filename)
-                if not spec:
-                    raise RuntimeError(f"Could not load {filename}")
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
-                module_cache[filename] = module
-
-            # The hash for the current implementation of the function
-            current_hash = calltrace.hash_code(getattr(module, function_name).__code__)
-
-            if current_hash != expected_hash:
-                log.info(
-                    "Calllog %s has change %s:%s", trace_fname, filename, function_name
-                )
+        for key, expected_hash in functions.items():
+            # Call logs saved by older versions are keyed by (filename, name).
+            filename, qualname = key[:2]
+            if _function_changed(filename, qualname, expected_hash):
+                log.info("Calllog %s has change %s:%s", trace_fname, filename, qualname)
                 return last_intact_trace_fname
 
         last_intact_trace_fname = trace_fname
@@ -116,7 +235,8 @@ class CheckpointNotFound(Exception):
 def resume_from_last_unchanged_checkpoint():
     """Resume from the latest checkpoint that contains unmodified code.
     """
-    trace_fname = _change_point()
+    pending = prefetch.take(prefetch.LAST_UNCHANGED)
+    trace_fname = pending.wait() if pending else _change_point()
     if not trace_fname:
         raise CheckpointNotFound()
 
@@ -128,14 +248,40 @@ def resume_from_last_unchanged_checkpoint():
     next(fnames_to_del)
     for t in fnames_to_del:
         log.info("Deleting modified trace file & checkpoint %s", t)
-        os.unlink(t)
-        os.unlink(checkpoint_from_trace(t))
+        journal.remove(t)
+        journal.remove(checkpoint_from_trace(t))
 
     return resume_from_checkpoint(os.path.basename(checkpoint_fname))
 
 
-def start_call_tracing(module_names: List[str]):
-    calltrace.trace_funcalls(module_names)
+def _locate_last_unchanged_checkpoint() -> Tuple[str, str]:
+    trace_fname = _change_point()
+    return trace_fname, trace_fname and checkpoint_from_trace(trace_fname)
+
+
+def prefetch_resume(checkpoint_name: str = None):
+    """Start finding and reading the checkpoint to resume from in a
+    background thread, so that resuming only waits for what's left.
+
+    With no checkpoint_name, the checkpoint is the one
+    resume_from_last_unchanged_checkpoint() would pick. Call this as early as
+    possible, or set the FUNCTION_CHECKPOINTING_PREFETCH environment variable
+    to 1 (or to a checkpoint name) to start when the package is imported.
+    """
+    if checkpoint_name is None:
+        prefetch.start(prefetch.LAST_UNCHANGED, _locate_last_unchanged_checkpoint)
+    else:
+        path = f"__checkpoints__/{checkpoint_name}"
+        prefetch.start(checkpoint_name, lambda: (checkpoint_name, path))
+
+
+def start_call_tracing(module_names: List[str], collect_stats: bool = False):
+    """Log the calls to the functions defined in the given files.
+
+    With collect_stats, also count the calls to each function and time them,
+    for placement_report().
+    """
+    calltrace.trace_funcalls(module_names, collect_stats)
 
 
 def save_checkpoint_and_call_log(checkpoint_name: str):
@@ -145,18 +291,70 @@ def save_checkpoint_and_call_log(checkpoint_name: str):
     modules = list(calltrace.modules)
     calltrace.stop_trace_funcalls()
 
+    t0 = time.monotonic()
     ckpt = save_checkpoint(checkpoint_name)
     if ckpt:
         log.debug('About to save the checkpoint "%s"', checkpoint_name)
         # We're actually saving a checkpoint. Save the call log in a separate file
-        with open("__checkpoints__/calltrace-" + checkpoint_name, "wb") as f:
-            pickle.dump(calltrace.funcall_log, f)
+        _dump_call_log(checkpoint_name, calltrace.funcall_log, time.monotonic() - t0)
+        retention.request_enforcement("__checkpoints__")
     else:
         log.debug('Restored from checkpoint "%s"', checkpoint_name)
 
     # Clear the call log so that the next checkpoint only records the function
     # calls that happen after this checkpoint.
-    calltrace.funcall_log.clear()
+    calltrace.clear_funcall_log()
     calltrace.trace_funcalls(modules)
 
     return ckpt
+
+
+def _write_requested_checkpoint(checkpoint_name: str, ckpt, funcall_log=None):
+    """Write a snapshot captured by the call tracer, along with its call log.
+
+    The call log defaults to the current one, which is then cleared.
+    """
+    os.makedirs("__checkpoints__", exist_ok=True)
+    t0 = time.monotonic()
+    checkpoint_file.write_checkpoint(f"__checkpoints__/{checkpoint_name}", ckpt)
+    seconds = time.monotonic() - t0
+    if funcall_log is None:
+        _dump_call_log(checkpoint_name, calltrace.funcall_log, seconds)
+        calltrace.clear_funcall_log()
+    else:
+        _dump_call_log(checkpoint_name, funcall_log, seconds)
+    retention.request_enforcement("__checkpoints__")
+
+
+preemption.write_checkpoint = _write_requested_checkpoint
+postmortem.write_checkpoint = _write_requested_checkpoint
+
+
+def safe_point():
+    """Take the checkpoint requested by a signal or a timer, if any.
+
+    See checkpoint_on_signals() and checkpoint_every(). Calls into traced
+    functions are safe points too, so you only need to sprinkle safe_point()
+    in code that runs for a long time without calling a traced function.
+
+    Like save_checkpoint, this returns the snapshot when it saves one, and an
+    empty value otherwise, including when it's resumed.
+    """
+    request = preemption.take_request()
+    if request is None:
+        return []
+
+    t0 = time.monotonic()
+    if calltrace.modules:
+        ckpt = save_checkpoint_and_call_log(request.name)
+    else:
+        ckpt = save_checkpoint(request.name)
+
+    if ckpt:
+        preemption.finish(request, time.monotonic() - t0)
+    return ckpt
+
+
+_prefetch_env = os.environ.get("FUNCTION_CHECKPOINTING_PREFETCH")
+if _prefetch_env:
+    prefetch_resume(None if _prefetch_env == "1" else _prefetch_env)
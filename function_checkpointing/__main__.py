@@ -0,0 +1,165 @@
+"""Inspect checkpoints without loading them.
+
+    python -m function_checkpointing list
+    python -m function_checkpointing inspect "step 2"
+    python -m function_checkpointing diff "step 2" "step 3"
+    python -m function_checkpointing profile "step 2"
+    python -m function_checkpointing placement --mtbf 12
+
+Except for profile, only the checkpoint headers and call logs are read, so
+this is fast even for very large checkpoints.
+"""
+
+from typing import Dict, List
+import argparse
+import datetime
+import os
+import sys
+
+import function_checkpointing.checkpoint_file as checkpoint_file
+import function_checkpointing.placement as placement
+import function_checkpointing.size_profile as size_profile
+
+
+def _headers(checkpoint_dir: str) -> List[Dict]:
+    headers = []
+    for path in checkpoint_file.checkpoint_paths(checkpoint_dir):
+        header = checkpoint_file.read_header(path) or {
+            "sequence": 0,
+            "time": os.path.getmtime(path),
+            "payload_size": os.path.getsize(path),
+            "frames": None,
+        }
+        header["name"] = os.path.basename(path)
+        headers.append(header)
+
+    headers.sort(key=lambda h: (h["sequence"], h["time"]))
+    return headers
+
+
+def _header(checkpoint_dir: str, name: str) -> Dict:
+    header = checkpoint_file.read_header(os.path.join(checkpoint_dir, name))
+    if header is None:
+        sys.exit('Checkpoint "%s" was saved without a header.' % name)
+    return header
+
+
+def _format_time(t: float) -> str:
+    return datetime.datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _format_frame(frame: Dict) -> str:
+    name = frame.get("qualname", frame["function"])
+    return "%s:%s in %s" % (frame["file"], frame["line"], name)
+
+
+def list_checkpoints(args):
+    for h in _headers(args.dir):
+        depth = "?" if h["frames"] is None else len(h["frames"])
+        leaf = "" if not h["frames"] else h["frames"][0]["function"]
+        print(
+            "%6d  %s  %12d bytes  %4s frames  %-20s %s"
+            % (
+                h["sequence"],
+                _format_time(h["time"]),
+                h["payload_size"],
+                depth,
+                leaf,
+                h["name"],
+            )
+        )
+
+
+def inspect_checkpoint(args):
+    h = _header(args.dir, args.name)
+    print("name:           %s" % args.name)
+    print("sequence:       %d" % h["sequence"])
+    print("time:           %s" % _format_time(h["time"]))
+    print("payload size:   %d bytes" % h["payload_size"])
+    print("codec:          %s" % h["codec"])
+    print("python version: %s" % h["python_version"])
+    print("frames (innermost first):")
+    for frame in h["frames"]:
+        print("  " + _format_frame(frame))
+
+
+def diff_checkpoints(args):
+    h1 = _header(args.dir, args.name1)
+    h2 = _header(args.dir, args.name2)
+
+    for field in ("python_version", "codec", "payload_size"):
+        if h1[field] != h2[field]:
+            print("%s: %s -> %s" % (field, h1[field], h2[field]))
+
+    # Align the frames from the outermost one, which is where the two call
+    # stacks share a common prefix.
+    frames1 = list(reversed(h1["frames"]))
+    frames2 = list(reversed(h2["frames"]))
+    for depth in range(max(len(frames1), len(frames2))):
+        f1 = frames1[depth] if depth < len(frames1) else None
+        f2 = frames2[depth] if depth < len(frames2) else None
+        if f1 == f2:
+            continue
+        print("frame %d:" % depth)
+        print("  - " + (_format_frame(f1) if f1 else "(none)"))
+        print("  + " + (_format_frame(f2) if f2 else "(none)"))
+
+
+def profile_checkpoint(args):
+    # Unpickling the checkpoint needs the modules it refers to.
+    sys.path.insert(0, os.getcwd())
+    ckpt = checkpoint_file.read_checkpoint(os.path.join(args.dir, args.name))
+    print(size_profile.profile_checkpoint(ckpt).report(args.top))
+
+
+def placement_report(args):
+    try:
+        report = placement.placement_report(args.dir, args.mtbf * 3600)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(report.report(args.top))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m function_checkpointing", description=__doc__.split("\n")[0]
+    )
+    parser.add_argument("--dir", default="__checkpoints__", help="checkpoint directory")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    commands.add_parser("list", help="list checkpoints, oldest first").set_defaults(
+        func=list_checkpoints
+    )
+
+    p = commands.add_parser("inspect", help="describe one checkpoint")
+    p.add_argument("name")
+    p.set_defaults(func=inspect_checkpoint)
+
+    p = commands.add_parser("diff", help="compare the headers of two checkpoints")
+    p.add_argument("name1")
+    p.add_argument("name2")
+    p.set_defaults(func=diff_checkpoints)
+
+    p = commands.add_parser(
+        "profile", help="break down the size of a checkpoint by frame and local"
+    )
+    p.add_argument("name")
+    p.add_argument("--top", type=int, default=20, help="how many locals to show")
+    p.set_defaults(func=profile_checkpoint)
+
+    p = commands.add_parser(
+        "placement", help="suggest where to checkpoint from the call statistics"
+    )
+    p.add_argument(
+        "--mtbf", type=float, default=24, help="mean time between failures, in hours"
+    )
+    p.add_argument("--top", type=int, default=20, help="how many functions to show")
+    p.set_defaults(func=placement_report)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Save checkpoints from asyncio code without stalling the event loop.
+
+save_checkpoint_async() takes the snapshot on the event loop thread, because
+save_jump() has to run in the frame being checkpointed, and then pickles and
+writes it in an executor while the loop keeps serving other tasks:
+
+    await ckpt.save_checkpoint_async("ingest")
+
+The snapshot holds references to the objects on the stack, not copies, and
+they're pickled after save_checkpoint_async() returns. The awaiting coroutine
+is suspended until then, but other tasks that mutate objects it references
+can make the checkpoint inconsistent.
+
+The frames of an asyncio event loop can't be restored (see generators.py), so
+the snapshot stops at the coroutine of the current task. Resume it with
+resume_from_checkpoint_async(), which restores it into a fresh call of the
+same coroutine function:
+
+    asyncio.run(ckpt.resume_from_checkpoint_async("ingest", main()))
+"""
+
+from typing import Dict, Optional
+import asyncio
+import collections
+import concurrent.futures
+import os
+import sys
+import threading
+import weakref
+
+import function_checkpointing.checkpoint_file as checkpoint_file
+import function_checkpointing.compatibility as compatibility
+import function_checkpointing.prefetch as prefetch
+import function_checkpointing.retention as retention
+import function_checkpointing.save_restore as save_restore
+
+# How many checkpoints each event loop writes at once, and the executor they're
+# written in. None means the loop's default executor.
+max_concurrent = 1
+executor: Optional[concurrent.futures.Executor] = None
+
+# loop -> (max_concurrent it was created with, semaphore)
+_semaphores = weakref.WeakKeyDictionary()
+
+# Two writes of the same checkpoint would share a temporary file.
+_path_locks: Dict[str, threading.Lock] = collections.defaultdict(threading.Lock)
+_path_locks_lock = threading.Lock()
+
+
+def set_async_checkpoint_limit(
+    concurrent_writes: int, pool: concurrent.futures.Executor = None
+):
+    """Let each event loop write up to `concurrent_writes` checkpoints at
+    once, in `pool` if given, or in the loop's default executor.
+
+    Saves beyond the limit wait for a slot before they're written.
+    """
+    global max_concurrent, executor
+    if concurrent_writes < 1:
+        raise ValueError("concurrent_writes must be at least 1")
+    max_concurrent = concurrent_writes
+    executor = pool
+
+
+def _semaphore(loop) -> asyncio.Semaphore:
+    limit, semaphore = _semaphores.get(loop, (None, None))
+    if limit != max_concurrent:
+        semaphore = asyncio.Semaphore(max_concurrent)
+        _semaphores[loop] = (max_concurrent, semaphore)
+    return semaphore
+
+
+def _write(path: str, ckpt, cancelled: threading.Event):
+    with _path_locks_lock:
+        lock = _path_locks[path]
+    with lock:
+        if cancelled.is_set():
+            return None
+        return checkpoint_file.write_checkpoint(
+            path, ckpt, should_commit=lambda: not cancelled.is_set()
+        )
+
+
+async def _save(loop, path: str, ckpt):
+    semaphore = _semaphore(loop)
+    await semaphore.acquire()
+
+    cancelled = threading.Event()
+    try:
+        future = loop.run_in_executor(executor, _write, path, ckpt, cancelled)
+    except BaseException:
+        semaphore.release()
+        raise
+    # The slot is held until the worker is done with the file, even if we're
+    # cancelled before that.
+    future.add_done_callback(lambda _: semaphore.release())
+
+    try:
+        header = await asyncio.shield(future)
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
+
+    if header is not None:
+        retention.request_enforcement(os.path.dirname(path))
+    return ckpt
+
+
+def _frames_in_task() -> int:
+    """How many frames the caller's caller is nested in, up to and including
+    the coroutine of the current task."""
+    try:
+        # Python 3.6 only has the deprecated Task.current_task().
+        task = getattr(asyncio, "current_task", asyncio.Task.current_task)()
+    except RuntimeError:
+        # No event loop is running.
+        task = None
+    if task is None:
+        raise RuntimeError("save_checkpoint_async() must be called from a task")
+    coro = task.get_coro() if hasattr(task, "get_coro") else task._coro
+    outermost = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+
+    frames = []
+    frame = sys._getframe(2)
+    while frame is not outermost:
+        if frame is None:
+            raise RuntimeError("save_checkpoint_async() must be called from a task")
+        frames.append(frame)
+        frame = frame.f_back
+    if outermost.f_code is not resume_from_checkpoint_async.__code__:
+        frames.append(outermost)
+    return len(frames)
+
+
+def save_checkpoint_async(fname: str) -> asyncio.Future:
+    """Like save_checkpoint(), but returns an awaitable that writes the
+    checkpoint in an executor.
+
+    The snapshot is taken when save_checkpoint_async() is called, and stops at
+    the coroutine of the current task. Cancelling the awaitable before the
+    checkpoint file is in place discards it, so a checkpoint is either written
+    whole or not at all.
+    """
+    if fname.startswith(("calltrace-", ".")):
+        raise ValueError(
+            '"calltrace-" and "." are reserved prefixes in checkpoint "%s".' % fname
+        )
+    depth = _frames_in_task()
+
+    os.makedirs("__checkpoints__", exist_ok=True)
+
+    # Nothing that can't be pickled may be in a local variable yet.
+    ckpt = save_restore.save_jump(depth + 1)
+    loop = asyncio.get_event_loop()
+    if not ckpt:
+        # We're returning from save_jump after a restore.
+        future = loop.create_future()
+        future.set_result(ckpt)
+        return future
+
+    return asyncio.ensure_future(
+        _save(loop, f"__checkpoints__/{fname}", ckpt), loop=loop
+    )
+
+
+async def resume_from_checkpoint_async(fname: str, coro):
+    """Resume from a checkpoint saved by save_checkpoint_async().
+
+    `coro` is a fresh call of the coroutine function that the checkpoint's
+    task was running, like main() for asyncio.run(main()). The saved state is
+    restored into it, and it runs to completion from where the checkpoint was
+    saved. Returns its result.
+    """
+    pending = prefetch.take(fname)
+    if pending:
+        pending.wait()
+
+    path = f"__checkpoints__/{fname}"
+    header = checkpoint_file.read_header(path)
+    if header:
+        compatibility.check(header)
+    ckpt = checkpoint_file.read_checkpoint(path)
+
+    # The next frame evaluated is coro's, when it's awaited.
+    save_restore.jump_on_next_frame(ckpt)
+    return await coro
@@ -5,29 +5,76 @@ from typing import Dict, Iterable, List, Tuple
 
 from function_checkpointing.jump cimport *
 
-import hashlib
-
-funcall_log: Dict[Tuple[str, str], bytes] = {}
-modules: List[str] = []
+import collections
+import itertools
+import logging
+import time
 
+import function_checkpointing.code_index as code_index
+import function_checkpointing.save_restore as save_restore
+from function_checkpointing.fingerprint import hash_code
 
-def hash_code(f_code) -> bytes:
-  h = hashlib.sha1(f_code.co_code)
-  h.update(str(f_code.co_consts).encode("utf-8"))
-  return h.digest()
+# (co_filename, qualified name, co_firstlineno) -> hash of the function's code
+funcall_log: Dict[Tuple[str, str, int], bytes] = {}
+modules: List[str] = []
+# Whether trace_funcalls() is on. Calls to functions outside `modules` turn
+# the tracer off while they run, so the frame evaluator alone doesn't tell.
+cdef bint tracing = False
+# The thread that called trace_funcalls(). The frame evaluator is shared by all
+# the threads of the interpreter, so other threads (like the retention policy's
+# or the journal's) must neither be traced nor turn the tracer off.
+cdef PyThreadState *trace_thread_state = NULL
+
+# Called with a snapshot of the stack at the next call into a traced function.
+safe_point_callback = None
+
+# Incremented every time the call log is cleared.
+cdef unsigned long log_generation = 0
+
+# When set, the number of calls to each function and the wall time spent in
+# them are recorded in call_stats, with the same keys as funcall_log, as
+# [calls, seconds]. The time of a recursive function is counted once per
+# outermost call, in the interval between checkpoints where that call returns.
+collect_call_stats = False
+call_stats: Dict[Tuple[str, str, int], List] = {}
+# How many calls of each function are running.
+_active_calls: Dict[Tuple[str, str, int], int] = {}
+# When the current call log was started.
+interval_start = time.monotonic()
+
+# When set, the stack is snapshotted when an exception first escapes a traced
+# function. The snapshot is kept in `postmortem` until the exception is either
+# caught or reaches the top level. See postmortem.py.
+capture_postmortems = False
+Postmortem = collections.namedtuple(
+        'Postmortem', ('exc_id', 'exc_type', 'ckpt', 'funcall_log'))
+postmortem = None
+
+log = logging.getLogger(__name__)
 
 
 cdef object pyeval_log_funcall_entry(PyFrameObject *frame, int exc):
   frame_obj = <object> frame
   cdef PyThreadState *state = PyThreadState_Get()
 
+  if state != trace_thread_state or modules is None:
+      # Another thread, or the interpreter is shutting down and has cleared
+      # this module's globals, but weakref callbacks still run.
+      return _PyEval_EvalFrameDefault(frame, exc)
+
   # to ovoid the overhead of this call, log only if the function is in
   # the desired modules.
   if frame_obj.f_code.co_filename not in modules:
       state.interp.eval_frame = _PyEval_EvalFrameDefault
-      r = _PyEval_EvalFrameDefault(frame, exc)
-      state.interp.eval_frame = pyeval_log_funcall_entry
-      return r
+      try:
+          return _PyEval_EvalFrameDefault(frame, exc)
+      finally:
+          # Also when the frame raises, so that tracing survives exceptions
+          # that are caught.
+          state.interp.eval_frame = pyeval_log_funcall_entry
+
+  if safe_point_callback is not None:
+      take_safe_point(state, frame_obj)
 
   #print("---------Tracing-----")
   #print(frame_obj.f_code.co_filename, frame_obj.f_code.co_name)
@@ -35,17 +82,157 @@ cdef object pyeval_log_funcall_entry(PyFrameObject *frame, int exc):
   # Keep a fully qualified name for the function and a sha1 of its code.
   # If we hold references to the frame object, we might cause a lot of
   # unexpected garbage to be kept around.
-  funcall_log[(frame_obj.f_code.co_filename, frame_obj.f_code.co_name)] = hash_code(
-          frame_obj.f_code)
+  cdef Py_ssize_t entry_log_size = len(funcall_log)
+  cdef unsigned long entry_generation = log_generation
+  f_code = frame_obj.f_code
+  key = (f_code.co_filename, code_index.qualname(f_code), f_code.co_firstlineno)
+  funcall_log[key] = hash_code(f_code)
+
+  cdef double t0 = 0
+  cdef bint timed = collect_call_stats
+  if timed:
+      call_stats.setdefault(key, [0, 0.0])[0] += 1
+      _active_calls[key] = _active_calls.get(key, 0) + 1
+      t0 = time.perf_counter()
+
+  try:
+      return _PyEval_EvalFrameDefault(frame, exc)
+  except (Exception, KeyboardInterrupt) as e:
+      # If a checkpoint was saved during the call, it's a better place to
+      # restart from than the call itself.
+      if capture_postmortems and entry_generation == log_generation:
+          take_postmortem(state, frame_obj, e, entry_log_size)
+      raise
+  finally:
+      if timed:
+          record_call_time(key, time.perf_counter() - t0)
+
+
+cdef record_call_time(key, double seconds):
+  active = _active_calls.pop(key) - 1
+  if active:
+      # An inner call of a recursive function. Its time is included in the
+      # outermost call's.
+      _active_calls[key] = active
+      return
+  # The call log may have been cleared since the call started.
+  call_stats.setdefault(key, [0, 0.0])[1] += seconds
+
+
+cdef take_safe_point(PyThreadState *state, frame_obj):
+  """Snapshot the stack right before the call to a traced function and hand
+  the snapshot to safe_point_callback.
+
+  On resume, the caller re-executes the call to the traced function.
+  """
+  caller = frame_obj.f_back
+  if caller is None or not save_restore.calls_code(caller, frame_obj.f_code):
+      # Called from C, like by map() or a property. Re-executing the caller's
+      # call instruction would replay the C code too. Try again at the next
+      # traced call.
+      return
+
+  state.interp.eval_frame = _PyEval_EvalFrameDefault
+  try:
+      try:
+          ckpt = save_restore.save_jump()
+      except NotImplementedError as e:
+          # The caller is at a call site we can't checkpoint around (say, a
+          # generator being iterated). Try again at the next traced call.
+          log.debug("Skipping safe point: %s", e)
+          return
+      safe_point_callback(ckpt)
+  finally:
+      state.interp.eval_frame = pyeval_log_funcall_entry
+
+
+cdef take_postmortem(
+        PyThreadState *state, frame_obj, e, Py_ssize_t entry_log_size):
+  """Snapshot the stack as an exception escapes a traced function.
+
+  The caller is still in the middle of calling the function, so resuming from
+  the snapshot re-executes the failing call. The call log only holds the
+  functions called before the failing call.
+  """
+  global postmortem
+
+  if postmortem is not None and postmortem.exc_id == id(e):
+      # Already captured when the exception escaped a more deeply nested
+      # function.
+      return
+
+  caller = frame_obj.f_back
+  if caller is None or not save_restore.calls_code(caller, frame_obj.f_code):
+      # Called from C. Re-executing the caller's call instruction would replay
+      # the C code too. Try again as the exception escapes the next traced
+      # function.
+      return
+
+  state.interp.eval_frame = _PyEval_EvalFrameDefault
+  try:
+      ckpt = save_restore.save_jump()
+  except NotImplementedError as not_implemented:
+      # Try again as the exception escapes the next traced function.
+      log.debug("Skipping post-mortem snapshot: %s", not_implemented)
+      return
+  finally:
+      state.interp.eval_frame = pyeval_log_funcall_entry
 
-  return _PyEval_EvalFrameDefault(frame, exc)
+  postmortem = Postmortem(id(e), type(e), ckpt,
+          dict(itertools.islice(funcall_log.items(), entry_log_size)))
 
 
-def trace_funcalls(module_fnames: Iterable[str]) -> None:
+def clear_funcall_log() -> None:
+    """Start a new call log. Called after every checkpoint."""
+    global log_generation, postmortem, interval_start
+    funcall_log.clear()
+    call_stats.clear()
+    interval_start = time.monotonic()
+    log_generation += 1
+    # Any post-mortem snapshot is for an exception that was caught.
+    postmortem = None
+
+
+def request_safe_point(callback) -> None:
+    """Call `callback` with a snapshot of the stack at the next traced call.
+
+    Pass None to cancel the request.
+    """
+    global safe_point_callback
+    safe_point_callback = callback
+
+
+def trace_funcalls(module_fnames: Iterable[str], collect_stats: bool = None) -> None:
+    """Log the calls to the functions defined in the given files.
+
+    If collect_stats is given, it turns the collection of call_stats on or
+    off. Otherwise the current setting is kept.
+    """
+    global collect_call_stats, tracing, trace_thread_state
+    if collect_stats is not None:
+        collect_call_stats = collect_stats
     modules.clear()
     modules.extend(module_fnames)
+    tracing = True
+    trace_thread_state = PyThreadState_Get()
     PyThreadState_Get().interp.eval_frame = pyeval_log_funcall_entry
 
 
 def stop_trace_funcalls() -> None:
+    global tracing
+    tracing = False
     PyThreadState_Get().interp.eval_frame = _PyEval_EvalFrameDefault
+
+
+def _resume_tracing() -> None:
+    """Trace calls again once jump() is done restoring a snapshot, if
+    trace_funcalls() is on."""
+    global trace_thread_state
+    if tracing:
+        # The snapshot may have been restored in another thread than the one
+        # that started tracing.
+        trace_thread_state = PyThreadState_Get()
+        PyThreadState_Get().interp.eval_frame = pyeval_log_funcall_entry
+
+
+save_restore.reinstall_eval_frame = _resume_tracing
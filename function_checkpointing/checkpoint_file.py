@@ -0,0 +1,197 @@
+"""The on-disk format of checkpoints.
+
+A checkpoint file starts with a small preamble and a header, followed by the
+pickled snapshot returned by save_jump():
+
+    magic (8 bytes) | header size (u32) | payload size (u64) | header | payload
+
+The header is a small pickled dict that describes the checkpoint: the frames
+it holds, when it was taken, how to decode the payload, and what it takes to
+restore it (see compatibility.py). Tools that only need to know what's in a
+checkpoint read the header and never touch the payload.
+
+Files saved by older versions of this package are bare pickles with no
+header. They can still be loaded.
+"""
+
+from typing import Callable, Dict, Iterable, Optional
+import glob
+import os
+import pickle
+import platform
+import struct
+import threading
+import time
+
+import function_checkpointing.code_index as code_index
+import function_checkpointing.compatibility as compatibility
+import function_checkpointing.instrumentation as instrumentation
+import function_checkpointing.journal as journal
+import function_checkpointing.resumable as resumable
+
+MAGIC = b"FCKPT\x00\x01\n"
+PREAMBLE = struct.Struct("<8sIQ")
+PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+_sequence_lock = threading.Lock()
+_next_sequence: Dict[str, int] = {}
+
+
+def next_sequence(checkpoint_dir: str) -> int:
+    """A sequence number larger than that of any checkpoint in the directory."""
+    with _sequence_lock:
+        if checkpoint_dir not in _next_sequence:
+            headers = (read_header(p) for p in checkpoint_paths(checkpoint_dir))
+            _next_sequence[checkpoint_dir] = 1 + max(
+                (h["sequence"] for h in headers if h), default=0
+            )
+
+        sequence = _next_sequence[checkpoint_dir]
+        _next_sequence[checkpoint_dir] += 1
+        return sequence
+
+
+def checkpoint_paths(checkpoint_dir: str) -> Iterable[str]:
+    """The checkpoint files in the directory, skipping call logs and files
+    that are being written."""
+    for path in glob.glob(os.path.join(checkpoint_dir, "*")):
+        name = os.path.basename(path)
+        if not name.startswith(("calltrace-", ".")) and os.path.isfile(path):
+            yield path
+
+
+def write_checkpoint(
+    path: str, ckpt, should_commit: Callable[[], bool] = None, **extra_header
+) -> Optional[Dict]:
+    """Write a snapshot returned by save_jump() to path.
+
+    The snapshot is written to a temporary file that's then renamed into
+    place, so a write interrupted by a crash or a kill never clobbers a
+    checkpoint. Returns the header.
+
+    If `should_commit` is given, it's called before the rename. When it
+    returns False, the temporary file is deleted and None is returned.
+    """
+    checkpoint_dir = os.path.dirname(path)
+    header = {
+        "frames": [
+            {
+                "function": f.co_name,
+                "qualname": code_index.qualname_at(
+                    f.co_filename, f.co_firstlineno, f.co_name
+                ),
+                "file": f.co_filename,
+                "line": f.f_lineno,
+                "first_line": f.co_firstlineno,
+                "code_hash": compatibility.code_hash(f.co_code),
+            }
+            for f in ckpt
+        ],
+        "codec": "pickle/%d" % PROTOCOL,
+        "python_version": platform.python_version(),
+        "interpreter": compatibility.interpreter_fingerprint(),
+        "sequence": next_sequence(checkpoint_dir),
+        "time": time.time(),
+    }
+    header.update(extra_header)
+    header_bytes = pickle.dumps(header, PROTOCOL)
+
+    timed = instrumentation.enabled
+    t0 = time.perf_counter()
+
+    tmp_path = os.path.join(checkpoint_dir, "." + os.path.basename(path))
+    try:
+        with open(tmp_path, "wb") as f:
+            out = instrumentation.TimedFile(f) if timed else f
+            out.write(PREAMBLE.pack(MAGIC, len(header_bytes), 0))
+            out.write(header_bytes)
+            pickler = pickle.Pickler(out, PROTOCOL)
+            pickler.dispatch_table = resumable.dispatch_table
+            if timed:
+                write_seconds = out.seconds
+                t_dump = time.perf_counter()
+            pickler.dump(ckpt)
+            if timed:
+                # The time spent pickling, not counting the writes it made.
+                pickle_seconds = (
+                    time.perf_counter() - t_dump - (out.seconds - write_seconds)
+                )
+
+            # Now that we know how big the payload is, fill in its size.
+            payload_size = f.tell() - PREAMBLE.size - len(header_bytes)
+            f.seek(0)
+            f.write(PREAMBLE.pack(MAGIC, len(header_bytes), payload_size))
+    except BaseException:
+        # Like an unpicklable local. Don't leave the partial file behind.
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    if should_commit is not None and not should_commit():
+        os.remove(tmp_path)
+        return None
+    os.replace(tmp_path, path)
+
+    if timed:
+        nbytes = PREAMBLE.size + len(header_bytes) + payload_size
+        instrumentation.emit("pickle", pickle_seconds, payload_size, len(ckpt), path)
+        instrumentation.emit(
+            "write", time.perf_counter() - t0 - pickle_seconds, nbytes, 0, path
+        )
+    journal.record_write(path)
+
+    header["payload_size"] = payload_size
+    return header
+
+
+def read_header(path: str) -> Optional[Dict]:
+    """The header of a checkpoint, or None if it was saved without one."""
+    with open(path, "rb") as f:
+        preamble = f.read(PREAMBLE.size)
+        if len(preamble) < PREAMBLE.size:
+            return None
+
+        magic, header_size, payload_size = PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            return None
+
+        header_bytes = f.read(header_size)
+
+    header = pickle.loads(header_bytes)
+    header["payload_size"] = payload_size
+    return header
+
+
+def read_checkpoint(path: str):
+    """Load the snapshot stored in a checkpoint file."""
+    timed = instrumentation.enabled
+    t0 = time.perf_counter()
+
+    with open(path, "rb") as f:
+        preamble = f.read(PREAMBLE.size)
+        if len(preamble) == PREAMBLE.size:
+            magic, header_size, _ = PREAMBLE.unpack(preamble)
+            if magic == MAGIC:
+                f.seek(header_size, os.SEEK_CUR)
+            else:
+                # An old checkpoint without a header.
+                f.seek(0)
+        else:
+            f.seek(0)
+
+        if not timed:
+            return pickle.load(f)
+
+        source = instrumentation.TimedFile(f)
+        t_load = time.perf_counter()
+        ckpt = pickle.load(source)
+        unpickle_seconds = time.perf_counter() - t_load - source.seconds
+        nbytes = f.tell()
+
+    instrumentation.emit(
+        "read", time.perf_counter() - t0 - unpickle_seconds, nbytes, 0, path
+    )
+    instrumentation.emit("unpickle", unpickle_seconds, nbytes, len(ckpt), path)
+    return ckpt
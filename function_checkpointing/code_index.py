@@ -0,0 +1,115 @@
+"""Find the code objects defined in a source file without executing it.
+
+The file is compiled, and the code objects nested in the module's code are
+indexed by their qualified name, the way functions and classes report it in
+`__qualname__`.
+"""
+
+from typing import Dict, Iterator, List, Tuple
+import collections
+import inspect
+import os
+import threading
+import types
+
+_cache_lock = threading.Lock()
+_cache: Dict[str, Tuple[Tuple[int, int], "CodeIndex"]] = {}
+
+# (co_filename, co_firstlineno, co_name) -> qualname of live code objects.
+_qualnames: Dict[Tuple[str, int, str], str] = {}
+
+
+def iter_code(
+    code: types.CodeType, qualname: str = ""
+) -> Iterator[Tuple[str, types.CodeType]]:
+    """Yield (qualname, code) for `code` and every code object nested in it."""
+    yield qualname or code.co_name, code
+
+    if code.co_name == "<module>":
+        prefix = ""
+    elif code.co_flags & inspect.CO_NEWLOCALS:
+        # A function. Its children are its locals.
+        prefix = qualname + ".<locals>."
+    else:
+        # A class body.
+        prefix = qualname + "."
+
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from iter_code(const, prefix + const.co_name)
+
+
+class CodeIndex(object):
+    """The code objects of a source file, by name."""
+
+    def __init__(self, module_code: types.CodeType):
+        self.module_code = module_code
+        self.by_qualname: Dict[str, List[types.CodeType]] = collections.defaultdict(
+            list
+        )
+        self.by_name: Dict[str, List[types.CodeType]] = collections.defaultdict(list)
+        # (co_firstlineno, co_name) -> qualname
+        self.by_location: Dict[Tuple[int, str], str] = {}
+        for qualname, code in iter_code(module_code):
+            self.by_qualname[qualname].append(code)
+            self.by_name[code.co_name].append(code)
+            self.by_location.setdefault((code.co_firstlineno, code.co_name), qualname)
+
+
+def code_index(filename: str) -> CodeIndex:
+    """Index the code objects in a source file.
+
+    The index is cached until the file changes. Raises OSError if the file
+    can't be read and SyntaxError if it doesn't compile.
+    """
+    st = os.stat(filename)
+    version = (st.st_mtime_ns, st.st_size)
+
+    with _cache_lock:
+        cached = _cache.get(filename)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    with open(filename, "rb") as f:
+        source = f.read()
+    index = CodeIndex(compile(source, filename, "exec", dont_inherit=True))
+
+    with _cache_lock:
+        _cache[filename] = (version, index)
+    return index
+
+
+def qualname_at(filename: str, firstlineno: int, name: str) -> str:
+    """The qualified name of the code object called `name` that starts at
+    line firstlineno of filename.
+
+    Looked up in the index of the file, once per code object. Falls back to
+    `name` if the code object can't be found there.
+    """
+    key = (filename, firstlineno, name)
+    try:
+        return _qualnames[key]
+    except KeyError:
+        pass
+
+    try:
+        index = code_index(filename)
+    except (OSError, SyntaxError, ValueError):
+        index = None
+    found = index.by_location.get((firstlineno, name)) if index else None
+
+    _qualnames[key] = found = found or name
+    return found
+
+
+def qualname(code: types.CodeType) -> str:
+    """The qualified name of a live code object, like the __qualname__ of its
+    function.
+
+    Before Python 3.11, code objects don't know their qualified name, so it's
+    looked up in the index of their source file (see qualname_at()).
+    """
+    name = getattr(code, "co_qualname", None)
+    if name is not None:
+        return name
+    return qualname_at(code.co_filename, code.co_firstlineno, code.co_name)
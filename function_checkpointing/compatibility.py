@@ -0,0 +1,98 @@
+"""Decide whether a checkpoint can be restored before loading it.
+
+A checkpoint can only be restored by the same Python bytecode format, and
+onto functions whose bytecode hasn't changed. Checkpoint headers record a
+fingerprint of the interpreter and a hash of each frame's bytecode, so both
+can be checked against the running program without loading the payload.
+"""
+
+from typing import Dict, Optional
+import hashlib
+import importlib.util
+import logging
+import platform
+
+import function_checkpointing.code_index as code_index
+
+log = logging.getLogger(__name__)
+
+
+class IncompatibleCheckpoint(RuntimeError):
+    """The checkpoint can't be restored by the running program.
+
+    `frame` is the header entry of the offending frame, or None if the whole
+    interpreter is incompatible.
+    """
+
+    def __init__(self, message: str, frame: Optional[Dict] = None):
+        super().__init__(message)
+        self.frame = frame
+
+
+def interpreter_fingerprint() -> Dict[str, str]:
+    """Identifies the bytecode format of the running interpreter."""
+    return {
+        "implementation": platform.python_implementation(),
+        "bytecode_magic": importlib.util.MAGIC_NUMBER.hex(),
+    }
+
+
+def code_hash(co_code: bytes) -> str:
+    return hashlib.sha1(co_code).hexdigest()
+
+
+def _live_code_hashes(frame: Dict):
+    """Hashes of the code objects in the current source that frame could be
+    restored onto, or None if the source can't be found."""
+    try:
+        index = code_index.code_index(frame["file"])
+    except (OSError, SyntaxError, ValueError):
+        # ValueError when the source has a null byte.
+        return None
+
+    if "qualname" in frame:
+        codes = index.by_qualname.get(frame["qualname"], ())
+    else:
+        # Headers written before qualified names were recorded.
+        codes = index.by_name.get(frame["function"], ())
+    return {code.co_firstlineno: code_hash(code.co_code) for code in codes}
+
+
+def check(header: Dict):
+    """Raise IncompatibleCheckpoint if the checkpoint with this header can't
+    be restored by the running program.
+
+    Frames whose source file can't be found (like "<stdin>") aren't checked.
+    Headers written before fingerprints were recorded pass.
+    """
+    saved = header.get("interpreter")
+    if saved is not None and saved != interpreter_fingerprint():
+        raise IncompatibleCheckpoint(
+            "Checkpoint was saved by %s (Python %s). Running %s."
+            % (saved, header["python_version"], interpreter_fingerprint())
+        )
+
+    for frame in header["frames"]:
+        if "code_hash" not in frame:
+            continue
+
+        live = _live_code_hashes(frame)
+        if live is None:
+            log.debug("Can't find the source of %s to check it", frame)
+            continue
+
+        if live.get(frame["first_line"]) == frame["code_hash"]:
+            continue
+        # The function may have just moved around in the file.
+        if frame["code_hash"] in live.values():
+            continue
+
+        raise IncompatibleCheckpoint(
+            "The code of %s (%s:%d) has changed since the checkpoint was saved."
+            % (
+                frame.get("qualname", frame["function"]),
+                frame["file"],
+                frame["first_line"],
+            ),
+            frame,
+        )
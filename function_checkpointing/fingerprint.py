@@ -0,0 +1,131 @@
+"""Deterministic fingerprints of code, to tell when a function was edited.
+
+The call log records a fingerprint of each function it sees, and
+resume_from_last_unchanged_checkpoint() compares them against the current
+source. A fingerprint must change when the function is edited, and only
+then. So it covers the bytecode, the constants, and the names the code uses,
+and walks into the code of nested functions, lambdas and comprehensions. It
+leaves out what changes from one run to the next without an edit: memory
+addresses, the iteration order of frozensets of strings (which depends on
+the hash seed), and line numbers, so that moving a function around a file
+doesn't invalidate checkpoints.
+"""
+
+from typing import Callable, Set
+import hashlib
+import re
+import types
+import weakref
+
+_ADDRESS = re.compile(r" at 0x[0-9a-fA-F]+")
+
+# Code objects and their fingerprints. Functions are fingerprinted on every
+# traced call, and their code rarely changes.
+_cache = weakref.WeakKeyDictionary()
+
+
+def _update_const(h, const):
+    h.update(type(const).__name__.encode("utf-8"))
+    if isinstance(const, types.CodeType):
+        h.update(hash_code(const))
+    elif isinstance(const, tuple):
+        h.update(b"(%d" % len(const))
+        for c in const:
+            _update_const(h, c)
+        h.update(b")")
+    elif isinstance(const, frozenset):
+        # The order of a set of strings changes with the hash seed.
+        members = sorted(_stable_repr(c) for c in const)
+        h.update(repr(members).encode("utf-8"))
+    else:
+        h.update(_stable_repr(const).encode("utf-8"))
+
+
+def _stable_repr(obj) -> str:
+    return _ADDRESS.sub("", repr(obj))
+
+
+def _update_names(h, names):
+    h.update(b"[")
+    h.update("\0".join(names).encode("utf-8"))
+    h.update(b"]")
+
+
+def hash_code(code: types.CodeType) -> bytes:
+    """A sha1 digest of code and of the code it defines, which only changes
+    when the source of the function changes."""
+    try:
+        return _cache[code]
+    except (KeyError, TypeError):
+        pass
+
+    h = hashlib.sha1(code.co_code)
+    h.update(code.co_name.encode("utf-8"))
+    h.update(b"%d,%d,%d" % (code.co_argcount, code.co_kwonlyargcount, code.co_flags))
+    for names in (code.co_names, code.co_varnames, code.co_freevars, code.co_cellvars):
+        _update_names(h, names)
+    _update_const(h, code.co_consts)
+
+    digest = h.digest()
+    try:
+        _cache[code] = digest
+    except TypeError:
+        pass
+    return digest
+
+
+def _update_global(h, value, seen: Set[int]):
+    if isinstance(value, types.FunctionType):
+        h.update(_hash_function(value, True, False, seen))
+    elif isinstance(value, types.ModuleType):
+        h.update(("module " + value.__name__).encode("utf-8"))
+    elif isinstance(value, (type, types.BuiltinFunctionType)):
+        h.update(("%s.%s" % (value.__module__, value.__qualname__)).encode("utf-8"))
+    else:
+        _update_const(h, value)
+
+
+def _hash_function(
+    func: Callable, include_globals: bool, include_defaults: bool, seen: Set[int]
+) -> bytes:
+    h = hashlib.sha1(hash_code(func.__code__))
+    if id(func) in seen:
+        # Recursion through globals. The code hash is enough.
+        return h.digest()
+    seen.add(id(func))
+
+    if include_defaults:
+        _update_const(h, func.__defaults__)
+        _update_const(h, sorted((func.__kwdefaults__ or {}).items()))
+
+    if include_globals:
+        for name in sorted(_global_names(func.__code__)):
+            if name in func.__globals__:
+                h.update(name.encode("utf-8"))
+                _update_global(h, func.__globals__[name], seen)
+
+    return h.digest()
+
+
+def _global_names(code: types.CodeType) -> Set[str]:
+    """The names code and the code it defines might look up in its globals."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _global_names(const)
+    return names
+
+
+def hash_function(
+    func: Callable, include_globals: bool = False, include_defaults: bool = False
+) -> bytes:
+    """Like hash_code(func.__code__), optionally also covering the default
+    values of func's arguments, and the module-level values its code refers
+    to.
+
+    Functions among those globals are hashed recursively. Classes, modules
+    and builtins are identified by name, and other values by their repr, so
+    globals whose repr includes state that changes from run to run make the
+    hash unstable.
+    """
+    return _hash_function(func, include_globals, include_defaults, set())
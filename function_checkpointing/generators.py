@@ -0,0 +1,117 @@
+"""Support for generator and coroutine frames in a snapshot.
+
+When a checkpoint is taken inside a generator, the generator's frame is part
+of the chain of frames that save_jump() walks, and the generator object
+itself sits on its caller's stack, as the iterator of a for loop, the
+receiver of a `yield from` or an `await`, or the argument of next() or
+send(). Generator objects can't be saved, so save_jump() replaces the
+running ones with a placeholder that records their code. jump() replaces the
+placeholder with a fresh generator of the same code, and the frame evaluator
+then restores the fresh generator's frame like any other frame when its
+caller resumes it.
+
+Coroutines are supported the same way, as long as they're driven from Python
+code (like coro.send(None)). The frames of an asyncio event loop can't be
+restored, because asyncio's tasks resume coroutines from C. See
+async_checkpoint.py for checkpoints that stop at the task's coroutine.
+"""
+
+from typing import Dict, List
+import collections
+import marshal
+import sys
+import types
+
+# Stands in for a running generator or coroutine in a snapshot. `code` is
+# the marshaled code object of the generator function.
+SuspendedGenerator = collections.namedtuple(
+    "SuspendedGenerator", ("code", "module", "name", "qualname")
+)
+
+
+def _is_running(obj) -> bool:
+    if isinstance(obj, types.GeneratorType):
+        return obj.gi_running
+    if isinstance(obj, types.CoroutineType):
+        return obj.cr_running
+    return False
+
+
+def _placeholder(gen) -> SuspendedGenerator:
+    frame = gen.gi_frame if isinstance(gen, types.GeneratorType) else gen.cr_frame
+    return SuspendedGenerator(
+        marshal.dumps(frame.f_code),
+        frame.f_globals["__name__"],
+        gen.__name__,
+        gen.__qualname__,
+    )
+
+
+def strip(saved_stack: List):
+    """Replace the running generators in a snapshot with placeholders, in
+    place."""
+    placeholders: Dict[int, SuspendedGenerator] = {}
+
+    for saved_frame in saved_stack:
+        content = saved_frame.stack_content
+        for slot, obj in enumerate(content):
+            if not _is_running(obj):
+                continue
+            if id(obj) not in placeholders:
+                placeholders[id(obj)] = _placeholder(obj)
+            content[slot] = placeholders[id(obj)]
+
+
+def _empty_cell():
+    value = None
+    cell = (lambda: value).__closure__[0]
+    del value
+    return cell
+
+
+def _recreate(placeholder: SuspendedGenerator):
+    """A generator of the same code as the one placeholder stands for.
+
+    Its arguments are all None. That doesn't matter, because its frame gets
+    overwritten when it's restored.
+    """
+    code = marshal.loads(placeholder.code)
+    func = types.FunctionType(
+        code,
+        sys.modules[placeholder.module].__dict__,
+        placeholder.name,
+        None,
+        tuple(_empty_cell() for _ in code.co_freevars) or None,
+    )
+    func.__qualname__ = placeholder.qualname
+
+    kwonly = code.co_varnames[
+        code.co_argcount : code.co_argcount + code.co_kwonlyargcount
+    ]
+    return func(*[None] * code.co_argcount, **{name: None for name in kwonly})
+
+
+def recreate(saved_stack: List) -> List:
+    """A copy of a snapshot with its placeholders replaced by fresh
+    generators.
+
+    The snapshot itself isn't modified, so it can be restored again.
+    """
+    recreated: Dict[int, object] = {}
+    result = []
+
+    for saved_frame in saved_stack:
+        if not any(type(o) is SuspendedGenerator for o in saved_frame.stack_content):
+            result.append(saved_frame)
+            continue
+
+        content = []
+        for o in saved_frame.stack_content:
+            if type(o) is SuspendedGenerator:
+                if id(o) not in recreated:
+                    recreated[id(o)] = _recreate(o)
+                o = recreated[id(o)]
+            content.append(o)
+        result.append(saved_frame._replace(stack_content=content))
+
+    return result
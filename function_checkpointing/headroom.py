@@ -0,0 +1,96 @@
+"""Check that there's room on the stack to restore a snapshot.
+
+jump() rebuilds the call stack by nesting one evaluation of each saved frame
+inside the next, so restoring a snapshot of a deep recursion takes as much
+Python recursion depth, and a bit more C stack, than the recursion took in
+the first place. The program that resumes may not have raised its limits yet
+when it calls jump(), and running out halfway through a restore either
+raises a confusing RecursionError deep inside the restored code or crashes
+the interpreter. check() fails early instead, with a message that says what
+limit to raise.
+"""
+
+from typing import Optional
+import sys
+import threading
+
+try:
+    import resource
+except ImportError:
+    # Windows doesn't have it.
+    resource = None
+
+# The C stack used by each restored frame: the frame evaluator, the call
+# machinery, and jump()'s own frame evaluation hook. A release build of
+# CPython 3.7 on x86-64 measures about 560 bytes; this leaves a small margin.
+# Debug builds, other compilers and sanitizers use several times that, see
+# set_c_stack_bytes_per_frame().
+C_STACK_BYTES_PER_FRAME = 600
+
+# Python calls made while restoring, like unpickling and logging.
+RECURSION_MARGIN = 50
+
+
+def set_c_stack_bytes_per_frame(nbytes: int):
+    """Set how much C stack check() expects each restored frame to use.
+
+    Raise it for interpreters whose frames are bigger than a release build's,
+    which crash in the middle of restores that check() let through.
+    """
+    global C_STACK_BYTES_PER_FRAME
+    if nbytes < 1:
+        raise ValueError("nbytes must be at least 1")
+    C_STACK_BYTES_PER_FRAME = nbytes
+
+
+def c_stack_limit() -> Optional[int]:
+    """The size of the current thread's C stack, or None if it's unbounded or
+    unknown."""
+    if threading.current_thread() is not threading.main_thread():
+        # Without an argument, stack_size() also resets the size for new
+        # threads to the default.
+        size = threading.stack_size()
+        threading.stack_size(size)
+        if size:
+            return size
+        # Threads get the platform's default size, which on Linux is the
+        # stack limit of the process.
+
+    if resource is None:
+        return None
+    soft, _ = resource.getrlimit(resource.RLIMIT_STACK)
+    if soft == resource.RLIM_INFINITY:
+        return None
+    return soft
+
+
+def check(frames: int, current_depth: int):
+    """Raise RecursionError if restoring `frames` frames on top of the
+    `current_depth` frames already on the stack would exceed the recursion
+    limit or the C stack."""
+    needed = current_depth + frames + RECURSION_MARGIN
+    limit = sys.getrecursionlimit()
+    if needed > limit:
+        raise RecursionError(
+            "Restoring this checkpoint nests %d frames on top of the %d already "
+            "on the stack, past the recursion limit of %d. Call "
+            "sys.setrecursionlimit(%d) before resuming."
+            % (frames, current_depth, limit, needed)
+        )
+
+    c_stack = c_stack_limit()
+    c_needed = (current_depth + frames) * C_STACK_BYTES_PER_FRAME
+    if c_stack is not None and c_needed > c_stack:
+        raise RecursionError(
+            "Restoring this checkpoint of %d frames needs about %.1f MiB of C "
+            "stack, but the stack is limited to %.1f MiB. Raise the limit (like "
+            "with `ulimit -s %d`), or resume in a thread started after "
+            "threading.stack_size(%d)."
+            % (
+                frames,
+                c_needed / (1 << 20),
+                c_stack / (1 << 20),
+                2 * c_needed >> 10,
+                2 * c_needed,
+            )
+        )
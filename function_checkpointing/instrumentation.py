@@ -0,0 +1,138 @@
+"""Measure where the time of saving and restoring checkpoints goes.
+
+Register a sink to receive a Measurement for each phase of each save and
+restore:
+
+    counters = ckpt.Counters()
+    ckpt.add_instrumentation_sink(counters)
+    ...
+    export_to_metrics(counters.totals())
+
+The phases are:
+
+    analyze       save_jump() disassembling the call site of each frame
+    copy          save_jump() copying the frames' stacks
+    pickle        pickling a snapshot
+    write         writing a checkpoint file, not counting pickling
+    fsync         flushing a file to disk, for writers that do
+    read          reading a checkpoint file, not counting unpickling
+    unpickle      unpickling a snapshot
+    fast_forward  jump() restoring frames, until the innermost one resumes
+
+Measurements are only taken while a sink is registered. Otherwise the hot
+paths only test the `enabled` flag.
+"""
+
+from typing import Callable, Dict, List
+import collections
+import threading
+import time
+
+Measurement = collections.namedtuple(
+    "Measurement", ("phase", "seconds", "nbytes", "frames", "checkpoint")
+)
+Measurement.__new__.__defaults__ = (0, 0, None)
+
+PHASES = (
+    "analyze",
+    "copy",
+    "pickle",
+    "write",
+    "fsync",
+    "read",
+    "unpickle",
+    "fast_forward",
+)
+
+# True when at least one sink is registered.
+enabled = False
+_sinks: List[Callable[[Measurement], None]] = []
+
+
+def add_instrumentation_sink(sink: Callable[[Measurement], None]):
+    """Call sink with every Measurement from now on.
+
+    Sinks are called from the thread that's saving or restoring, sometimes in
+    the middle of a restore, so they should be quick and must not raise.
+    """
+    global enabled
+    _sinks.append(sink)
+    enabled = True
+
+
+def remove_instrumentation_sink(sink: Callable[[Measurement], None]):
+    global enabled
+    _sinks.remove(sink)
+    enabled = bool(_sinks)
+
+
+def emit(
+    phase: str, seconds: float, nbytes: int = 0, frames: int = 0, checkpoint=None
+):
+    measurement = Measurement(phase, seconds, nbytes, frames, checkpoint)
+    for sink in list(_sinks):
+        sink(measurement)
+
+
+class Counters(object):
+    """A sink that totals the measurements of each phase."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __call__(self, m: Measurement):
+        with self._lock:
+            total = self._totals[m.phase]
+            total["count"] += 1
+            total["seconds"] += m.seconds
+            total["nbytes"] += m.nbytes
+            total["frames"] += m.frames
+
+    def reset(self):
+        with self._lock:
+            self._totals = collections.defaultdict(
+                lambda: {"count": 0, "seconds": 0.0, "nbytes": 0, "frames": 0}
+            )
+
+    def totals(self) -> Dict[str, Dict]:
+        """phase -> {"count", "seconds", "nbytes", "frames"}."""
+        with self._lock:
+            return {phase: dict(total) for phase, total in self._totals.items()}
+
+
+class TimedFile(object):
+    """Wraps a binary file to time the calls to its I/O methods, so that
+    pickling and unpickling can be told apart from the I/O they do."""
+
+    def __init__(self, f):
+        self._f = f
+        self.seconds = 0.0
+
+    def write(self, b):
+        t0 = time.perf_counter()
+        try:
+            return self._f.write(b)
+        finally:
+            self.seconds += time.perf_counter() - t0
+
+    def read(self, *args):
+        t0 = time.perf_counter()
+        try:
+            return self._f.read(*args)
+        finally:
+            self.seconds += time.perf_counter() - t0
+
+    def readinto(self, b):
+        t0 = time.perf_counter()
+        try:
+            return self._f.readinto(b)
+        finally:
+            self.seconds += time.perf_counter() - t0
+
+    def readline(self, *args):
+        t0 = time.perf_counter()
+        try:
+            return self._f.readline(*args)
+        finally:
+            self.seconds += time.perf_counter() - t0
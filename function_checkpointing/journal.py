@@ -0,0 +1,406 @@
+"""Crash-consistent checkpoints without an fsync per checkpoint.
+
+Checkpoint files and call logs are written with a rename, but never flushed
+to disk, so a power loss or a kernel crash can leave them empty or
+truncated. Flushing each of them would make frequent checkpoints slow. In
+journal mode, every file written to the checkpoint directory is also
+appended to a journal, and one fsync of the journal covers a whole batch of
+checkpoints:
+
+    ckpt.enable_journal(max_batch=64, max_delay=0.1)
+
+The journal is flushed when `max_batch` files are waiting, or `max_delay`
+seconds after the first of them was written, whichever comes first, so a
+crash loses at most that many checkpoints.
+
+The price is write bandwidth: every journaled file is written twice, once to
+its own file and once into the journal, so a multi-GB checkpoint costs twice
+its size in disk writes. The single fsync per batch pays off for frequent,
+small checkpoints; for a few large ones, flushing each file is cheaper.
+
+A journal starts by vouching for the files already in the directory, which
+are flushed first. When it grows past `max_bytes`, it's replaced by a new
+one that vouches for all the files, which flushes each of them once.
+
+enable_journal() first recovers the journal left by the previous run: the
+records up to the last valid one are written back to their files, which are
+flushed. Then every file the journal doesn't vouch for or hold is deleted:
+it was written after the last flush of the journal, and may be torn. Call it
+before resuming.
+
+A record is laid out as
+
+    magic (4 bytes) | kind (u8) | name size (u32) | data size (u64) |
+    name | data | crc32 of name and data (u32)
+
+where kind says whether the record holds the content of a file, the fact
+that it was deleted, or the identity of a flushed file the journal vouches
+for. Records are streamed, so large checkpoints aren't held in memory.
+"""
+
+from typing import Dict, Iterator, Optional, Set, Tuple
+import io
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+import function_checkpointing.instrumentation as instrumentation
+
+log = logging.getLogger(__name__)
+
+RECORD_MAGIC = b"FCJ\x01"
+RECORD = struct.Struct("<4sBIQ")
+CRC = struct.Struct("<I")
+WRITE = 1
+DELETE = 2
+KEEP = 3
+# The data of a KEEP record: the inode, size, and modification time of the
+# file when it was flushed. A file replaced since then doesn't match.
+IDENTITY = struct.Struct("<QQQ")
+
+# Checkpoint names can't start with ".", so temporary files are "." + name.
+# Starting with ".." keeps the journal clear of them.
+JOURNAL_NAME = "..journal"
+
+_fsync = getattr(os, "fdatasync", os.fsync)
+
+_CHUNK_SIZE = 1 << 20
+
+
+def _sync_directory(directory: str):
+    """Make the renames and deletions in directory durable."""
+    if not hasattr(os, "O_DIRECTORY"):
+        # Windows can't open directories.
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_all(fd: int, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view) :]
+
+
+def write_record(fd: int, kind: int, name: str, source=None, data_size: int = 0):
+    """Append a record to the journal open as fd. Its data is read from the
+    binary file `source`, which holds data_size bytes."""
+    name_bytes = name.encode("utf-8")
+    _write_all(fd, RECORD.pack(RECORD_MAGIC, kind, len(name_bytes), data_size))
+    _write_all(fd, name_bytes)
+    crc = zlib.crc32(name_bytes)
+    remaining = data_size
+    while remaining:
+        chunk = source.read(min(remaining, _CHUNK_SIZE))
+        if not chunk:
+            raise IOError("%s shrank while it was being journaled" % name)
+        _write_all(fd, chunk)
+        crc = zlib.crc32(chunk, crc)
+        remaining -= len(chunk)
+    _write_all(fd, CRC.pack(crc))
+
+
+def read_records(f) -> Iterator[Tuple[int, str, int, int]]:
+    """Yield the (kind, name, data offset, data size) of the records of the
+    journal open as the binary file f, up to the first one that's torn or
+    corrupt."""
+    while True:
+        head = f.read(RECORD.size)
+        if len(head) < RECORD.size:
+            return
+        magic, kind, name_size, data_size = RECORD.unpack(head)
+        if magic != RECORD_MAGIC or kind not in (WRITE, DELETE, KEEP):
+            return
+        name_bytes = f.read(name_size)
+        if len(name_bytes) < name_size:
+            return
+
+        offset = f.tell()
+        crc = zlib.crc32(name_bytes)
+        remaining = data_size
+        while remaining:
+            chunk = f.read(min(remaining, _CHUNK_SIZE))
+            if not chunk:
+                return
+            crc = zlib.crc32(chunk, crc)
+            remaining -= len(chunk)
+
+        trailer = f.read(CRC.size)
+        if len(trailer) < CRC.size or CRC.unpack(trailer)[0] != crc:
+            return
+        yield kind, name_bytes.decode("utf-8"), offset, data_size
+
+
+def _identity(st: os.stat_result) -> bytes:
+    return IDENTITY.pack(st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _restore_file(path: str, journal, offset: int, size: int):
+    """Durably write the `size` bytes at `offset` in the journal to path."""
+    journal.seek(offset)
+    tmp_path = os.path.join(os.path.dirname(path), "." + os.path.basename(path))
+    with open(tmp_path, "wb") as f:
+        remaining = size
+        while remaining:
+            chunk = journal.read(min(remaining, _CHUNK_SIZE))
+            f.write(chunk)
+            remaining -= len(chunk)
+        f.flush()
+        _fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def recover(checkpoint_dir: str) -> int:
+    """Write the records of the journal in checkpoint_dir back to their files,
+    delete the files it doesn't cover, and delete the journal. Returns the
+    number of files restored or deleted.
+    """
+    journal_path = os.path.join(checkpoint_dir, JOURNAL_NAME)
+    if not os.path.exists(journal_path):
+        return 0
+
+    changed = 0
+    with open(journal_path, "rb") as journal:
+        # The last record of each file wins. name -> (kind, offset, size).
+        final: Dict[str, Tuple[int, int, int]] = {}
+        for kind, name, offset, size in read_records(journal):
+            final[name] = (kind, offset, size)
+
+        for name, (kind, offset, size) in final.items():
+            if kind == WRITE:
+                _restore_file(os.path.join(checkpoint_dir, name), journal, offset, size)
+                changed += 1
+
+        for entry in os.scandir(checkpoint_dir):
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            kind, offset, size = final.get(entry.name, (DELETE, 0, 0))
+            if kind == WRITE:
+                continue
+            if kind == KEEP:
+                journal.seek(offset)
+                if journal.read(size) == _identity(entry.stat()):
+                    continue
+            # Written or replaced after the journal was last flushed.
+            os.unlink(entry.path)
+            changed += 1
+    _sync_directory(checkpoint_dir)
+
+    os.unlink(journal_path)
+    _sync_directory(checkpoint_dir)
+    if changed:
+        log.info("Recovered %d files from the journal", changed)
+    return changed
+
+
+class Journal(object):
+    """The journal of a checkpoint directory. See enable_journal()."""
+
+    def __init__(
+        self, checkpoint_dir: str, max_batch: int, max_delay: float, max_bytes: int
+    ):
+        self.checkpoint_dir = checkpoint_dir
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_bytes = max_bytes
+        self.path = os.path.join(checkpoint_dir, JOURNAL_NAME)
+
+        self._lock = threading.Lock()
+        self._fd = -1
+        self._size = 0
+        # Files written since the journal was last flushed, and when the
+        # first of them was.
+        self._unsynced = 0
+        self._unsynced_bytes = 0
+        self._first_unsynced = 0.0
+        # Files the journal holds, which must be flushed before it's deleted.
+        self._journaled: Set[str] = set()
+        self._start_over()
+
+        self._wakeup = threading.Condition(self._lock)
+        self._closed = False
+        self._flusher = threading.Thread(
+            target=self._flush_forever, name="checkpoint-journal", daemon=True
+        )
+        self._flusher.start()
+
+    def append(self, kind: int, path: str):
+        """Journal the content of the file at path, or its deletion."""
+        name = os.path.basename(path)
+        source = open(path, "rb") if kind == WRITE else None
+        try:
+            data_size = os.fstat(source.fileno()).st_size if source else 0
+            with self._lock:
+                if self._closed:
+                    return
+                start = self._size
+                try:
+                    write_record(self._fd, kind, name, source, data_size)
+                except BaseException:
+                    # A torn record would hide the records appended after it.
+                    os.ftruncate(self._fd, start)
+                    raise
+                self._size = os.fstat(self._fd).st_size
+                self._record_appended(name if source else None, self._size - start)
+        finally:
+            if source:
+                source.close()
+
+    def _record_appended(self, written_name: Optional[str], nbytes: int):
+        """Flush or replace the journal if it's time. Called with the lock
+        held."""
+        if written_name:
+            self._journaled.add(written_name)
+        if not self._unsynced:
+            self._first_unsynced = time.monotonic()
+            self._wakeup.notify()
+        self._unsynced += 1
+        self._unsynced_bytes += nbytes
+
+        if self._size >= self.max_bytes:
+            self._start_over()
+        elif self._unsynced >= self.max_batch:
+            self._sync()
+
+    def _sync(self):
+        """Flush the journal. Called with the lock held."""
+        t0 = time.perf_counter()
+        _fsync(self._fd)
+        if instrumentation.enabled:
+            instrumentation.emit(
+                "fsync",
+                time.perf_counter() - t0,
+                self._unsynced_bytes,
+                0,
+                self.checkpoint_dir,
+            )
+        self._unsynced = 0
+        self._unsynced_bytes = 0
+
+    def _start_over(self):
+        """Flush every file in the directory, and replace the journal with one
+        that vouches for them. Called with the lock held."""
+        tmp_path = self.path + ".new"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND)
+        try:
+            for entry in os.scandir(self.checkpoint_dir):
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                try:
+                    with open(entry.path, "rb") as f:
+                        _fsync(f.fileno())
+                        identity = _identity(os.fstat(f.fileno()))
+                except FileNotFoundError:
+                    continue
+                write_record(
+                    fd, KEEP, entry.name, io.BytesIO(identity), len(identity)
+                )
+            _fsync(fd)
+        except BaseException:
+            os.close(fd)
+            os.unlink(tmp_path)
+            raise
+        # The files are flushed, and the renames that put them in place too.
+        os.replace(tmp_path, self.path)
+        _sync_directory(self.checkpoint_dir)
+
+        if self._fd >= 0:
+            os.close(self._fd)
+        self._fd = fd
+        self._size = os.fstat(fd).st_size
+        self._unsynced = 0
+        self._unsynced_bytes = 0
+        self._journaled.clear()
+
+    def _flush_forever(self):
+        with self._lock:
+            while not self._closed:
+                if not self._unsynced:
+                    self._wakeup.wait()
+                    continue
+                remaining = self._first_unsynced + self.max_delay - time.monotonic()
+                if remaining > 0:
+                    self._wakeup.wait(remaining)
+                    continue
+                self._sync()
+
+    def close(self):
+        """Flush the files the journal holds, delete it, and stop journaling."""
+        with self._lock:
+            if self._closed:
+                return
+            for name in self._journaled:
+                try:
+                    with open(os.path.join(self.checkpoint_dir, name), "rb") as f:
+                        _fsync(f.fileno())
+                except FileNotFoundError:
+                    # Deleted since.
+                    pass
+            _sync_directory(self.checkpoint_dir)
+
+            self._closed = True
+            self._wakeup.notify()
+            os.close(self._fd)
+            os.unlink(self.path)
+            _sync_directory(self.checkpoint_dir)
+        self._flusher.join()
+
+
+# Absolute path of a checkpoint directory -> its journal.
+_journals: Dict[str, Journal] = {}
+_journals_lock = threading.Lock()
+
+
+def enable_journal(
+    checkpoint_dir: str = "__checkpoints__",
+    max_batch: int = 64,
+    max_delay: float = 0.1,
+    max_bytes: int = 1 << 30,
+) -> int:
+    """Journal the checkpoints and call logs written to checkpoint_dir, after
+    recovering the journal of the previous run. Returns the number of files
+    recovered."""
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    key = os.path.abspath(checkpoint_dir)
+    with _journals_lock:
+        if key in _journals:
+            return 0
+        recovered = recover(checkpoint_dir)
+        _journals[key] = Journal(checkpoint_dir, max_batch, max_delay, max_bytes)
+    return recovered
+
+
+def disable_journal(checkpoint_dir: str = "__checkpoints__"):
+    """Flush the files journaled in checkpoint_dir, and stop journaling."""
+    with _journals_lock:
+        journal = _journals.pop(os.path.abspath(checkpoint_dir), None)
+    if journal:
+        journal.close()
+
+
+def _journal_of(path: str) -> Optional[Journal]:
+    if not _journals:
+        return None
+    return _journals.get(os.path.abspath(os.path.dirname(path)))
+
+
+def record_write(path: str):
+    """Journal a file that was just written, if its directory is journaled."""
+    journal = _journal_of(path)
+    if journal:
+        journal.append(WRITE, path)
+
+
+def remove(path: str):
+    """Delete a file, journaling the deletion if its directory is journaled,
+    so that recovery doesn't bring it back."""
+    journal = _journal_of(path)
+    if journal:
+        journal.append(DELETE, path)
+    os.unlink(path)
@@ -0,0 +1,226 @@
+"""Cache the results of expensive functions on disk, across runs.
+
+    @ckpt.memoize
+    def featurize(path, scale=1.0):
+        ...
+
+A call to a memoized function looks its arguments up in a cache directory
+before running it. Entries are keyed by a fingerprint of the function's code
+(see fingerprint.py) and a hash of the arguments, so editing the function
+makes its old entries unreachable. With @memoize(include_callees=True), the
+fingerprint also covers the functions and values the function refers to
+through its globals. After a bug fix and a resume, the stages that the
+resumed code calls again with the same arguments return their cached result
+instead of recomputing it.
+
+Entries are pickled results. The cache is capped in size, and the least
+recently used entries are evicted first. Like a checkpoint directory, the
+cache directory can be journaled with enable_journal(cache_dir).
+"""
+
+from typing import Callable, Dict, Optional
+import functools
+import hashlib
+import logging
+import os
+import pickle
+import struct
+import tempfile
+import threading
+
+import function_checkpointing.fingerprint as fingerprint
+import function_checkpointing.journal as journal
+
+log = logging.getLogger(__name__)
+
+cache_dir = "__memoized__"
+max_bytes: Optional[int] = 1 << 30
+
+_evict_lock = threading.Lock()
+# Cache directory -> the total size of its entries, once it's been measured.
+# Other processes sharing the directory make it drift, until the next
+# eviction measures it again.
+_cache_sizes: Dict[str, int] = {}
+
+
+def set_memoize_cache(
+    max_size: Optional[int] = 1 << 30, directory: str = "__memoized__"
+):
+    """Store memoized results in `directory`, and cap their total size to
+    `max_size` bytes. None means no cap."""
+    global cache_dir, max_bytes
+    cache_dir = directory
+    max_bytes = max_size
+
+
+def _update_value(h, value):
+    """Hash value so that equal arguments hash the same in every run."""
+    h.update(type(value).__qualname__.encode("utf-8"))
+    if value is None or isinstance(value, (bool, int, float, complex)):
+        h.update(repr(value).encode("utf-8"))
+    elif isinstance(value, str):
+        h.update(struct.pack("<Q", len(value)))
+        h.update(value.encode("utf-8", "surrogatepass"))
+    elif isinstance(value, (bytes, bytearray)):
+        h.update(struct.pack("<Q", len(value)))
+        h.update(value)
+    elif isinstance(value, (tuple, list)):
+        h.update(struct.pack("<Q", len(value)))
+        for v in value:
+            _update_value(h, v)
+    elif isinstance(value, dict):
+        # Insertion order doesn't make dicts different.
+        items = sorted(
+            ((_value_hash(k), v) for k, v in value.items()), key=lambda kv: kv[0]
+        )
+        h.update(struct.pack("<Q", len(items)))
+        for k_hash, v in items:
+            h.update(k_hash)
+            _update_value(h, v)
+    elif isinstance(value, (set, frozenset)):
+        # The iteration order of sets changes with the hash seed.
+        h.update(struct.pack("<Q", len(value)))
+        for v_hash in sorted(_value_hash(v) for v in value):
+            h.update(v_hash)
+    elif hasattr(value, "tobytes") and hasattr(value, "dtype"):
+        # Arrays, without importing numpy.
+        h.update(str(value.dtype).encode("utf-8"))
+        h.update(repr(getattr(value, "shape", None)).encode("utf-8"))
+        h.update(value.tobytes())
+    else:
+        h.update(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+def _value_hash(value) -> bytes:
+    h = hashlib.sha1()
+    _update_value(h, value)
+    return h.digest()
+
+
+def _evict(directory: str, limit: int) -> int:
+    """Delete the least recently used entries until the cache fits in limit.
+    Returns the size of the entries left."""
+    entries = []
+    total = 0
+    for entry in os.scandir(directory):
+        if entry.name.startswith(".") or not entry.is_file():
+            continue
+        st = entry.stat()
+        entries.append((st.st_mtime, st.st_size, entry.path))
+        total += st.st_size
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= limit:
+            break
+        try:
+            journal.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+    return total
+
+
+def _grew(directory: str, nbytes: int, limit: int):
+    """Account for nbytes more in the cache, and evict entries if it no
+    longer fits in limit."""
+    with _evict_lock:
+        total = _cache_sizes.get(directory)
+        if total is not None:
+            total += nbytes
+        if total is None or total > limit:
+            total = _evict(directory, limit)
+        _cache_sizes[directory] = total
+
+
+def _load(path: str):
+    """The cached result at path. Raises KeyError on a miss."""
+    try:
+        with open(path, "rb") as f:
+            result = pickle.load(f)
+    except FileNotFoundError:
+        raise KeyError(path)
+    except (EOFError, pickle.UnpicklingError) as e:
+        log.warning("Discarding corrupt memoized result %s: %s", path, e)
+        try:
+            journal.remove(path)
+        except FileNotFoundError:
+            pass
+        raise KeyError(path)
+
+    # Mark the entry as recently used.
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return result
+
+
+def _store(path: str, result):
+    try:
+        data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        log.warning("Can't memoize the result in %s: %s", path, e)
+        return
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Concurrent writers of the same entry each use their own temporary file.
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    try:
+        replaced = os.path.getsize(path)
+    except FileNotFoundError:
+        replaced = 0
+    os.replace(tmp_path, path)
+    journal.record_write(path)
+
+    if max_bytes is not None:
+        _grew(directory, len(data) - replaced, max_bytes)
+
+
+def memoize(func: Callable = None, include_callees: bool = False):
+    """Decorate a function to cache its results on disk.
+
+    The function's arguments and result must be picklable, and its result
+    must only depend on its arguments and its code. Unless include_callees
+    is True, editing a function it calls doesn't invalidate its cached
+    results.
+    """
+    if func is None:
+        return functools.partial(memoize, include_callees=include_callees)
+
+    name = "%s.%s" % (func.__module__, func.__qualname__)
+    code_hash = None
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        nonlocal code_hash
+        if include_callees:
+            # The callees can be redefined between calls.
+            code_hash = fingerprint.hash_function(
+                func, include_globals=True, include_defaults=True
+            )
+        elif code_hash is None:
+            code_hash = fingerprint.hash_function(func, include_defaults=True)
+
+        h = hashlib.sha1(name.encode("utf-8"))
+        h.update(code_hash)
+        try:
+            _update_value(h, (args, kwargs))
+        except Exception as e:
+            log.warning("Not memoizing a call to %s: %s", name, e)
+            return func(*args, **kwargs)
+        path = os.path.join(cache_dir, h.hexdigest())
+
+        try:
+            return _load(path)
+        except KeyError:
+            pass
+
+        result = func(*args, **kwargs)
+        _store(path, result)
+        return result
+
+    return wrapper
@@ -0,0 +1,138 @@
+"""Suggest where to call save_checkpoint, from the call tracer's statistics.
+
+When the tracer collects statistics (start_call_tracing(..., collect_stats=
+True)), each call log also records how many times each traced function was
+called, the wall time spent in it, and what the checkpoint that closed the
+interval cost. Call logs are written as two pickles: the map of functions to
+code hashes that _change_point() reads, followed by these statistics.
+
+The report compares checkpointing after every call of each function against
+the current placement. Checkpointing every T seconds at a cost of C seconds
+per checkpoint wastes roughly
+
+    C / T + T / (2 * MTBF)
+
+of the run time: the first term is the checkpoints themselves, and the second
+is the work lost to a failure, which on average strikes halfway between two
+checkpoints. The waste is lowest for T = sqrt(2 * C * MTBF) (Young's
+formula), so functions whose calls take about that long are the best places
+to checkpoint.
+"""
+
+from typing import Dict, List, Optional
+import collections
+import glob
+import math
+import os
+import pickle
+
+FunctionStats = collections.namedtuple(
+    "FunctionStats",
+    ("filename", "qualname", "first_line", "calls", "seconds", "mean_seconds", "waste"),
+)
+
+
+def read_call_stats(path: str) -> Optional[Dict]:
+    """The statistics stored in a call log, or None if it has none."""
+    with open(path, "rb") as f:
+        pickle.load(f)
+        try:
+            return pickle.load(f)
+        except EOFError:
+            return None
+
+
+def waste(interval: float, checkpoint_seconds: float, mtbf: float) -> float:
+    """The fraction of run time lost to checkpoints and failures when
+    checkpointing every `interval` seconds."""
+    if interval <= 0:
+        return math.inf
+    return checkpoint_seconds / interval + interval / (2 * mtbf)
+
+
+class PlacementReport(object):
+    """Statistics aggregated over the call logs of a checkpoint directory.
+
+    `functions` is sorted by the waste of checkpointing after every call of
+    the function, best first.
+    """
+
+    def __init__(self, stats: List[Dict], mtbf: float):
+        if not stats:
+            raise ValueError(
+                "No call statistics found. Collect them with "
+                "start_call_tracing(modules, collect_stats=True)."
+            )
+
+        self.mtbf = mtbf
+        self.checkpoint_seconds = sum(s["checkpoint_seconds"] for s in stats) / len(
+            stats
+        )
+        self.checkpoint_bytes = sum(s["checkpoint_bytes"] for s in stats) / len(stats)
+        self.interval_seconds = sum(s["interval_seconds"] for s in stats) / len(stats)
+        self.current_waste = waste(
+            self.interval_seconds, self.checkpoint_seconds, mtbf
+        )
+        self.optimal_interval = math.sqrt(2 * self.checkpoint_seconds * mtbf)
+
+        totals = collections.defaultdict(lambda: [0, 0.0])
+        for s in stats:
+            for key, (calls, seconds) in s["calls"].items():
+                totals[key][0] += calls
+                totals[key][1] += seconds
+
+        self.functions: List[FunctionStats] = []
+        for (filename, qualname, first_line), (calls, seconds) in totals.items():
+            mean = seconds / calls if calls else 0.0
+            self.functions.append(
+                FunctionStats(
+                    filename,
+                    qualname,
+                    first_line,
+                    calls,
+                    seconds,
+                    mean,
+                    waste(mean, self.checkpoint_seconds, mtbf),
+                )
+            )
+        self.functions.sort(key=lambda f: f.waste)
+
+    def report(self, top: int = 20) -> str:
+        """A human readable summary of the `top` best places to checkpoint."""
+        lines = [
+            "Checkpoints cost %.3fs and %d bytes on average."
+            % (self.checkpoint_seconds, self.checkpoint_bytes),
+            "They're %.1fs apart, which wastes %.2f%% of the run time with a "
+            "mean time between failures of %.0fs."
+            % (self.interval_seconds, 100 * self.current_waste, self.mtbf),
+            "The least wasteful interval is %.1fs." % self.optimal_interval,
+            "Checkpointing after each call of (best first):",
+        ]
+        for f in self.functions[:top]:
+            lines.append(
+                "  %-30s %8d calls %10.3fs each %7.2f%% waste%s  %s:%d"
+                % (
+                    f.qualname,
+                    f.calls,
+                    f.mean_seconds,
+                    100 * f.waste,
+                    " *" if f.waste < self.current_waste else "  ",
+                    f.filename,
+                    f.first_line,
+                )
+            )
+        lines.append("* wastes less than the current placement.")
+        return "\n".join(lines)
+
+
+def placement_report(
+    checkpoint_dir: str = "__checkpoints__", mtbf: float = 24 * 3600.0
+) -> PlacementReport:
+    """Recommend where to checkpoint, given a mean time between failures of
+    `mtbf` seconds, from the statistics in the directory's call logs."""
+    stats = []
+    for path in glob.glob(os.path.join(checkpoint_dir, "calltrace-*")):
+        s = read_call_stats(path)
+        if s is not None:
+            stats.append(s)
+    return PlacementReport(stats, mtbf)
@@ -0,0 +1,67 @@
+"""Save a checkpoint when an exception escapes the program.
+
+When an exception escapes a traced function, the call tracer snapshots the
+stack while the caller is still in the middle of the failing call. If the
+exception then reaches the top level unhandled, the snapshot is saved as a
+checkpoint along with the call log of the functions called before the
+failing call.
+
+After you fix the bug, resume_from_last_unchanged_checkpoint() restarts
+right before the failing call, as long as the fix doesn't modify a function
+that was called before it.
+"""
+
+from typing import Callable
+import logging
+import sys
+
+import function_checkpointing.calltrace as calltrace
+
+log = logging.getLogger(__name__)
+
+# Writes a snapshot and its call log to the checkpoint directory. Set by the
+# package's __init__.
+write_checkpoint: Callable = None
+
+checkpoint_name = "postmortem"
+_previous_excepthook = None
+
+
+def _excepthook(exc_type, exc, tb):
+    pm, calltrace.postmortem = calltrace.postmortem, None
+
+    if pm is not None and pm.exc_id == id(exc) and pm.exc_type is exc_type:
+        try:
+            write_checkpoint(checkpoint_name, pm.ckpt, pm.funcall_log)
+            log.error("Saved post-mortem checkpoint %s", checkpoint_name)
+        except Exception:
+            log.exception("Failed to save post-mortem checkpoint %s", checkpoint_name)
+
+    _previous_excepthook(exc_type, exc, tb)
+
+
+def enable_postmortem_checkpoints(name: str = "postmortem"):
+    """Save a checkpoint named `name` when an exception escapes the program.
+
+    Only exceptions that escape a traced function are captured, so call
+    tracing must be on (see start_call_tracing). Every exception that escapes
+    a traced function costs a snapshot of the stack, even if it's caught
+    later, so avoid this in code that uses exceptions for control flow.
+    """
+    global checkpoint_name, _previous_excepthook
+
+    checkpoint_name = name
+    calltrace.capture_postmortems = True
+    if _previous_excepthook is None:
+        _previous_excepthook = sys.excepthook
+        sys.excepthook = _excepthook
+
+
+def disable_postmortem_checkpoints():
+    global _previous_excepthook
+
+    calltrace.capture_postmortems = False
+    calltrace.postmortem = None
+    if _previous_excepthook is not None:
+        sys.excepthook = _previous_excepthook
+        _previous_excepthook = None
@@ -0,0 +1,161 @@
+"""Request checkpoints from signal handlers and timers.
+
+A signal handler can't checkpoint on the spot, because the frame it interrupts
+might be anywhere, including in the middle of writing a checkpoint. Instead,
+the handlers installed here request a checkpoint. The checkpoint is taken at
+the next safe point: the next call into a traced function, or the next call
+to safe_point().
+
+Checkpoints requested by a termination signal are written only if they can be
+written before the grace period runs out, and the process exits right after.
+If no safe point comes before the grace period runs out, the process exits
+without a checkpoint.
+"""
+
+from typing import Callable, Iterable, Optional
+import collections
+import itertools
+import logging
+import os
+import signal
+import threading
+import time
+
+import function_checkpointing.calltrace as calltrace
+
+log = logging.getLogger(__name__)
+
+Request = collections.namedtuple("Request", ("name", "deadline", "exit_code"))
+
+# Writes a snapshot returned by save_jump() to the checkpoint directory along
+# with the call log. Set by the package's __init__.
+write_checkpoint: Callable = None
+
+pending: Optional[Request] = None
+
+# How long it took to write the most recent checkpoint. Used to predict
+# whether the next one fits in the grace period. Until a checkpoint has been
+# written, there's no prediction and requested checkpoints are always tried.
+last_write_seconds = 0.0
+
+# Exits the process when the grace period of a termination signal runs out.
+_watchdog: Optional[threading.Timer] = None
+
+
+def request_checkpoint(name: str, deadline: float = None, exit_code: int = None):
+    """Ask for a checkpoint at the next safe point.
+
+    `deadline` is a time.monotonic() time by which the checkpoint must be
+    written. If `exit_code` is given, the process exits with it after the
+    checkpoint is written.
+    """
+    global pending
+
+    if pending is not None and pending.exit_code is not None and exit_code is None:
+        # Don't let a periodic checkpoint displace a preemption.
+        return
+
+    pending = Request(name, deadline, exit_code)
+    calltrace.request_safe_point(_save_at_traced_call)
+
+
+def take_request() -> Optional[Request]:
+    """Claim the pending request, if there is one.
+
+    Exits the process if the request can't be written before its deadline.
+    """
+    global pending
+
+    request, pending = pending, None
+    calltrace.request_safe_point(None)
+
+    if request and request.deadline is not None:
+        if time.monotonic() + last_write_seconds > request.deadline:
+            log.warning(
+                "Not enough time left to write checkpoint %s. Exiting.", request.name
+            )
+            raise SystemExit(request.exit_code)
+
+    return request
+
+
+def finish(request: Request, write_seconds: float):
+    """Record the cost of the checkpoint written for request, and exit if it
+    asked to."""
+    global last_write_seconds
+    last_write_seconds = write_seconds
+
+    if request.exit_code is not None:
+        log.info("Saved checkpoint %s. Exiting.", request.name)
+        raise SystemExit(request.exit_code)
+
+
+def _exit_at(deadline: float, exit_code: int):
+    """Exit the process at deadline, even if no safe point comes by then."""
+    global _watchdog
+
+    def expire():
+        log.warning("No safe point came within the grace period. Exiting.")
+        os._exit(exit_code)
+
+    if _watchdog is None:
+        _watchdog = threading.Timer(max(0.0, deadline - time.monotonic()), expire)
+        _watchdog.daemon = True
+        _watchdog.start()
+
+
+def _save_at_traced_call(ckpt):
+    """Called by the call tracer with a snapshot of the stack, taken right
+    before a call into a traced function."""
+    request = take_request()
+    if request is None:
+        return
+
+    t0 = time.monotonic()
+    write_checkpoint(request.name, ckpt)
+    finish(request, time.monotonic() - t0)
+
+
+def checkpoint_on_signals(
+    signals: Iterable[int] = (signal.SIGTERM,),
+    grace_period: float = 30.0,
+    name: str = "preempted",
+):
+    """Checkpoint and exit when the process receives one of `signals`.
+
+    The checkpoint is taken at the next safe point, and is skipped if it can't
+    be written within `grace_period` seconds of receiving the signal. Either
+    way, the process then exits with status 128 + the signal number, at the
+    latest when the grace period runs out.
+
+    Whether a checkpoint can be written in time is predicted from how long
+    the last one took, so the first checkpoint of a run is always attempted.
+    The checkpoint is written to a temporary file and renamed into place, so
+    being killed mid-write leaves the previous checkpoints intact.
+    """
+
+    def on_signal(signum, frame):
+        log.info("Received signal %d. Requesting checkpoint %s", signum, name)
+        deadline = time.monotonic() + grace_period
+        request_checkpoint(name, deadline, 128 + signum)
+        _exit_at(deadline, 128 + signum)
+
+    for signum in signals:
+        signal.signal(signum, on_signal)
+
+
+def checkpoint_every(seconds: float, name: str = "autosave"):
+    """Checkpoint periodically.
+
+    Every `seconds` seconds, requests a checkpoint named "<name> <n>" at the
+    next safe point. Use a retention policy to bound how many of these are
+    kept. Pass 0 to stop. This uses SIGALRM.
+    """
+    counter = itertools.count(1)
+
+    def on_alarm(signum, frame):
+        request_checkpoint("%s %d" % (name, next(counter)))
+
+    if seconds:
+        signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds, seconds)
@@ -0,0 +1,92 @@
+"""Find and read the checkpoint to resume from while the program starts up.
+
+Resuming is usually the first thing a program does after importing its
+modules and opening its datasets. Finding the last unchanged checkpoint
+compiles the program's sources, and loading a large checkpoint from a slow
+disk can take as long again. A prefetch does both in a background thread, as
+soon as it's requested: it locates the checkpoint and reads it through, so
+it's in the page cache by the time the program unpickles it. Reading it into
+the page cache rather than into memory means the program doesn't need room
+for two copies of a large checkpoint.
+
+Only finding and reading happen in the background. Deleting the checkpoints
+that the resume invalidates, unpickling, and jump() stay in the thread that
+resumes.
+"""
+
+from typing import Callable, Dict, Optional, Tuple
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# The key of the prefetch of resume_from_last_unchanged_checkpoint().
+LAST_UNCHANGED = None
+
+_READ_SIZE = 1 << 23
+
+_lock = threading.Lock()
+_pending: Dict[Optional[str], "Prefetch"] = {}
+
+
+def warm(path: str):
+    """Read a file through so that it's in the page cache."""
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        buf = bytearray(_READ_SIZE)
+        while f.readinto(buf):
+            pass
+
+
+class Prefetch(threading.Thread):
+    """Locate a checkpoint and read it ahead in the background.
+
+    `locate` returns a value for the resuming thread, and the path of the
+    checkpoint file to read, or an empty path if there's nothing to read.
+    """
+
+    def __init__(self, locate: Callable[[], Tuple[object, str]]):
+        super().__init__(name="checkpoint-prefetch", daemon=True)
+        self.locate = locate
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+    def run(self):
+        t0 = time.monotonic()
+        try:
+            self.value, path = self.locate()
+            if path:
+                warm(path)
+                log.debug("Prefetched %s in %.3fs", path, time.monotonic() - t0)
+        except BaseException as e:
+            self.error = e
+
+    def wait(self):
+        """The value returned by `locate`, once the read is done.
+
+        Exceptions raised in the background are raised here.
+        """
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def start(key: Optional[str], locate: Callable[[], Tuple[object, str]]) -> Prefetch:
+    """Start a prefetch, unless one with the same key is already pending."""
+    with _lock:
+        prefetch = _pending.get(key)
+        if prefetch is None:
+            prefetch = _pending[key] = Prefetch(locate)
+            prefetch.start()
+        return prefetch
+
+
+def take(key: Optional[str]) -> Optional[Prefetch]:
+    """The pending prefetch with the given key, if any. It's no longer
+    pending afterwards."""
+    with _lock:
+        return _pending.pop(key, None)
@@ -0,0 +1,164 @@
+"""Iterators that checkpoints save by position instead of by content.
+
+A for loop that's in progress when a checkpoint is saved keeps its iterator
+on the stack, and the iterator is saved along with everything else. Many
+iterators (range, enumerate, zip, map, itertools...) already pickle as a
+position. Others, like files and generators, can't be pickled at all. This
+module makes them resumable:
+
+* Files opened for reading are saved as their name and offset, and reopened
+  and sought to that offset on restore. Text files only support this when
+  they're read with readline(), because Python disables tell() while a text
+  file is being iterated over. Iterate over resumable_lines(path) instead.
+
+* Generators created by a function decorated with @resumable_generator are
+  saved as the generator function, its arguments, and the number of items
+  consumed. On restore, the generator is recreated and fast-forwarded by
+  replaying that many items.
+
+register_iterator_adapter() teaches checkpoints how to save other types.
+"""
+
+from typing import Callable, Dict
+import collections
+import copyreg
+import functools
+import io
+import itertools
+import locale
+import pickle
+
+import function_checkpointing.transient as transient
+
+_adapters: Dict[type, Callable] = {}
+
+# The dispatch table of the pickler that writes checkpoints. Transient types
+# (see transient.py) come first.
+dispatch_table = collections.ChainMap(
+    transient.reducers, _adapters, copyreg.dispatch_table
+)
+
+
+def register_iterator_adapter(cls: type, reduce: Callable):
+    """Save instances of cls with `reduce` when they're checkpointed.
+
+    `reduce` follows the protocol of object.__reduce__: it returns a callable
+    and the arguments to call it with to rebuild the object, positioned where
+    it was.
+    """
+    _adapters[cls] = reduce
+
+
+def _reopen(name: str, mode: str, position, kwargs: Dict):
+    f = open(name, mode, **kwargs)
+    f.seek(position)
+    return f
+
+
+def _reduce_file(f):
+    if f.closed:
+        raise pickle.PicklingError("Can't checkpoint closed file %r" % f.name)
+    if "r" not in f.mode or "+" in f.mode:
+        raise pickle.PicklingError(
+            "Can't checkpoint %r, which is open for writing. Declare it with "
+            "transient_locals() instead." % f.name
+        )
+
+    kwargs = {}
+    if isinstance(f, io.TextIOWrapper):
+        kwargs = {"encoding": f.encoding, "errors": f.errors}
+        try:
+            position = f.tell()
+        except OSError:
+            raise pickle.PicklingError(
+                "Can't checkpoint text file %r while it's being iterated over. "
+                "Iterate over resumable_lines(%r) instead." % (f.name, f.name)
+            )
+    else:
+        position = f.tell()
+
+    return _reopen, (f.name, f.mode, position, kwargs)
+
+
+for _cls in (io.BufferedReader, io.FileIO, io.TextIOWrapper):
+    register_iterator_adapter(_cls, _reduce_file)
+
+
+class ResumableLines(object):
+    """Iterate over the lines of a text file, remembering the byte offset of
+    the next line so that the iteration can be saved and resumed."""
+
+    def __init__(self, path: str, encoding: str = None, offset: int = 0):
+        self.path = path
+        # The same default as open().
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.offset = offset
+        self._f = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if self._f is None:
+            self._f = open(self.path, "rb")
+            self._f.seek(self.offset)
+
+        line = self._f.readline()
+        if not line:
+            self._f.close()
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode(self.encoding)
+
+    def __reduce__(self):
+        return ResumableLines, (self.path, self.encoding, self.offset)
+
+
+def resumable_lines(path: str, encoding: str = None) -> ResumableLines:
+    """Like iterating over open(path), but can be checkpointed mid-file."""
+    return ResumableLines(path, encoding)
+
+
+class ResumableGenerator(object):
+    """A generator that counts the items it has produced, so it can be
+    recreated and fast-forwarded on restore. See resumable_generator()."""
+
+    def __init__(self, factory: Callable, args_pickle: bytes, consumed: int = 0):
+        self.factory = factory
+        self.args_pickle = args_pickle
+        self.consumed = consumed
+
+        args, kwargs = pickle.loads(args_pickle)
+        self._gen = factory.__wrapped__(*args, **kwargs)
+        if consumed:
+            # Replay the items produced before the checkpoint.
+            collections.deque(itertools.islice(self._gen, consumed), maxlen=0)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._gen)
+        self.consumed += 1
+        return item
+
+    def __reduce__(self):
+        return ResumableGenerator, (self.factory, self.args_pickle, self.consumed)
+
+
+def resumable_generator(func: Callable) -> Callable:
+    """Decorate a generator function so its generators can be checkpointed.
+
+    The function must be defined at the top level of a module. Its arguments
+    are pickled when the generator is created, so they must be picklable, and
+    the generator must produce the same items each time it's called with
+    them. Restoring costs as much as replaying the items already produced.
+    """
+
+    @functools.wraps(func)
+    def factory(*args, **kwargs):
+        return ResumableGenerator(
+            factory, pickle.dumps((args, kwargs), pickle.HIGHEST_PROTOCOL)
+        )
+
+    return factory
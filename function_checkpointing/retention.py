@@ -0,0 +1,275 @@
+"""Retention policies that bound the disk space used by checkpoints.
+
+A retention policy decides which checkpoints in the checkpoint directory to
+keep. After each save, the policy is enforced in a background thread, which
+deletes the checkpoints the policy drops. Their call logs are merged into the
+call log of the next checkpoint that survives, so that
+resume_from_last_unchanged_checkpoint() still sees the functions that were
+called before the dropped checkpoints. Call logs whose checkpoint no longer
+exists are garbage collected at the same time.
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import collections
+import glob
+import logging
+import math
+import os
+import pickle
+import tempfile
+import threading
+
+import function_checkpointing.checkpoint_file as checkpoint_file
+import function_checkpointing.journal as journal
+
+log = logging.getLogger(__name__)
+
+StoredCheckpoint = collections.namedtuple(
+    "StoredCheckpoint", ("name", "mtime", "nbytes", "paths")
+)
+
+
+class KeepLast(object):
+    """Keep the `n` most recent checkpoints."""
+
+    def __init__(self, n: int):
+        if n < 1:
+            raise ValueError("KeepLast needs n >= 1, got %d" % n)
+        self.n = n
+
+    def select(self, checkpoints: Sequence[StoredCheckpoint]) -> Set[str]:
+        return {c.name for c in checkpoints[-self.n :]}
+
+
+class KeepExponential(object):
+    """Keep checkpoints spaced exponentially in time.
+
+    Checkpoints are grouped into buckets by their age relative to the newest
+    checkpoint. The first bucket holds checkpoints younger than
+    `min_interval` seconds, and each subsequent bucket is `factor` times wider
+    than the previous one. The oldest checkpoint of each bucket is kept, so
+    the number of kept checkpoints grows only logarithmically with the length
+    of the run.
+    """
+
+    def __init__(self, min_interval: float = 60.0, factor: float = 2.0):
+        if min_interval <= 0 or factor <= 1:
+            raise ValueError("KeepExponential needs min_interval > 0 and factor > 1")
+        self.min_interval = min_interval
+        self.factor = factor
+
+    def _bucket(self, age: float) -> int:
+        if age < self.min_interval:
+            return 0
+        return 1 + int(math.log(age / self.min_interval, self.factor))
+
+    def select(self, checkpoints: Sequence[StoredCheckpoint]) -> Set[str]:
+        if not checkpoints:
+            return set()
+
+        newest = checkpoints[-1]
+        oldest_in_bucket = {}
+        for c in reversed(checkpoints):
+            oldest_in_bucket[self._bucket(newest.mtime - c.mtime)] = c.name
+
+        return set(oldest_in_bucket.values()) | {newest.name}
+
+
+class RetentionPolicy(object):
+    """A union of keep-policies, capped by a total byte budget.
+
+    A checkpoint survives if any of `keep` selects it. If the survivors
+    occupy more than `max_bytes`, the oldest ones are deleted until they fit.
+    The most recent checkpoint is never deleted.
+    """
+
+    def __init__(self, keep: Iterable = (), max_bytes: Optional[int] = None):
+        self.keep = list(keep)
+        self.max_bytes = max_bytes
+
+    def select(self, checkpoints: Sequence[StoredCheckpoint]) -> Set[str]:
+        if not checkpoints:
+            return set()
+
+        if self.keep:
+            kept = set().union(*(p.select(checkpoints) for p in self.keep))
+        else:
+            kept = {c.name for c in checkpoints}
+        kept.add(checkpoints[-1].name)
+
+        if self.max_bytes is not None:
+            total = sum(c.nbytes for c in checkpoints if c.name in kept)
+            for c in checkpoints[:-1]:
+                if total <= self.max_bytes:
+                    break
+                if c.name in kept:
+                    kept.discard(c.name)
+                    total -= c.nbytes
+
+        return kept
+
+
+def stored_checkpoints(checkpoint_dir: str) -> List[StoredCheckpoint]:
+    """The checkpoints in `checkpoint_dir`, oldest first.
+
+    The paths of each checkpoint list its call log first, so that deleting
+    them in order never leaves a call log that points to a missing checkpoint.
+    """
+    checkpoints = []
+    for path in checkpoint_file.checkpoint_paths(checkpoint_dir):
+        name = os.path.basename(path)
+        paths = [path]
+        trace_path = os.path.join(checkpoint_dir, "calltrace-" + name)
+        if os.path.exists(trace_path):
+            paths.insert(0, trace_path)
+
+        try:
+            header = checkpoint_file.read_header(path)
+            nbytes = sum(os.path.getsize(p) for p in paths)
+            if header:
+                order = (header["sequence"], header["time"])
+            else:
+                order = (0, os.path.getmtime(path))
+        except FileNotFoundError:
+            # Deleted underneath us by a concurrent resume.
+            continue
+        checkpoints.append((order, StoredCheckpoint(name, order[1], nbytes, paths)))
+
+    checkpoints.sort(key=lambda c: c[0])
+    return [c for _, c in checkpoints]
+
+
+def _unlink(path: str):
+    try:
+        journal.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _call_log_path(c: StoredCheckpoint) -> Optional[str]:
+    """The path of the call log of c, if it has one."""
+    if os.path.basename(c.paths[0]).startswith("calltrace-"):
+        return c.paths[0]
+    return None
+
+
+def _read_call_log(path: str) -> Tuple[Dict, Optional[Dict]]:
+    """The function log and the statistics (see placement.py) of a call log."""
+    with open(path, "rb") as f:
+        funcall_log = pickle.load(f)
+        try:
+            stats = pickle.load(f)
+        except EOFError:
+            stats = None
+    return funcall_log, stats
+
+
+def _merge_call_logs(paths: Sequence[str], into: str):
+    """Merge the call logs at `paths`, oldest first, into the call log `into`
+    of a later checkpoint, which then covers their intervals too."""
+    funcall_log, stats = _read_call_log(into)
+    for path in reversed(paths):
+        earlier_log, earlier_stats = _read_call_log(path)
+        # The earlier hash wins if a function changed in between, so that
+        # a change to either version is detected.
+        funcall_log.update(earlier_log)
+
+        if stats is None or earlier_stats is None:
+            continue
+        calls = dict(stats["calls"])
+        for key, (n, seconds) in earlier_stats["calls"].items():
+            later_n, later_seconds = calls.get(key, (0, 0.0))
+            calls[key] = (n + later_n, seconds + later_seconds)
+        stats = dict(
+            stats,
+            calls=calls,
+            # The dropped checkpoint's time is now part of the interval.
+            interval_seconds=stats["interval_seconds"]
+            + earlier_stats["interval_seconds"]
+            + earlier_stats["checkpoint_seconds"],
+        )
+
+    # Not "." + the name, which the saving thread uses for its own temporary
+    # files, concurrently with this one.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(into), prefix=".")
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump(funcall_log, f)
+        if stats is not None:
+            pickle.dump(stats, f)
+    os.replace(tmp_path, into)
+    journal.record_write(into)
+
+
+def collect_garbage(checkpoint_dir: str, policy: RetentionPolicy):
+    """Delete the checkpoints `policy` drops, and orphaned call logs."""
+    checkpoints = stored_checkpoints(checkpoint_dir)
+    kept = policy.select(checkpoints)
+
+    # The dropped checkpoints with a call log since the last survivor with
+    # one.
+    pending: List[StoredCheckpoint] = []
+    for c in checkpoints:
+        call_log = _call_log_path(c)
+        if c.name not in kept:
+            if call_log:
+                pending.append(c)
+                continue
+            log.info("Retention policy deletes checkpoint %s", c.name)
+            _unlink(c.paths[0])
+        elif call_log and pending:
+            _merge_call_logs([_call_log_path(d) for d in pending], call_log)
+            for d in pending:
+                log.info("Retention policy deletes checkpoint %s", d.name)
+                for path in d.paths:
+                    _unlink(path)
+            pending = []
+
+    if pending:
+        # No later checkpoint has a call log yet, like when the newest one's
+        # is still being written. They're merged on a later pass.
+        log.debug("Keeping %d dropped checkpoints for their call logs", len(pending))
+
+    for trace_path in glob.glob(os.path.join(checkpoint_dir, "calltrace-*")):
+        checkpoint_path = os.path.join(
+            checkpoint_dir, os.path.basename(trace_path)[len("calltrace-") :]
+        )
+        if not os.path.exists(checkpoint_path):
+            log.info("Deleting orphaned call log %s", trace_path)
+            _unlink(trace_path)
+
+
+policy: Optional[RetentionPolicy] = None
+_checkpoint_dir = "__checkpoints__"
+_enforcement_requested = threading.Event()
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+def _enforce_forever():
+    while True:
+        _enforcement_requested.wait()
+        _enforcement_requested.clear()
+        if policy is None:
+            continue
+        try:
+            collect_garbage(_checkpoint_dir, policy)
+        except Exception:
+            log.exception("Failed to enforce the retention policy")
+
+
+def request_enforcement(checkpoint_dir: str):
+    """Enforce the retention policy in the background, if there is one."""
+    global _checkpoint_dir, _worker
+
+    if policy is None:
+        return
+
+    _checkpoint_dir = checkpoint_dir
+    _enforcement_requested.set()
+
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(
+                target=_enforce_forever, name="checkpoint-retention", daemon=True
+            )
+            _worker.start()
@@ -2,20 +2,39 @@ from typing import Generator, List, Tuple, Sequence
 import collections
 import dis
 import logging
+import time
+import weakref
 
 from function_checkpointing.jump cimport *
 
+import function_checkpointing.generators as generators
+import function_checkpointing.headroom as headroom
+import function_checkpointing.instrumentation as instrumentation
+import function_checkpointing.transient as transient
+
 SavedStackFrame = collections.namedtuple(
         'SavedStackFrame',
-        ('f_lasti', 'stack_content', 'co_code', 'try_block_stack'),
+        ('f_lasti', 'stack_content', 'co_code', 'try_block_stack',
+         'co_name', 'co_filename', 'co_firstlineno', 'f_lineno',
+         'local_names'),
         module=__name__
         )
+# The descriptive fields are missing from snapshots saved by older versions.
+SavedStackFrame.__new__.__defaults__ = (None, None, None, None, None)
 
 class NULLObject(object):
     pass
 
 log = logging.getLogger(__name__)
 
+# Set at the start of each save_jump() and jump(), so that the per-frame code
+# doesn't build log messages or take timings nobody asked for.
+cdef bint debug_logging = False
+cdef bint timing = False
+# Time spent by snapshot_frame() in the current save_jump().
+cdef double analyze_seconds = 0
+cdef double copy_seconds = 0
+
 
 def loop_nesting_level(instructions: Sequence[dis.Instruction],
         starting_from: int, ending_at: int = None) -> int:
@@ -25,36 +44,57 @@ def loop_nesting_level(instructions: Sequence[dis.Instruction],
     if ending_at is None:
         ending_at = starting_from
 
-    # Find the first backward jump after this range
-    while ending_at < len(instructions):
-        if instructions[ending_at].opcode == JUMP_ABSOLUTE:
-            break
+    level = 0
+    while True:
+        # Find the first backward jump after this range
+        while ending_at < len(instructions):
+            if instructions[ending_at].opcode == JUMP_ABSOLUTE:
+                break
+            ending_at += 1
+        else:
+            # No more loops enclose the block
+            return level
+
+        # The index into `instructions` this jumps to.
+        jump_target: int = instructions[ending_at].arg // 2
+
+        # If the jump encompasses the target block and it jumps to a FOR_ITER
+        # instruction, then this block is inside a for loop. Now check if that
+        # for loop is itself inside another for loop.
+        if jump_target < starting_from and instructions[jump_target].opcode == FOR_ITER:
+            level += 1
+            starting_from = jump_target - 1
+
+        # Otherwise, this jump wasn't part of a for loop that enclosed us. But
+        # there might be jump instruction later that that encompasses this
+        # block.
         ending_at += 1
-    else:
-        # No loop of any kind encloses the block
-        return 0
 
-    # The index into `instructions` this jumps to.
-    jump_target: int = instructions[ending_at].arg // 2
 
+# code object -> (its instructions, {f_lasti: (instruction at f_lasti, loop
+# nesting level)}). Deep recursion snapshots the same call sites over and over.
+_call_sites = weakref.WeakKeyDictionary()
 
-    # If the jump encompasses the target block and it jumps to a FOR_ITER instruction,
-    # then this block is inside a for loop.
-    if jump_target < starting_from and instructions[jump_target].opcode == FOR_ITER:
-        # Now check if that for loop is itself inside another for loop.
-        return 1 + loop_nesting_level(instructions, jump_target - 1, ending_at + 1)
 
-    # This jump wasn't part of a for loop that enclosed us. But there might be
-    # jump instruction later that that encompasses this block.
-    return loop_nesting_level(instructions, starting_from, ending_at + 1)
+def call_site(code, f_lasti: int) -> Tuple[dis.Instruction, int]:
+    """The instruction at f_lasti in code, and how many for loops enclose it."""
+    try:
+        instructions, sites = _call_sites[code]
+    except KeyError:
+        instructions, sites = list(dis.get_instructions(code)), {}
+        _call_sites[code] = (instructions, sites)
 
+    site = sites.get(f_lasti)
+    if site is None:
+        site = sites[f_lasti] = (
+                instructions[f_lasti // 2],
+                loop_nesting_level(instructions, f_lasti // 2))
+    return site
 
-cdef object snapshot_frame(PyFrameObject *frame):
-    log.debug('Saving frame %s(co_argcount=%d) last_i=%d',
-        <object>frame.f_code.co_name,
-        <object>frame.f_code.co_argcount,
-        <object>frame.f_lasti)
 
+cdef tuple stack_extent(PyFrameObject *frame):
+    """How many entries of frame.f_localsplus are in use while the frame is in
+    the middle of the instruction at f_lasti, and that instruction."""
     # The stack contains the the local variables, but we'll keep adding things
     # to it below.
     stack_size = frame.f_valuestack - frame.f_localsplus
@@ -67,14 +107,11 @@ cdef object snapshot_frame(PyFrameObject *frame):
             stack_size += 3
 
     # Disassemble the current call instruction.
-    bytecode_instructions = list(
-            dis.Bytecode(<object> frame.f_code, current_offset=frame.f_lasti)
-            )
-    call_instr = bytecode_instructions[frame.f_lasti // 2]
+    call_instr, nesting_level = call_site(<object> frame.f_code, frame.f_lasti)
 
     # Add one stack element for every for-loop surrounding the call site. Each
     # for-loop pushes an iterator onto the stack.
-    stack_size += loop_nesting_level(bytecode_instructions, frame.f_lasti // 2)
+    stack_size += nesting_level
 
     # Each flavor of the CALL instruction requires a different number of arguments.
     if call_instr.opname == 'CALL_FUNCTION':
@@ -91,10 +128,77 @@ cdef object snapshot_frame(PyFrameObject *frame):
     elif call_instr.opname == 'CALL_FUNCTION_EX':
         # +1 for the function, +1 for *args, optionally +1 for **kwargs
         stack_size += 2 + (call_instr.arg & 0x1)
+    elif call_instr.opname == 'FOR_ITER':
+        # Pulling the next item from a generator or an iterator implemented in
+        # Python. loop_nesting_level only counted the enclosing loops, so +1
+        # for this loop's iterator.
+        stack_size += 1
+    elif call_instr.opname == 'YIELD_FROM':
+        # Delegating to a generator with `yield from`, or awaiting a
+        # coroutine. +1 for the generator being delegated to.
+        stack_size += 1
     elif call_instr.opname:
         raise NotImplementedError("Don't know how to checkpoint around opcode"
                 f" {call_instr.opname}. Here is the function:\n"
                 + dis.Bytecode(<object> frame.f_code).dis())
+    return stack_size, call_instr
+
+
+def calls_code(frame_obj, code) -> bool:
+    """Whether the frame is in the middle of a CALL instruction that calls a
+    function whose code is `code`.
+
+    When it's not, code is being run by C code the frame called, like list()
+    consuming a map(), and re-executing the frame's call instruction would
+    redo more than the call to code.
+    """
+    cdef PyFrameObject *frame = <PyFrameObject*> frame_obj
+    try:
+        stack_size, call_instr = stack_extent(frame)
+    except (NotImplementedError, AssertionError):
+        return False
+
+    # The index of the callable in the stack. See stack_extent().
+    if call_instr.opname == 'CALL_FUNCTION':
+        i = stack_size - 1 - call_instr.arg
+    elif call_instr.opname == 'CALL_FUNCTION_KW':
+        i = stack_size - 2 - call_instr.arg
+    elif call_instr.opname == 'CALL_FUNCTION_EX':
+        i = stack_size - 2 - (call_instr.arg & 0x1)
+    elif call_instr.opname == 'CALL_METHOD':
+        # LOAD_METHOD pushed either the method and self, or NULL and the
+        # callable.
+        i = stack_size - 2 - call_instr.arg
+        if not frame.f_localsplus[i]:
+            i += 1
+    else:
+        return False
+
+    if not frame.f_localsplus[i]:
+        return False
+    callee = <object> frame.f_localsplus[i]
+    callee = getattr(callee, '__func__', callee)
+    return getattr(callee, '__code__', None) is code
+
+
+cdef object snapshot_frame(PyFrameObject *frame):
+    global analyze_seconds, copy_seconds
+
+    if debug_logging:
+        log.debug('Saving frame %s(co_argcount=%d) last_i=%d',
+            <object>frame.f_code.co_name,
+            <object>frame.f_code.co_argcount,
+            <object>frame.f_lasti)
+
+    cdef double t0 = 0, t1 = 0
+    if timing:
+        t0 = time.perf_counter()
+
+    stack_size, call_instr = stack_extent(frame)
+
+    if timing:
+        t1 = time.perf_counter()
+        analyze_seconds += t1 - t0
 
     # Save a copy of the stack using the above guess. Convert NULL pointers to
     # a Python object sentinel value.
@@ -103,6 +207,12 @@ cdef object snapshot_frame(PyFrameObject *frame):
             for i in range(stack_size)
         ]
 
+    if call_instr.opname == 'YIELD_FROM':
+        # YIELD_FROM popped the value it's sending to the generator. Push a
+        # None in its place so that the YIELD_FROM can be re-executed on
+        # restore. A generator that's just been created only accepts None.
+        stack_content.append(None)
+
     try_block_stack = [
             frame.f_blockstack[i] for i in range(frame.f_iblock)
             ]
@@ -112,12 +222,22 @@ cdef object snapshot_frame(PyFrameObject *frame):
             stack_content,
             <object> frame.f_code.co_code,
             try_block_stack,
+            <object> frame.f_code.co_name,
+            <object> frame.f_code.co_filename,
+            <object> frame.f_code.co_firstlineno,
+            (<object> frame).f_lineno,
+            # The names of the first entries of stack_content.
+            (<object> frame.f_code.co_varnames
+                + <object> frame.f_code.co_cellvars
+                + <object> frame.f_code.co_freevars),
             )
 
+    if timing:
+        copy_seconds += time.perf_counter() - t1
     return saved_frame
 
 
-def save_jump() -> List[SavedStackFrame]:
+def save_jump(max_frames=None) -> List[SavedStackFrame]:
     """Snapshot of the stack frame leading to this call.
 
     The ephemeral state of the stack frames between the caller and the topmost
@@ -125,22 +245,40 @@ def save_jump() -> List[SavedStackFrame]:
     global, pickled, unpickled, etc. You can restore the call stack by calling
     jump() on the returned object.
 
+    If max_frames is given, only the innermost max_frames frames are saved,
+    and the snapshot is restored with jump_on_next_frame().
+
     When this function returns, it can return two things:
        1. The saved state of the stack so that you can jump back to this point
        2. The empty list if you've jumped back to this point.
     """
+    global debug_logging, timing, analyze_seconds, copy_seconds
     saved_stack: List[SavedStackFrame] = []
 
     if PyThreadState_Get().interp.eval_frame == <_PyFrameEvalFunction*>pyeval_fast_forward:
-        PyThreadState_Get().interp.eval_frame = _PyEval_EvalFrameDefault
+        finish_restore()
         log.debug('save_jump In the middle of a resume. Not saving.')
         return []
 
+    debug_logging = log.isEnabledFor(logging.DEBUG)
+    timing = instrumentation.enabled
+    analyze_seconds = copy_seconds = 0
+
     cdef PyFrameObject *frame = PyEval_GetFrame()
-    while frame:
+    while frame != NULL and (max_frames is None or len(saved_stack) < max_frames):
         saved_stack.append(snapshot_frame(frame))
         frame = frame.f_back
 
+    cdef double t0 = 0
+    if timing:
+        t0 = time.perf_counter()
+    generators.strip(saved_stack)
+    transient.strip(saved_stack)
+
+    if timing:
+        copy_seconds += time.perf_counter() - t0
+        instrumentation.emit("analyze", analyze_seconds, 0, len(saved_stack))
+        instrumentation.emit("copy", copy_seconds, 0, len(saved_stack))
     return saved_stack
 
 
@@ -152,7 +290,8 @@ cdef object restore_frame(PyFrameObject *frame, saved_frame: SavedStackFrame):
     """
     frame_obj = <object> frame
 
-    log.debug('Restoring frame %s', frame_obj.f_code)
+    if debug_logging:
+        log.debug('Restoring frame %s', frame_obj.f_code)
 
     if frame_obj.f_code.co_code != saved_frame.co_code:
         raise RuntimeError('Trying to restore frame from wrong snapshot:'
@@ -186,19 +325,85 @@ cdef object restore_frame(PyFrameObject *frame, saved_frame: SavedStackFrame):
 
 jump_stack = []
 
+# The thread that called jump(). The frame evaluator is shared by all the
+# threads of the interpreter, so other threads (like the retention policy's
+# garbage collector) must bypass the fast forward.
+cdef PyThreadState *jump_thread_state = NULL
+
+# When the current jump() started, and how many frames it restores.
+cdef double jump_started = 0
+cdef Py_ssize_t jump_frames = 0
+
+# Called once jump() has restored all the frames, to put back the frame
+# evaluator that jump() took over, like the call tracer's. Set by calltrace.
+reinstall_eval_frame = None
+
+
+cdef finish_restore():
+    PyThreadState_Get().interp.eval_frame = _PyEval_EvalFrameDefault
+    if reinstall_eval_frame is not None:
+        reinstall_eval_frame()
+
 
 cdef object pyeval_fast_forward(PyFrameObject *frame, int exc):
     global jump_stack
 
+    if PyThreadState_Get() != jump_thread_state:
+        return _PyEval_EvalFrameDefault(frame, exc)
+
     # Temporarily disable calling ourselves while we restore the frame. This
     # lets us call Python functions in restore_frame()
     PyThreadState_Get().interp.eval_frame = _PyEval_EvalFrameDefault
+
+    if not jump_stack:
+        # All the saved frames are restored, and the innermost one is calling
+        # a Python function. That happens for snapshots taken by the call
+        # tracer right before a call. Evaluate the callee with the evaluator
+        # we took over from, so that it's traced again.
+        finish_restore()
+        return PyThreadState_Get().interp.eval_frame(frame, exc)
+
     restore_frame(frame, jump_stack.pop())
+    if timing and not jump_stack:
+        # The innermost frame is about to resume.
+        instrumentation.emit(
+            "fast_forward", time.perf_counter() - jump_started, 0, jump_frames)
 
     PyThreadState_Get().interp.eval_frame = <_PyFrameEvalFunction*> pyeval_fast_forward
 
     r = _PyEval_EvalFrameDefault(frame, exc)
-    log.debug('finished evaluating %s', <object> frame.f_code)
+    if debug_logging:
+        log.debug('finished evaluating %s', <object> frame.f_code)
+    return r
+
+
+cdef start_jump(saved_frames: List[SavedStackFrame]):
+    """Make the frame evaluator restore saved_frames, starting with the next
+    frame it evaluates."""
+    global jump_stack, jump_thread_state, debug_logging, timing
+    global jump_started, jump_frames
+
+    cdef PyFrameObject *frame = PyEval_GetFrame()
+    cdef int depth = 0
+    while frame:
+        frame = frame.f_back
+        depth += 1
+
+    # Each restored frame nests a Python call and a few C calls on top of the
+    # current ones. Fail now rather than with a RecursionError or a segfault
+    # halfway through the restore.
+    headroom.check(len(saved_frames), depth)
+
+    debug_logging = log.isEnabledFor(logging.DEBUG)
+    timing = instrumentation.enabled
+    jump_started = time.perf_counter()
+    jump_frames = len(saved_frames)
+
+    jump_stack.clear()
+    jump_stack.extend(generators.recreate(transient.rehydrate(saved_frames)))
+
+    jump_thread_state = PyThreadState_Get()
+    PyThreadState_Get().interp.eval_frame = <_PyFrameEvalFunction*>pyeval_fast_forward
 
 
 def jump(saved_frames: List[SavedStackFrame]):
@@ -213,15 +418,26 @@ def jump(saved_frames: List[SavedStackFrame]):
     until the outermost function in the call stack returns. The return value
     of jump() is the return value of that outerframe.
     """
-    global jump_stack
-    jump_stack.clear()
-    jump_stack.extend(list(saved_frames))
-
     cdef PyFrameObject *top_frame = PyEval_GetFrame()
     while top_frame.f_back:
         top_frame = top_frame.f_back
 
     log.debug('top frame for resume: %s', <object>top_frame.f_code)
-    PyThreadState_Get().interp.eval_frame = <_PyFrameEvalFunction*>pyeval_fast_forward
+    start_jump(saved_frames)
 
     return pyeval_fast_forward(top_frame, 0)
+
+
+def jump_on_next_frame(saved_frames: List[SavedStackFrame]):
+    """Restore the state of the call stack, starting with the next frame
+    that's evaluated rather than the outermost one.
+
+    `saved_frames` is an object returned by save_jump(max_frames). Its
+    outermost frame is restored into the next frame evaluated, which must run
+    the same code, like a fresh coroutine that the caller awaits right after
+    this returns:
+
+        save_restore.jump_on_next_frame(saved_frames)
+        return await coro
+    """
+    start_jump(saved_frames)
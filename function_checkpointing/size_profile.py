@@ -0,0 +1,194 @@
+"""Attribute the size and pickling time of a checkpoint to frames and locals.
+
+Each entry of each frame's stack_content is pickled on its own, and charged
+to the local variable that holds it. Objects reachable from more than one
+frame get pickled once in the checkpoint but are charged to every local that
+reaches them, so they're also reported separately as shared objects.
+"""
+
+from typing import Dict, List, Sequence
+import collections
+import pickle
+import time
+
+import function_checkpointing.resumable as resumable
+import function_checkpointing.save_restore as save_restore
+
+FrameCost = collections.namedtuple(
+    "FrameCost", ("depth", "function", "filename", "nbytes", "seconds")
+)
+LocalCost = collections.namedtuple(
+    "LocalCost", ("depth", "function", "name", "type", "nbytes", "seconds", "error")
+)
+SharedObject = collections.namedtuple(
+    "SharedObject", ("type", "nbytes", "frames", "seconds")
+)
+
+# Objects too small to be worth tracking as shared.
+_SCALARS = (type(None), bool, int, float, complex)
+
+
+class _ByteCounter(object):
+    """A file that only counts the bytes written to it, so that profiling a
+    large checkpoint doesn't hold its pickles in memory."""
+
+    def __init__(self):
+        self.nbytes = 0
+
+    def write(self, data) -> int:
+        n = len(data)
+        self.nbytes += n
+        return n
+
+
+def _pickled_size(obj) -> int:
+    """How many bytes obj pickles to in a checkpoint."""
+    f = _ByteCounter()
+    pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = resumable.dispatch_table
+    pickler.dump(obj)
+    return f.nbytes
+
+
+class _ReachabilityPickler(pickle.Pickler):
+    """A pickler that records every object it visits."""
+
+    def __init__(self, file, visited: Dict[int, object]):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.dispatch_table = resumable.dispatch_table
+        self.visited = visited
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, _SCALARS):
+            self.visited[id(obj)] = obj
+        return None
+
+
+def _slot_name(saved_frame, slot: int) -> str:
+    names = saved_frame.local_names or ()
+    if slot < len(names):
+        return names[slot]
+    return "<stack %d>" % (slot - len(names))
+
+
+class CheckpointProfile(object):
+    """The cost of each frame, each local, and each shared object of a
+    snapshot returned by save_jump(). Frames are numbered from the innermost
+    one, which has depth 0."""
+
+    def __init__(self, ckpt: Sequence, min_shared_bytes: int = 1024):
+        self.frames: List[FrameCost] = []
+        self.locals: List[LocalCost] = []
+        self.shared: List[SharedObject] = []
+
+        # id -> object, and id -> depths of the frames that reach it.
+        objects: Dict[int, object] = {}
+        reached_from: Dict[int, set] = collections.defaultdict(set)
+
+        for depth, saved_frame in enumerate(ckpt):
+            frame_bytes, frame_seconds = 0, 0.0
+            for slot, obj in enumerate(saved_frame.stack_content):
+                if obj is save_restore.NULLObject:
+                    continue
+
+                visited: Dict[int, object] = {}
+                f = _ByteCounter()
+                error = None
+                t0 = time.perf_counter()
+                try:
+                    _ReachabilityPickler(f, visited).dump(obj)
+                except Exception as e:
+                    error = "%s: %s" % (type(e).__name__, e)
+                seconds = time.perf_counter() - t0
+
+                nbytes = f.nbytes
+                frame_bytes += nbytes
+                frame_seconds += seconds
+                self.locals.append(
+                    LocalCost(
+                        depth,
+                        saved_frame.co_name,
+                        _slot_name(saved_frame, slot),
+                        type(obj).__name__,
+                        nbytes,
+                        seconds,
+                        error,
+                    )
+                )
+
+                objects.update(visited)
+                for obj_id in visited:
+                    reached_from[obj_id].add(depth)
+
+            self.frames.append(
+                FrameCost(
+                    depth,
+                    saved_frame.co_name,
+                    saved_frame.co_filename,
+                    frame_bytes,
+                    frame_seconds,
+                )
+            )
+
+        for obj_id, depths in reached_from.items():
+            if len(depths) < 2:
+                continue
+            obj = objects[obj_id]
+            t0 = time.perf_counter()
+            try:
+                nbytes = _pickled_size(obj)
+            except Exception:
+                # Already reported as an error on the locals that reach it.
+                continue
+            seconds = time.perf_counter() - t0
+            if nbytes >= min_shared_bytes:
+                self.shared.append(
+                    SharedObject(type(obj).__name__, nbytes, sorted(depths), seconds)
+                )
+
+        self.locals.sort(key=lambda c: c.nbytes, reverse=True)
+        self.shared.sort(key=lambda c: c.nbytes, reverse=True)
+
+    def report(self, top: int = 20) -> str:
+        """A human readable summary of the `top` most expensive items."""
+        lines = ["Frames (innermost first):"]
+        for c in self.frames:
+            lines.append(
+                "  %3d %-30s %12d bytes %8.3fs  %s"
+                % (c.depth, c.function, c.nbytes, c.seconds, c.filename)
+            )
+
+        lines.append("Largest locals:")
+        for c in self.locals[:top]:
+            lines.append(
+                "  %3d %-30s %-20s %12d bytes %8.3fs  %s%s"
+                % (
+                    c.depth,
+                    c.function,
+                    c.name,
+                    c.nbytes,
+                    c.seconds,
+                    c.type,
+                    "  (%s)" % c.error if c.error else "",
+                )
+            )
+
+        if self.shared:
+            lines.append("Largest objects reachable from several frames:")
+            for c in self.shared[:top]:
+                lines.append(
+                    "  %-20s %12d bytes %8.3fs  frames %s"
+                    % (c.type, c.nbytes, c.seconds, ", ".join(map(str, c.frames)))
+                )
+
+        return "\n".join(lines)
+
+
+def profile_checkpoint(
+    ckpt: Sequence, min_shared_bytes: int = 1024
+) -> CheckpointProfile:
+    """Break down the cost of pickling a snapshot returned by save_jump().
+
+    Shared objects smaller than `min_shared_bytes` aren't reported.
+    """
+    return CheckpointProfile(ckpt, min_shared_bytes)
@@ -0,0 +1,240 @@
+"""Locals that aren't saved in checkpoints, but rebuilt when restored.
+
+Database connections, open files, GPU handles and caches are expensive or
+impossible to pickle, and are better rebuilt from scratch after a restore.
+You can mark them as transient in two ways:
+
+    @ckpt.transient_locals(db=lambda: sqlite3.connect(DB), cache=dict)
+    def process():
+        ...
+
+    ckpt.register_transient_type(
+        sqlite3.Connection, rehydrate=lambda: sqlite3.connect(DB))
+
+save_jump() replaces transient locals with a small placeholder, and jump()
+calls the rehydration callback to rebuild them. Instances of transient types
+are replaced wherever they are, like in an attribute of a local
+(self.conn), by the pickler that writes the checkpoint, and rebuilt when
+it's loaded. An object that's referenced from several places is rebuilt once
+and shared again.
+"""
+
+from typing import Callable, Dict, List, Set, Tuple
+import collections
+
+# Stands in for a transient local in a snapshot. `key` identifies the
+# rehydration callback, and `state` is passed to it.
+TransientLocal = collections.namedtuple("TransientLocal", ("key", "state"))
+
+# Stands in for the cell of a transient local that's captured by a closure.
+# `local` is the TransientLocal of its content.
+TransientCell = collections.namedtuple("TransientCell", ("local",))
+
+# (co_filename, co_firstlineno, co_name) -> {local name: factory}
+_local_factories: Dict[Tuple[str, int, str], Dict[str, Callable]] = {}
+
+# type -> (save, rehydrate)
+_type_handlers: Dict[type, Tuple[Callable, Callable]] = {}
+
+
+def _cell(value):
+    return (lambda: value).__closure__[0]
+
+
+_CellType = type(_cell(None))
+
+# Values that are never treated as transient. They're cheap to save, and
+# they're shared throughout the stack (like None, or the class save_restore
+# uses to mark empty slots), so replacing them by identity would be wrong.
+_NEVER_TRANSIENT = (type(None), bool, int, float, str, bytes, type)
+
+
+def transient_locals(**factories: Callable):
+    """Decorate a function to exclude some of its locals from checkpoints.
+
+    Each keyword names a local variable of the function, and gives a function
+    that takes no argument and rebuilds the local when the checkpoint is
+    restored. The local can be captured by a closure, in which case the
+    closure sees the rebuilt value too.
+    """
+
+    def decorator(func):
+        code = func.__code__
+        unknown = set(factories) - set(
+            code.co_varnames + code.co_cellvars + code.co_freevars
+        )
+        if unknown:
+            raise ValueError(
+                "%s has no locals named %s" % (func.__qualname__, sorted(unknown))
+            )
+
+        key = (code.co_filename, code.co_firstlineno, code.co_name)
+        _local_factories.setdefault(key, {}).update(factories)
+        return func
+
+    return decorator
+
+
+def register_transient_type(cls: type, rehydrate: Callable, save: Callable = None):
+    """Exclude instances of cls (and its subclasses) from checkpoints.
+
+    If `save` is given, it's called on the object when it's checkpointed, and
+    what it returns is saved and passed to `rehydrate` to rebuild the object.
+    Otherwise, `rehydrate` is called with no arguments.
+    """
+    _type_handlers[cls] = (save, rehydrate)
+    reducers.clear()
+
+
+def _type_handler(cls: type):
+    for klass in cls.__mro__:
+        handler = _type_handlers.get(klass)
+        if handler:
+            return klass, handler
+    return None, None
+
+
+def _rebuild(klass: type, state):
+    _, rehydrate = _type_handlers[klass]
+    if state is None:
+        return rehydrate()
+    return rehydrate(state)
+
+
+class _Reducers(dict):
+    """Part of the dispatch table of the pickler that writes checkpoints (see
+    resumable.py). Maps the transient types and their subclasses to a reducer
+    that rebuilds their instances when the checkpoint is loaded."""
+
+    def __init__(self):
+        super().__init__()
+        # The types looked up so far that aren't transient.
+        self._misses: Set[type] = set()
+
+    def clear(self):
+        super().clear()
+        self._misses.clear()
+
+    def __missing__(self, cls: type):
+        if cls in self._misses or not _type_handlers:
+            raise KeyError(cls)
+        klass, handler = _type_handler(cls)
+        if not handler:
+            self._misses.add(cls)
+            raise KeyError(cls)
+
+        save, _ = handler
+
+        def reduce(obj):
+            return _rebuild, (klass, save(obj) if save else None)
+
+        self[cls] = reduce
+        return reduce
+
+
+reducers = _Reducers()
+
+
+def strip(saved_stack: List):
+    """Replace the transient locals in a snapshot with placeholders, in place."""
+    if not _local_factories:
+        return
+
+    # id(transient object) -> its placeholder, so that all references to a
+    # transient object get the same placeholder.
+    placeholders: Dict[int, object] = {}
+
+    for saved_frame in saved_stack:
+        factories = _local_factories.get(
+            (saved_frame.co_filename, saved_frame.co_firstlineno, saved_frame.co_name)
+        )
+        if not factories:
+            continue
+        local_names = saved_frame.local_names or ()
+        for slot, obj in enumerate(saved_frame.stack_content):
+            if slot >= len(local_names) or local_names[slot] not in factories:
+                continue
+            if isinstance(obj, _NEVER_TRANSIENT) or id(obj) in placeholders:
+                continue
+
+            local = TransientLocal(
+                (
+                    saved_frame.co_filename,
+                    saved_frame.co_firstlineno,
+                    saved_frame.co_name,
+                    local_names[slot],
+                ),
+                None,
+            )
+            if type(obj) is _CellType:
+                # A local captured by a closure. The frame holds its cell,
+                # which must be restored as a cell.
+                placeholders[id(obj)] = TransientCell(local)
+                try:
+                    obj = obj.cell_contents
+                except ValueError:
+                    # Not assigned yet.
+                    continue
+                if isinstance(obj, _NEVER_TRANSIENT):
+                    continue
+            placeholders[id(obj)] = local
+
+    if not placeholders:
+        return
+
+    # A second pass to catch references that were visited before the object
+    # was recognized as transient, like a transient local that an inner frame
+    # received as an argument.
+    for saved_frame in saved_stack:
+        content = saved_frame.stack_content
+        for slot, obj in enumerate(content):
+            placeholder = placeholders.get(id(obj))
+            if placeholder is not None:
+                content[slot] = placeholder
+
+
+def _rehydrate(placeholder: TransientLocal):
+    filename, firstlineno, co_name, name = placeholder.key
+    try:
+        factory = _local_factories[(filename, firstlineno, co_name)][name]
+    except KeyError:
+        raise RuntimeError(
+            "Don't know how to rebuild transient local %s of %s (%s:%d). Was its "
+            "function decorated with transient_locals()?"
+            % (name, co_name, filename, firstlineno)
+        )
+    return factory()
+
+
+def rehydrate(saved_stack: List) -> List:
+    """A copy of a snapshot with its placeholders replaced by rebuilt objects.
+
+    The snapshot itself isn't modified, so it can be restored again.
+    """
+    rebuilt: Dict[int, object] = {}
+    result = []
+
+    def rebuild(o):
+        if id(o) not in rebuilt:
+            if type(o) is TransientCell:
+                rebuilt[id(o)] = _cell(rebuild(o.local))
+            else:
+                rebuilt[id(o)] = _rehydrate(o)
+        return rebuilt[id(o)]
+
+    for saved_frame in saved_stack:
+        if not any(
+            type(o) in (TransientLocal, TransientCell)
+            for o in saved_frame.stack_content
+        ):
+            result.append(saved_frame)
+            continue
+
+        content = []
+        for o in saved_frame.stack_content:
+            if type(o) in (TransientLocal, TransientCell):
+                o = rebuild(o)
+            content.append(o)
+        result.append(saved_frame._replace(stack_content=content))
+
+    return result
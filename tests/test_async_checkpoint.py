@@ -0,0 +1,203 @@
+"""Test save_checkpoint_async and resume_from_checkpoint_async in
+async_checkpoint.py
+"""
+
+import asyncio
+import collections
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+import function_checkpointing.async_checkpoint as async_checkpoint
+import function_checkpointing.checkpoint_file as checkpoint_file
+
+PROGRAM = """
+import asyncio
+import os
+
+import function_checkpointing as ckpt
+
+
+async def step(x):
+    await asyncio.sleep(0)
+    return x * 10
+
+
+async def ingest(xs):
+    results = []
+    for x in xs:
+        y = await step(x)
+        results.append(y)
+        if str(x) in os.environ.get("STOP_AT", "").split(","):
+            await ckpt.save_checkpoint_async("ingest")
+            if "EXIT" in os.environ:
+                os._exit(3)
+    return results
+
+
+async def main():
+    results = await ingest([0, 1, 2, 3, 4, 5])
+    print(results)
+
+
+if os.path.exists("__checkpoints__/ingest"):
+    asyncio.run(ckpt.resume_from_checkpoint_async("ingest", main()))
+else:
+    asyncio.run(main())
+"""
+
+# Stands in for save_restore.SavedStackFrame.
+Frame = collections.namedtuple(
+    "Frame", ("co_name", "co_filename", "co_firstlineno", "f_lineno", "co_code", "data")
+)
+
+
+class SlowPickle(object):
+    """Blocks pickling until released, and counts concurrent picklings."""
+
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def __init__(self, release: threading.Event):
+        self.release = release
+
+    def __reduce__(self):
+        with SlowPickle.lock:
+            SlowPickle.active += 1
+            SlowPickle.peak = max(SlowPickle.peak, SlowPickle.active)
+        self.release.wait(5)
+        with SlowPickle.lock:
+            SlowPickle.active -= 1
+        return int, (0,)
+
+
+class TestSaveCheckpointAsync(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.loop = asyncio.new_event_loop()
+        SlowPickle.active = SlowPickle.peak = 0
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.dir)
+        async_checkpoint.set_async_checkpoint_limit(1)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def ckpt(self, data):
+        return [Frame("f", "foo.py", 1, 2, b"code", data)]
+
+    def test_loop_runs_during_write(self):
+        release = threading.Event()
+
+        async def ticker():
+            # The loop keeps running while the checkpoint is being pickled.
+            for _ in range(3):
+                await asyncio.sleep(0.01)
+            release.set()
+
+        async def main():
+            save = asyncio.ensure_future(
+                async_checkpoint._save(
+                    self.loop, self.path("a"), self.ckpt(SlowPickle(release))
+                )
+            )
+            await ticker()
+            await save
+
+        self.loop.run_until_complete(main())
+        self.assertIsNotNone(checkpoint_file.read_header(self.path("a")))
+
+    def test_concurrency_limit(self):
+        async_checkpoint.set_async_checkpoint_limit(2)
+        release = threading.Event()
+
+        async def main():
+            saves = [
+                async_checkpoint._save(
+                    self.loop, self.path(name), self.ckpt(SlowPickle(release))
+                )
+                for name in "abcd"
+            ]
+            self.loop.call_later(0.2, release.set)
+            await asyncio.gather(*saves)
+
+        self.loop.run_until_complete(main())
+        self.assertEqual(2, SlowPickle.peak)
+        self.assertEqual(sorted("abcd"), sorted(os.listdir(self.dir)))
+
+    def test_cancel_discards_checkpoint(self):
+        release = threading.Event()
+
+        async def main():
+            save = asyncio.ensure_future(
+                async_checkpoint._save(
+                    self.loop, self.path("a"), self.ckpt(SlowPickle(release))
+                )
+            )
+            await asyncio.sleep(0.05)
+            save.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await save
+            release.set()
+
+            # The next save waits for the cancelled one to let go of its slot.
+            await async_checkpoint._save(self.loop, self.path("b"), self.ckpt(1))
+
+        self.loop.run_until_complete(main())
+        self.assertEqual(["b"], os.listdir(self.dir))
+
+    def test_requires_task(self):
+        with self.assertRaises(RuntimeError):
+            async_checkpoint.save_checkpoint_async("a")
+
+
+class TestResumeAsync(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, "program.py"), "w") as f:
+            f.write(PROGRAM)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_program(self, **env) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            [sys.executable, "program.py"],
+            cwd=self.dir,
+            env=dict(os.environ, **env),
+            capture_output=True,
+            timeout=60,
+        )
+
+    def assertSaved(self, p: subprocess.CompletedProcess):
+        self.assertEqual(3, p.returncode, p.stderr.decode())
+        # Only the checkpoint is in the directory, not a torn temporary file.
+        self.assertEqual(
+            ["ingest"], os.listdir(os.path.join(self.dir, "__checkpoints__"))
+        )
+
+    def assertFinished(self, p: subprocess.CompletedProcess):
+        self.assertEqual(0, p.returncode, p.stderr.decode())
+        self.assertEqual(b"[0, 10, 20, 30, 40, 50]\n", p.stdout)
+
+    def test_resume(self):
+        self.assertSaved(self.run_program(STOP_AT="2", EXIT="1"))
+        self.assertFinished(self.run_program())
+
+    def test_save_after_resume(self):
+        self.assertSaved(self.run_program(STOP_AT="1", EXIT="1"))
+        # The task's coroutine is now resume_from_checkpoint_async(), which
+        # the snapshot leaves out.
+        self.assertSaved(self.run_program(STOP_AT="4", EXIT="1"))
+        self.assertFinished(self.run_program())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""Test the checkpoint file format in checkpoint_file.py
+"""
+
+import builtins
+import collections
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import function_checkpointing.checkpoint_file as checkpoint_file
+
+# Stands in for save_restore.SavedStackFrame.
+Frame = collections.namedtuple(
+    "Frame", ("co_name", "co_filename", "co_firstlineno", "f_lineno", "co_code", "data")
+)
+
+
+class CountingFile(object):
+    """Counts the bytes read from a file."""
+
+    def __init__(self, f):
+        self.f = f
+        self.nbytes = 0
+
+    def read(self, n=-1):
+        data = self.f.read(n)
+        self.nbytes += len(data)
+        return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.f.close()
+
+
+class TestCheckpointFile(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def test_round_trip(self):
+        ckpt = [
+            Frame("inner", "foo.py", 9, 10, b"code", "x" * 1000),
+            Frame("<module>", "foo.py", 1, 3, b"code", 7),
+        ]
+        checkpoint_file.write_checkpoint(self.path("step1"), ckpt)
+
+        self.assertEqual(ckpt, checkpoint_file.read_checkpoint(self.path("step1")))
+
+        header = checkpoint_file.read_header(self.path("step1"))
+        self.assertEqual(
+            [("inner", "foo.py", 10), ("<module>", "foo.py", 3)],
+            [(f["function"], f["file"], f["line"]) for f in header["frames"]],
+        )
+        self.assertGreater(header["payload_size"], 1000)
+        self.assertEqual([], [p for p in os.listdir(self.dir) if p.startswith(".")])
+
+    def test_sequence_increases(self):
+        for name in ("a", "b", "c"):
+            checkpoint_file.write_checkpoint(self.path(name), [])
+
+        sequences = [
+            checkpoint_file.read_header(self.path(name))["sequence"]
+            for name in ("a", "b", "c")
+        ]
+        self.assertEqual(sorted(sequences), sequences)
+        self.assertEqual(3, len(set(sequences)))
+
+    def test_checkpoint_without_header(self):
+        with open(self.path("old"), "wb") as f:
+            pickle.dump([1, 2, 3], f)
+
+        self.assertIsNone(checkpoint_file.read_header(self.path("old")))
+        self.assertEqual([1, 2, 3], checkpoint_file.read_checkpoint(self.path("old")))
+
+    def test_failed_write_leaves_no_file(self):
+        ckpt = [Frame("inner", "foo.py", 9, 10, b"code", lambda: None)]
+        with self.assertRaises(Exception):
+            checkpoint_file.write_checkpoint(self.path("step1"), ckpt)
+
+        self.assertEqual([], os.listdir(self.dir))
+
+    def test_header_read_skips_payload(self):
+        ckpt = [Frame("inner", "foo.py", 9, 10, b"code", "x" * 1000000)]
+        header = checkpoint_file.write_checkpoint(self.path("step1"), ckpt)
+        header_size = os.path.getsize(self.path("step1")) - header["payload_size"]
+
+        files = []
+
+        def counting_open(path, mode):
+            files.append(CountingFile(builtins.open(path, mode)))
+            return files[-1]
+
+        with mock.patch.object(checkpoint_file, "open", counting_open, create=True):
+            checkpoint_file.read_header(self.path("step1"))
+        # The preamble and the header, but not the payload.
+        self.assertEqual([header_size], [f.nbytes for f in files])
+
+    def test_write_not_committed(self):
+        header = checkpoint_file.write_checkpoint(
+            self.path("step1"), [], should_commit=lambda: False
+        )
+
+        self.assertIsNone(header)
+        self.assertEqual([], os.listdir(self.dir))
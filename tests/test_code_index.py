@@ -0,0 +1,85 @@
+"""Test the qualified names in code_index.py, and how call logs use them.
+"""
+
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+import function_checkpointing
+import function_checkpointing.calltrace as calltrace
+import function_checkpointing.code_index as code_index
+
+SOURCE = """
+def run():
+    return 0
+
+def outer():
+    def run():
+        return 1
+    return run
+
+class Klass:
+    def run(self):
+        return 2
+
+    class Inner:
+        def run(self):
+            return 3
+"""
+
+
+class TestQualname(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.dir, "module.py")
+        self.write_source(SOURCE)
+
+        spec = importlib.util.spec_from_file_location("module", self.fname)
+        self.module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.module)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_source(self, source):
+        with open(self.fname, "w") as f:
+            f.write(source)
+        # Make sure the code index notices the change.
+        os.utime(self.fname, ns=(0, len(source)))
+
+    def functions(self):
+        return [
+            self.module.run,
+            self.module.outer(),
+            self.module.Klass.run,
+            self.module.Klass.Inner.run,
+        ]
+
+    def test_live_code(self):
+        self.assertEqual(
+            [f.__qualname__ for f in self.functions()],
+            [code_index.qualname(f.__code__) for f in self.functions()],
+        )
+
+    def test_unknown_file(self):
+        code = compile("def f(): pass", "<string>", "exec").co_consts[0]
+        self.assertEqual("f", code_index.qualname(code))
+
+    def test_edit_one_method(self):
+        hashes = {
+            f.__qualname__: calltrace.hash_code(f.__code__) for f in self.functions()
+        }
+        self.write_source(SOURCE.replace("return 2", "return len([])"))
+
+        changed = {
+            qualname
+            for qualname, h in hashes.items()
+            if function_checkpointing._function_changed(self.fname, qualname, h)
+        }
+        self.assertEqual({"Klass.run"}, changed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""Test the checks in compatibility.py
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import function_checkpointing.code_index as code_index
+import function_checkpointing.compatibility as compatibility
+
+SOURCE = """
+def outer():
+    def inner():
+        return 1
+    return inner()
+
+class Klass:
+    def method(self):
+        return 2
+
+class Other:
+    def method(self):
+        return 2
+"""
+
+
+class TestCompatibility(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.dir, "module.py")
+        self.write_source(SOURCE)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_source(self, source):
+        with open(self.fname, "w") as f:
+            f.write(source)
+        # Make sure the code index notices the change.
+        os.utime(self.fname, ns=(0, len(source)))
+
+    def header(self, qualname="outer.<locals>.inner", line=4):
+        index = code_index.code_index(self.fname)
+        code = index.by_qualname[qualname][0]
+        return {
+            "python_version": "",
+            "interpreter": compatibility.interpreter_fingerprint(),
+            "frames": [
+                {
+                    "function": code.co_name,
+                    "qualname": qualname,
+                    "file": self.fname,
+                    "line": line,
+                    "first_line": code.co_firstlineno,
+                    "code_hash": compatibility.code_hash(code.co_code),
+                }
+            ],
+        }
+
+    def test_qualnames(self):
+        index = code_index.code_index(self.fname)
+        self.assertIn("outer.<locals>.inner", index.by_qualname)
+        self.assertIn("Klass.method", index.by_qualname)
+
+    def test_unchanged(self):
+        compatibility.check(self.header())
+
+    def test_moved(self):
+        header = self.header()
+        self.write_source("\n\n" + SOURCE)
+        compatibility.check(header)
+
+    def test_changed(self):
+        header = self.header()
+        self.write_source(SOURCE.replace("return 1", "return len([])"))
+        with self.assertRaises(compatibility.IncompatibleCheckpoint) as cm:
+            compatibility.check(header)
+        self.assertEqual("inner", cm.exception.frame["function"])
+
+    def test_same_name_in_other_class(self):
+        header = self.header("Klass.method", 9)
+        # Other.method still has the bytecode Klass.method had.
+        self.write_source(SOURCE.replace("return 2", "return len([])", 1))
+        with self.assertRaises(compatibility.IncompatibleCheckpoint):
+            compatibility.check(header)
+
+    def test_source_with_null_byte(self):
+        header = self.header()
+        self.write_source(SOURCE + "\0")
+        # Can't be compiled, so it's not checked, like a missing source.
+        compatibility.check(header)
+
+    def test_header_without_qualname(self):
+        header = self.header()
+        del header["frames"][0]["qualname"]
+        compatibility.check(header)
+
+    def test_other_interpreter(self):
+        header = self.header()
+        header["interpreter"] = {"implementation": "PyPy", "bytecode_magic": "00"}
+        with self.assertRaises(compatibility.IncompatibleCheckpoint):
+            compatibility.check(header)
@@ -4,8 +4,10 @@ These tests check that the examples behave as expected.
 """
 
 
+import os
 import shutil
 import subprocess
+import tempfile
 import unittest
 
 
@@ -147,3 +149,50 @@ Jump finished
 foo out 1 2 3 4
 foo out 1 2 3 4""",
         )
+
+    def test_postmortem(self):
+        # The example is edited between the runs, so run a copy of it.
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "postmortem.py")
+            shutil.copy("../examples/postmortem.py", path)
+
+            p = subprocess.run(["python3", "postmortem.py"], cwd=d, capture_output=True)
+            self.assertEqual(1, p.returncode)
+            self.assertIn(b"RuntimeError: step2 is broken", p.stderr)
+            self.assertLinesEqual(
+                """Starting from scratch
+starting processing
+>step 0
+>step 1
+>step 2
+""",
+                p.stdout.decode("utf8"),
+            )
+
+            with open(path) as f:
+                source = f.read()
+            with open(path, "w") as f:
+                f.write(
+                    source.replace(
+                        'raise RuntimeError("step2 is broken. Fix it and rerun.")',
+                        'print("step2 is fixed")',
+                    )
+                )
+
+            p = subprocess.run(["python3", "postmortem.py"], cwd=d, capture_output=True)
+            self.assertEqual(0, p.returncode, p.stderr.decode("utf8"))
+            # step0 and step1 don't run again.
+            self.assertLinesEqual(
+                """>step 2
+step2 is fixed
+done
+""",
+                p.stdout.decode("utf8"),
+            )
+            # Only the example's logging, and no errors at exit.
+            self.assertEqual(
+                """INFO:function_checkpointing:Restoring from checkpoint __checkpoints__/postmortem
+INFO:function_checkpointing:jump(postmortem)
+""",
+                p.stderr.decode("utf8"),
+            )
@@ -0,0 +1,111 @@
+"""Test the code fingerprints in fingerprint.py
+"""
+
+import os
+import subprocess
+import sys
+import textwrap
+import unittest
+
+import function_checkpointing.fingerprint as fingerprint
+
+SOURCE = textwrap.dedent(
+    """
+    def f(xs):
+        key = lambda x: -x
+        squares = [x * x for x in xs]
+        if xs[0] in {"a", "b", "c", "d", "e"}:
+            return 0
+        return sorted(squares, key=key)
+    """
+)
+
+
+def compile_function(source: str, name: str = "f", **globals_):
+    namespace = dict(globals_)
+    exec(compile(source, "fingerprinted.py", "exec"), namespace)
+    return namespace[name]
+
+
+class TestHashCode(unittest.TestCase):
+    def test_nested_code_is_stable(self):
+        a = compile_function(SOURCE)
+        b = compile_function(SOURCE)
+        self.assertIsNot(a.__code__, b.__code__)
+        self.assertEqual(
+            fingerprint.hash_code(a.__code__), fingerprint.hash_code(b.__code__)
+        )
+
+    def test_stable_across_hash_seeds(self):
+        script = (
+            "import sys, textwrap\n"
+            "sys.path.insert(0, %r)\n"
+            "from function_checkpointing.fingerprint import hash_code\n"
+            "exec(compile(%r, 'fingerprinted.py', 'exec'))\n"
+            "print(hash_code(f.__code__).hex())\n"
+            % (os.path.dirname(os.path.dirname(fingerprint.__file__)), SOURCE)
+        )
+        hashes = set()
+        for seed in ("1", "2", "3"):
+            env = dict(os.environ, PYTHONHASHSEED=seed)
+            hashes.add(
+                subprocess.check_output([sys.executable, "-c", script], env=env)
+            )
+        self.assertEqual(1, len(hashes))
+
+    def test_moving_a_function_keeps_its_hash(self):
+        a = compile_function(SOURCE)
+        b = compile_function("\n\n\n" + SOURCE)
+        self.assertEqual(
+            fingerprint.hash_code(a.__code__), fingerprint.hash_code(b.__code__)
+        )
+
+    def test_edits_change_the_hash(self):
+        original = fingerprint.hash_code(compile_function(SOURCE).__code__)
+        for old, new in (
+            ("-x", "x"),  # In a lambda.
+            ("x * x", "x * x * x"),  # In a comprehension.
+            ('"e"', '"f"'),  # In a frozenset.
+            ("sorted", "reversed"),  # A global name.
+        ):
+            edited = compile_function(SOURCE.replace(old, new))
+            self.assertNotEqual(
+                original, fingerprint.hash_code(edited.__code__), (old, new)
+            )
+
+
+class TestHashFunction(unittest.TestCase):
+    def test_defaults(self):
+        a = compile_function("def f(x=1): return x")
+        b = compile_function("def f(x=2): return x")
+        self.assertEqual(fingerprint.hash_function(a), fingerprint.hash_function(b))
+        self.assertNotEqual(
+            fingerprint.hash_function(a, include_defaults=True),
+            fingerprint.hash_function(b, include_defaults=True),
+        )
+
+    def test_globals(self):
+        g1 = compile_function("def g(): return 1", "g")
+        g2 = compile_function("def g(): return 2", "g")
+        a = compile_function("def f(): return SCALE * g()", g=g1, SCALE=10)
+        b = compile_function("def f(): return SCALE * g()", g=g2, SCALE=10)
+        c = compile_function("def f(): return SCALE * g()", g=g1, SCALE=20)
+
+        self.assertEqual(fingerprint.hash_function(a), fingerprint.hash_function(b))
+        hashes = {
+            fingerprint.hash_function(func, include_globals=True)
+            for func in (a, b, c)
+        }
+        self.assertEqual(3, len(hashes))
+
+    def test_recursive_globals(self):
+        f = compile_function("def f(n): return n and f(n - 1)")
+        f.__globals__["f"] = f
+        self.assertEqual(
+            fingerprint.hash_function(f, include_globals=True),
+            fingerprint.hash_function(f, include_globals=True),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+"""Test the stack headroom checks in headroom.py
+"""
+
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+import function_checkpointing.headroom as headroom
+
+PROGRAM = """
+import os
+import sys
+
+import function_checkpointing as ckpt
+
+sys.setrecursionlimit(100000)
+
+
+def recurse(n):
+    if n == 0:
+        ckpt.save_checkpoint("deep")
+        return 0
+    r = recurse(n - 1)
+    return r + 1
+
+
+def main():
+    r = recurse(int(sys.argv[1]))
+    print(r)
+
+
+def resume():
+    # Not in the outermost frame, whose try blocks jump() would clobber.
+    try:
+        ckpt.resume_from_checkpoint("deep")
+    except RecursionError as e:
+        print(e)
+
+
+if os.path.exists("__checkpoints__/deep"):
+    resume()
+else:
+    main()
+"""
+
+C_STACK = 8 << 20
+
+
+class TestHeadroom(unittest.TestCase):
+    def setUp(self):
+        self.recursion_limit = sys.getrecursionlimit()
+        self.bytes_per_frame = headroom.C_STACK_BYTES_PER_FRAME
+
+    def tearDown(self):
+        sys.setrecursionlimit(self.recursion_limit)
+        headroom.set_c_stack_bytes_per_frame(self.bytes_per_frame)
+
+    def test_enough_room(self):
+        sys.setrecursionlimit(1000)
+        headroom.check(100, 20)
+
+    def test_recursion_limit(self):
+        sys.setrecursionlimit(1000)
+        with self.assertRaisesRegex(RecursionError, r"setrecursionlimit\(2070\)"):
+            headroom.check(2000, 20)
+
+    def test_thread_stack(self):
+        sys.setrecursionlimit(1000000)
+        errors = []
+
+        def restore():
+            try:
+                headroom.check(100000, 10)
+            except RecursionError as e:
+                errors.append(e)
+
+        old_size = threading.stack_size(1 << 20)
+        try:
+            t = threading.Thread(target=restore)
+            t.start()
+            t.join()
+        finally:
+            threading.stack_size(old_size)
+
+        self.assertEqual(1, len(errors))
+        self.assertIn("threading.stack_size", str(errors[0]))
+
+    def test_bytes_per_frame(self):
+        sys.setrecursionlimit(1000000)
+        errors = []
+
+        def restore():
+            for nbytes in (600, 2048):
+                headroom.set_c_stack_bytes_per_frame(nbytes)
+                try:
+                    headroom.check(1000, 10)
+                except RecursionError:
+                    errors.append(nbytes)
+
+        old_size = threading.stack_size(1 << 20)
+        try:
+            t = threading.Thread(target=restore)
+            t.start()
+            t.join()
+        finally:
+            threading.stack_size(old_size)
+
+        # 1000 frames fit in 1 MiB at 600 bytes each, but not at 2048.
+        self.assertEqual([2048], errors)
+
+
+class TestDeepRestore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, "program.py"), "w") as f:
+            f.write(PROGRAM)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_program(self, depth: int) -> subprocess.CompletedProcess:
+        def limit_stack():
+            _, hard = resource.getrlimit(resource.RLIMIT_STACK)
+            resource.setrlimit(resource.RLIMIT_STACK, (C_STACK, hard))
+
+        return subprocess.run(
+            [sys.executable, "program.py", str(depth)],
+            cwd=self.dir,
+            capture_output=True,
+            timeout=120,
+            preexec_fn=limit_stack,
+        )
+
+    def save_and_resume(self, depth: int) -> bytes:
+        p = self.run_program(depth)
+        self.assertEqual(0, p.returncode, p.stderr.decode())
+        p = self.run_program(depth)
+        self.assertEqual(0, p.returncode, p.stderr.decode())
+        return p.stdout
+
+    def test_deep_restore_allowed(self):
+        # Close to the deepest restore that fits in 8 MiB on a release build.
+        self.assertEqual(b"13500\n", self.save_and_resume(13500))
+
+    def test_too_deep(self):
+        # Deep enough to crash with a C stack estimate that's too low.
+        self.assertIn(b"Raise the limit", self.save_and_resume(15000))
+
+
+if __name__ == "__main__":
+    unittest.main()
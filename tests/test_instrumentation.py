@@ -0,0 +1,72 @@
+"""Test the measurements of instrumentation.py
+"""
+
+import collections
+import os
+import shutil
+import tempfile
+import unittest
+
+import function_checkpointing.checkpoint_file as checkpoint_file
+import function_checkpointing.instrumentation as instrumentation
+
+# Stands in for save_restore.SavedStackFrame.
+Frame = collections.namedtuple(
+    "Frame", ("co_name", "co_filename", "co_firstlineno", "f_lineno", "co_code", "data")
+)
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "step1")
+        self.ckpt = [
+            Frame("inner", "foo.py", 9, 10, b"code", "x" * 100000),
+            Frame("<module>", "foo.py", 1, 3, b"code", 7),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_disabled(self):
+        self.assertFalse(instrumentation.enabled)
+        checkpoint_file.write_checkpoint(self.path, self.ckpt)
+        self.assertEqual(self.ckpt, checkpoint_file.read_checkpoint(self.path))
+
+    def test_checkpoint_file_phases(self):
+        counters = instrumentation.Counters()
+        instrumentation.add_instrumentation_sink(counters)
+        try:
+            self.assertTrue(instrumentation.enabled)
+            checkpoint_file.write_checkpoint(self.path, self.ckpt)
+            self.assertEqual(self.ckpt, checkpoint_file.read_checkpoint(self.path))
+        finally:
+            instrumentation.remove_instrumentation_sink(counters)
+        self.assertFalse(instrumentation.enabled)
+
+        totals = counters.totals()
+        self.assertEqual(["pickle", "read", "unpickle", "write"], sorted(totals))
+        file_size = os.path.getsize(self.path)
+        for phase in ("write", "read"):
+            self.assertEqual(file_size, totals[phase]["nbytes"])
+        for phase in ("pickle", "unpickle"):
+            self.assertEqual(2, totals[phase]["frames"])
+        self.assertGreater(totals["pickle"]["nbytes"], 100000)
+        for total in totals.values():
+            self.assertEqual(1, total["count"])
+            self.assertGreaterEqual(total["seconds"], 0)
+
+    def test_counters(self):
+        counters = instrumentation.Counters()
+        counters(instrumentation.Measurement("copy", 0.5, frames=3))
+        counters(instrumentation.Measurement("copy", 0.25, frames=3))
+        self.assertEqual(
+            {"copy": {"count": 2, "seconds": 0.75, "nbytes": 0, "frames": 6}},
+            counters.totals(),
+        )
+        counters.reset()
+        self.assertEqual({}, counters.totals())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,274 @@
+"""Test the group-commit journal in journal.py
+"""
+
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import function_checkpointing.journal as journal
+
+PROGRAM = """
+import time
+
+import function_checkpointing as ckpt
+
+
+def work():
+    return 1
+
+
+def other():
+    return 2
+
+
+def main():
+    for i in range(5):
+        # Let the journal's thread go back to waiting for the next save.
+        time.sleep(0.3)
+        work()
+        other()
+        ckpt.save_checkpoint_and_call_log(f"step{i}")
+
+
+ckpt.enable_journal(max_delay=0.1)
+ckpt.start_call_tracing([__file__])
+main()
+"""
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.dir, journal.JOURNAL_NAME)
+
+    def tearDown(self):
+        journal.disable_journal(self.dir)
+        shutil.rmtree(self.dir)
+
+    def write(self, name: str, data: bytes):
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        journal.record_write(path)
+        return path
+
+    def read(self, name: str) -> bytes:
+        with open(os.path.join(self.dir, name), "rb") as f:
+            return f.read()
+
+    def crash(self, *lost: str):
+        """Stop journaling without flushing or clearing the journal, and lose
+        the content of the files named in lost, or of every file written
+        since the journal started."""
+        j = journal._journals.pop(os.path.abspath(self.dir))
+        with j._lock:
+            j._sync()
+            j._closed = True
+            j._wakeup.notify()
+            os.close(j._fd)
+        j._flusher.join()
+        for name in lost or j._journaled:
+            path = os.path.join(self.dir, name)
+            if os.path.exists(path):
+                open(path, "wb").close()
+
+    def test_recover(self):
+        self.assertEqual(0, journal.enable_journal(self.dir))
+        self.write("step1", b"first")
+        self.write("step2", b"second")
+        self.write("step1", b"first again")
+        self.crash()
+
+        self.assertEqual(2, journal.enable_journal(self.dir))
+        self.assertEqual(b"first again", self.read("step1"))
+        self.assertEqual(b"second", self.read("step2"))
+
+    def test_deletions_are_recovered(self):
+        journal.enable_journal(self.dir)
+        path = self.write("step1", b"first")
+        journal.remove(path)
+        self.crash()
+        open(path, "wb").close()
+
+        journal.enable_journal(self.dir)
+        self.assertFalse(os.path.exists(path))
+
+    def test_torn_tail(self):
+        journal.enable_journal(self.dir)
+        self.write("step1", b"first")
+        self.write("step2", b"second")
+        self.crash()
+        with open(self.journal_path, "r+b") as f:
+            f.truncate(os.path.getsize(self.journal_path) - 3)
+
+        # The file of the torn record is deleted, not left torn.
+        self.assertEqual(2, journal.enable_journal(self.dir))
+        self.assertEqual(b"first", self.read("step1"))
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "step2")))
+
+    def test_corrupt_record(self):
+        journal.enable_journal(self.dir)
+        self.write("step1", b"first")
+        self.write("step2", b"second")
+        self.write("step3", b"third")
+        self.crash()
+        with open(self.journal_path, "r+b") as f:
+            data = f.read()
+            f.seek(data.index(b"second"))
+            f.write(b"SECOND")
+
+        # Recovery stops at the corrupt record.
+        self.assertEqual(3, journal.enable_journal(self.dir))
+        self.assertEqual(b"first", self.read("step1"))
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "step2")))
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "step3")))
+
+    def test_unjournaled_files_are_deleted(self):
+        journal.enable_journal(self.dir)
+        self.write("step1", b"first")
+        self.crash()
+        # Renamed into place after the last flush, without a record.
+        with open(os.path.join(self.dir, "step2"), "wb") as f:
+            f.write(b"sec")
+
+        journal.enable_journal(self.dir)
+        self.assertEqual(b"first", self.read("step1"))
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "step2")))
+
+    def test_earlier_files_are_kept(self):
+        with open(os.path.join(self.dir, "step1"), "wb") as f:
+            f.write(b"first")
+        journal.enable_journal(self.dir)
+        self.write("step2", b"second")
+        self.crash()
+
+        self.assertEqual(1, journal.enable_journal(self.dir))
+        self.assertEqual(b"first", self.read("step1"))
+        self.assertEqual(b"second", self.read("step2"))
+
+    def test_earlier_files_replaced_unjournaled_are_deleted(self):
+        path = os.path.join(self.dir, "step1")
+        with open(path, "wb") as f:
+            f.write(b"first")
+        journal.enable_journal(self.dir)
+        self.crash()
+        os.unlink(path)
+        with open(path, "wb") as f:
+            f.write(b"torn")
+
+        self.assertEqual(1, journal.enable_journal(self.dir))
+        self.assertFalse(os.path.exists(path))
+
+    def test_failed_append_is_truncated(self):
+        journal.enable_journal(self.dir)
+        self.write("step1", b"first")
+        size = os.path.getsize(self.journal_path)
+        write_all = journal._write_all
+        calls = []
+
+        def fail_after_header(fd, data):
+            calls.append(data)
+            if len(calls) > 1:
+                raise OSError("disk full")
+            write_all(fd, data)
+
+        with mock.patch.object(journal, "_write_all", fail_after_header):
+            with self.assertRaises(OSError):
+                self.write("step2", b"second")
+        self.assertEqual(size, os.path.getsize(self.journal_path))
+        self.write("step3", b"third")
+        self.crash("step1", "step2", "step3")
+
+        # The records appended after the failed one are recovered.
+        journal.enable_journal(self.dir)
+        self.assertEqual(b"first", self.read("step1"))
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "step2")))
+        self.assertEqual(b"third", self.read("step3"))
+
+    def test_batches_flushes(self):
+        journal.enable_journal(self.dir, max_batch=3, max_delay=60)
+        with mock.patch.object(journal, "_fsync") as fsync:
+            for i in range(7):
+                self.write("step%d" % i, b"x")
+            self.assertEqual(2, fsync.call_count)
+
+    def test_flushes_after_delay(self):
+        journal.enable_journal(self.dir, max_batch=100, max_delay=0.01)
+        j = journal._journals[os.path.abspath(self.dir)]
+        self.write("step1", b"x")
+        for _ in range(500):
+            with j._lock:
+                if not j._unsynced:
+                    break
+            j._flusher.join(0.01)
+        self.assertEqual(0, j._unsynced)
+
+    def test_rolls_over(self):
+        journal.enable_journal(self.dir, max_bytes=1000)
+        self.write("step1", b"x" * 600)
+        self.assertGreater(os.path.getsize(self.journal_path), 600)
+        self.write("step2", b"x" * 600)
+        # The new journal only vouches for the two files.
+        self.assertLess(os.path.getsize(self.journal_path), 200)
+        self.crash("step3")
+
+        self.assertEqual(0, journal.enable_journal(self.dir))
+        self.assertEqual(b"x" * 600, self.read("step1"))
+        self.assertEqual(b"x" * 600, self.read("step2"))
+
+    def test_disable_removes_journal(self):
+        journal.enable_journal(self.dir)
+        self.write("step1", b"first")
+        journal.disable_journal(self.dir)
+        self.assertFalse(os.path.exists(self.journal_path))
+        self.assertEqual(b"first", self.read("step1"))
+
+    def test_other_directories_are_not_journaled(self):
+        journal.enable_journal(self.dir)
+        other = tempfile.mkdtemp()
+        try:
+            path = os.path.join(other, "step1")
+            open(path, "wb").close()
+            journal.record_write(path)
+            journal.remove(path)
+        finally:
+            shutil.rmtree(other)
+        self.assertEqual(0, os.path.getsize(self.journal_path))
+
+
+class TestTracedLoop(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_calls_are_logged_while_flushing(self):
+        with open(os.path.join(self.dir, "program.py"), "w") as f:
+            f.write(PROGRAM)
+        p = subprocess.run(
+            [sys.executable, "program.py"],
+            cwd=self.dir,
+            capture_output=True,
+            timeout=60,
+        )
+        self.assertEqual(0, p.returncode, p.stderr.decode())
+
+        # The journal's thread waits for files to flush between saves. That
+        # mustn't turn the call tracer off for the loop.
+        for i in range(5):
+            path = os.path.join(self.dir, "__checkpoints__", "calltrace-step%d" % i)
+            with open(path, "rb") as f:
+                funcall_log = pickle.load(f)
+            qualnames = [qualname for _, qualname, _ in funcall_log]
+            self.assertIn("work", qualnames, "step%d" % i)
+            self.assertIn("other", qualnames, "step%d" % i)
+
+
+if __name__ == "__main__":
+    unittest.main()
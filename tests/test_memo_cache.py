@@ -0,0 +1,126 @@
+"""Test the on-disk cache of memo_cache.py
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import function_checkpointing.journal as journal
+import function_checkpointing.memo_cache as memo_cache
+
+
+def compile_function(source: str, name: str = "f", **globals_):
+    namespace = dict(globals_, __name__="memoized_module")
+    exec(compile(source, "memoized.py", "exec"), namespace)
+    return namespace[name]
+
+
+class TestMemoize(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        memo_cache.set_memoize_cache(directory=self.dir)
+        self.calls = []
+
+    def tearDown(self):
+        memo_cache.set_memoize_cache()
+        shutil.rmtree(self.dir)
+
+    def counted(self, source: str, name: str = "f", **globals_):
+        return memo_cache.memoize(
+            compile_function(source, name, calls=self.calls, **globals_)
+        )
+
+    def test_hit(self):
+        f = self.counted(
+            "def f(x, scale=1):\n    calls.append(x)\n    return x * scale"
+        )
+        self.assertEqual(6, f(3, scale=2))
+        self.assertEqual(6, f(3, scale=2))
+        self.assertEqual(3, f(3))
+        self.assertEqual([3, 3], self.calls)
+
+    def test_survives_redefinition(self):
+        source = "def f(x):\n    calls.append(x)\n    return {x: [x]}"
+        self.counted(source)(1)
+        # Like the same function in the next run of the program.
+        self.assertEqual({1: [1]}, self.counted(source)(1))
+        self.assertEqual([1], self.calls)
+
+    def test_argument_order_doesnt_matter(self):
+        f = self.counted("def f(d):\n    calls.append(d)\n    return len(d)")
+        f({"a": 1, "b": 2, "c": {3, 4}})
+        f({"c": {4, 3}, "b": 2, "a": 1})
+        self.assertEqual(1, len(self.calls))
+
+    def test_edit_invalidates(self):
+        source = "def f(x):\n    calls.append(x)\n    return x + 1"
+        self.counted(source)(1)
+        self.assertEqual(3, self.counted(source.replace("+ 1", "+ 2"))(1))
+        self.assertEqual([1, 1], self.calls)
+
+    def test_callees(self):
+        g1 = compile_function("def g(x): return x + 1", "g")
+        g2 = compile_function("def g(x): return x + 2", "g")
+        source = "def f(x):\n    calls.append(x)\n    return g(x)"
+
+        shallow = compile_function(source, g=g1, calls=self.calls)
+        memo_cache.memoize(shallow)(1)
+        shallow.__globals__["g"] = g2
+        self.assertEqual(2, memo_cache.memoize(shallow)(1))
+
+        deep = memo_cache.memoize(include_callees=True)(shallow)
+        self.assertEqual(3, deep(1))
+        self.assertEqual([1, 1], self.calls)
+
+    def test_lru_eviction(self):
+        f = self.counted("def f(x):\n    calls.append(x)\n    return b'x' * 1000")
+        f(1)
+        f(2)
+        entries = os.listdir(self.dir)
+        for i, name in enumerate(sorted(entries)):
+            os.utime(os.path.join(self.dir, name), (i, i))
+        # Using f(1) makes f(2) the least recently used.
+        f(1)
+
+        memo_cache.set_memoize_cache(max_size=2500, directory=self.dir)
+        f(3)
+        self.assertEqual(2, len(os.listdir(self.dir)))
+        f(1)
+        f(2)
+        self.assertEqual([1, 2, 3, 2], self.calls)
+
+    def test_stores_dont_list_the_cache(self):
+        f = self.counted("def f(x):\n    calls.append(x)\n    return x")
+        with mock.patch.object(memo_cache.os, "scandir", wraps=os.scandir) as scan:
+            for i in range(5):
+                f(i)
+        # Only the first store measures the cache.
+        self.assertEqual(1, scan.call_count)
+
+    def test_journaled(self):
+        journal.enable_journal(self.dir)
+        try:
+            memo_cache.set_memoize_cache(max_size=1500, directory=self.dir)
+            f = self.counted("def f(x):\n    calls.append(x)\n    return b'x' * 1000")
+            f(1)
+            f(2)
+            path = os.path.join(self.dir, journal.JOURNAL_NAME)
+            with open(path, "rb") as j:
+                kinds = [kind for kind, _, _, _ in journal.read_records(j)]
+        finally:
+            journal.disable_journal(self.dir)
+        # Evicting f(1) is journaled, so recovery doesn't bring it back.
+        self.assertEqual([journal.WRITE, journal.WRITE, journal.DELETE], kinds)
+
+    def test_unpicklable_result(self):
+        f = self.counted("def f():\n    calls.append(0)\n    return lambda: 0")
+        f()
+        f()
+        self.assertEqual([0, 0], self.calls)
+        self.assertEqual([], os.listdir(self.dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+"""Test the checkpoint placement report in placement.py
+"""
+
+import math
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import function_checkpointing.placement as placement
+
+
+class TestPlacement(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_call_log(self, name, calls=None):
+        funcall_log = {(f, q, l): b"hash" for f, q, l in calls or {}}
+        with open(os.path.join(self.dir, "calltrace-" + name), "wb") as f:
+            pickle.dump(funcall_log, f)
+            if calls is not None:
+                pickle.dump(
+                    {
+                        "calls": calls,
+                        "interval_seconds": 1000.0,
+                        "checkpoint_seconds": 2.0,
+                        "checkpoint_bytes": 1 << 20,
+                    },
+                    f,
+                )
+
+    def test_old_call_log(self):
+        self.write_call_log("old")
+        self.assertIsNone(
+            placement.read_call_stats(os.path.join(self.dir, "calltrace-old"))
+        )
+        with self.assertRaises(ValueError):
+            placement.placement_report(self.dir)
+
+    def test_ranking(self):
+        # With these costs, the best interval is sqrt(2 * 2 * 10000) = 200s.
+        self.write_call_log(
+            "a",
+            {
+                ("m.py", "tiny", 1): (100000, 10.0),
+                ("m.py", "Stage.run", 5): (4, 800.0),
+                ("m.py", "main", 20): (1, 1000.0),
+            },
+        )
+        self.write_call_log("b", {("m.py", "Stage.run", 5): (6, 1200.0)})
+
+        report = placement.placement_report(self.dir, mtbf=10000)
+
+        self.assertEqual(200, round(report.optimal_interval))
+        self.assertEqual(
+            ["Stage.run", "main", "tiny"], [f.qualname for f in report.functions]
+        )
+        stage = report.functions[0]
+        self.assertEqual((10, 200.0), (stage.calls, stage.mean_seconds))
+        self.assertLess(stage.waste, report.current_waste)
+        self.assertIn("Stage.run", report.report())
+
+    def test_waste(self):
+        self.assertEqual(math.inf, placement.waste(0, 1, 100))
+        self.assertAlmostEqual(0.1 + 0.05, placement.waste(10, 1, 100))
+
+
+if __name__ == "__main__":
+    unittest.main()
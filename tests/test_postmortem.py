@@ -0,0 +1,131 @@
+"""Test the post-mortem checkpoints of postmortem.py
+
+Each test runs a program that crashes, fixes it, and runs it again to resume
+from the post-mortem checkpoint.
+"""
+
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+PROGRAM = """
+import function_checkpointing as ckpt
+
+
+def step0():
+    print("step0")
+
+
+def check(x):
+    if x == 2 and BROKEN:
+        raise RuntimeError("check is broken")
+    return x * 10
+
+
+def step2():
+    print("step2")
+    return check(2)
+
+
+def step3(y):
+    print("step3", y)
+
+
+%s
+
+
+def main():
+    try:
+        ckpt.resume_from_last_unchanged_checkpoint()
+        return
+    except ckpt.CheckpointNotFound:
+        pass
+    processing()
+
+
+BROKEN = %s
+ckpt.start_call_tracing([__file__])
+ckpt.enable_postmortem_checkpoints()
+main()
+"""
+
+PYTHON_CALLER = """
+def processing():
+    step0()
+    y = step2()
+    step3(y)
+    ckpt.save_checkpoint_and_call_log("done")
+"""
+
+C_CALLER = """
+def processing():
+    step0()
+    ys = list(map(check, [1, 2]))
+    step3(ys)
+"""
+
+
+class TestPostmortem(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_program(self, processing: str, broken: bool):
+        with open(os.path.join(self.dir, "program.py"), "w") as f:
+            f.write(PROGRAM % (processing, broken))
+        return subprocess.run(
+            [sys.executable, "program.py"],
+            cwd=self.dir,
+            capture_output=True,
+            timeout=60,
+        )
+
+    def assertCrashed(self, p: subprocess.CompletedProcess, stdout: bytes):
+        self.assertEqual(1, p.returncode)
+        self.assertIn(b"RuntimeError: check is broken", p.stderr)
+        self.assertEqual(stdout, p.stdout)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.dir, "__checkpoints__", "postmortem"))
+        )
+
+    def test_rerun_after_fix(self):
+        p = self.run_program(PYTHON_CALLER, broken=True)
+        self.assertCrashed(p, b"step0\nstep2\n")
+
+        p = self.run_program(PYTHON_CALLER, broken=False)
+        self.assertEqual(0, p.returncode, p.stderr.decode())
+        # The snapshot taken as the exception escaped check() is kept, not
+        # the ones of the functions the exception escaped afterwards, so
+        # only the call to check() is re-executed.
+        self.assertEqual(b"step3 20\n", p.stdout)
+
+    def test_calls_from_c_are_not_captured(self):
+        p = self.run_program(C_CALLER, broken=True)
+        self.assertCrashed(p, b"step0\n")
+
+        # check() was called by map(), so the snapshot was taken at the call
+        # to processing() instead.
+        p = self.run_program(C_CALLER, broken=False)
+        self.assertEqual(0, p.returncode, p.stderr.decode())
+        self.assertEqual(b"step0\nstep3 [10, 20]\n", p.stdout)
+
+    def test_rerun_is_traced(self):
+        self.run_program(PYTHON_CALLER, broken=True)
+        self.run_program(PYTHON_CALLER, broken=False)
+
+        # Resuming put the call tracer back, so the calls made after the
+        # rerun are in the next call log.
+        path = os.path.join(self.dir, "__checkpoints__", "calltrace-done")
+        with open(path, "rb") as f:
+            funcall_log = pickle.load(f)
+        self.assertIn("step3", [qualname for _, qualname, _ in funcall_log])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+"""Test checkpoints requested by signals, in preemption.py
+
+Each test runs a program that sends itself a SIGTERM, then runs it again to
+resume from the checkpoint it saved.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+PROGRAM = """
+import os
+import signal
+import time
+
+import function_checkpointing as ckpt
+
+
+def work(x):
+    if str(x) in os.environ.get("PREEMPT_AT", "").split(","):
+        os.kill(os.getpid(), signal.SIGTERM)
+    return x * 10
+
+
+def report(results):
+    print(results)
+
+
+%s
+
+
+ckpt.start_call_tracing([__file__])
+ckpt.checkpoint_on_signals(grace_period=float(os.environ.get("GRACE", "30")))
+if os.path.exists("__checkpoints__/preempted"):
+    ckpt.resume_from_checkpoint("preempted")
+else:
+    main()
+"""
+
+PYTHON_CALLER = """
+def main():
+    results = []
+    for x in range(6):
+        y = work(x)
+        results.append(y)
+    report(results)
+"""
+
+C_CALLER = """
+def main():
+    results = list(map(work, range(6)))
+    report(results)
+"""
+
+
+class TestPreemption(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_program(self, main: str, **env) -> subprocess.CompletedProcess:
+        with open(os.path.join(self.dir, "program.py"), "w") as f:
+            f.write(PROGRAM % main)
+        return subprocess.run(
+            [sys.executable, "program.py"],
+            cwd=self.dir,
+            env=dict(os.environ, **env),
+            capture_output=True,
+            timeout=60,
+        )
+
+    def assertPreempted(self, p: subprocess.CompletedProcess):
+        self.assertEqual(128 + 15, p.returncode, p.stderr.decode())
+        self.assertEqual(b"", p.stdout)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.dir, "__checkpoints__", "preempted"))
+        )
+
+    def assertFinished(self, p: subprocess.CompletedProcess):
+        self.assertEqual(0, p.returncode, p.stderr.decode())
+        self.assertEqual(b"[0, 10, 20, 30, 40, 50]\n", p.stdout)
+
+    def test_resume(self):
+        self.assertPreempted(self.run_program(PYTHON_CALLER, PREEMPT_AT="2"))
+        self.assertFinished(self.run_program(PYTHON_CALLER))
+
+    def test_resumed_program_is_traced(self):
+        self.assertPreempted(self.run_program(PYTHON_CALLER, PREEMPT_AT="1"))
+        # Safe points only happen if resuming put the call tracer back.
+        self.assertPreempted(self.run_program(PYTHON_CALLER, PREEMPT_AT="4"))
+        self.assertFinished(self.run_program(PYTHON_CALLER))
+
+    def test_calls_from_c_are_not_safe_points(self):
+        # The calls to work() come from map(). The checkpoint is taken at the
+        # call to report() instead.
+        self.assertPreempted(self.run_program(C_CALLER, PREEMPT_AT="3"))
+        self.assertFinished(self.run_program(C_CALLER))
+
+    def test_exits_without_safe_point(self):
+        main = (
+            "def main():\n"
+            "    os.kill(os.getpid(), signal.SIGTERM)\n"
+            "    while True:\n"
+            "        time.sleep(0.01)\n"
+        )
+        p = self.run_program(main, GRACE="0.2")
+        self.assertEqual(128 + 15, p.returncode, p.stderr.decode())
+        self.assertFalse(
+            os.path.exists(os.path.join(self.dir, "__checkpoints__", "preempted"))
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+"""Test the background reads in prefetch.py
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import function_checkpointing.prefetch as prefetch
+
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "step1")
+        with open(self.path, "wb") as f:
+            f.write(b"x" * (3 * prefetch._READ_SIZE // 2))
+
+    def tearDown(self):
+        prefetch.take("step1")
+        prefetch.take(prefetch.LAST_UNCHANGED)
+        shutil.rmtree(self.dir)
+
+    def test_overlaps_with_caller(self):
+        located = threading.Event()
+        release = threading.Event()
+
+        def locate():
+            located.set()
+            release.wait(5)
+            return "trace-step1", self.path
+
+        prefetch.start(prefetch.LAST_UNCHANGED, locate)
+        # The caller keeps running while the checkpoint is located.
+        self.assertTrue(located.wait(5))
+        release.set()
+
+        self.assertEqual("trace-step1", prefetch.take(prefetch.LAST_UNCHANGED).wait())
+        self.assertIsNone(prefetch.take(prefetch.LAST_UNCHANGED))
+
+    def test_started_once(self):
+        calls = []
+
+        def locate():
+            calls.append(1)
+            return "step1", self.path
+
+        first = prefetch.start("step1", locate)
+        self.assertIs(first, prefetch.start("step1", locate))
+        first.wait()
+        self.assertEqual([1], calls)
+
+    def test_errors_are_raised_when_waiting(self):
+        missing = os.path.join(self.dir, "missing")
+        prefetch.start("step1", lambda: ("step1", missing))
+        with self.assertRaises(FileNotFoundError):
+            prefetch.take("step1").wait()
+
+    def test_nothing_to_read(self):
+        prefetch.start(prefetch.LAST_UNCHANGED, lambda: ("", ""))
+        self.assertEqual("", prefetch.take(prefetch.LAST_UNCHANGED).wait())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+"""Test the resumable iterators in resumable.py
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import function_checkpointing.resumable as resumable
+
+
+def dumps(obj) -> bytes:
+    f = tempfile.TemporaryFile()
+    pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = resumable.dispatch_table
+    pickler.dump(obj)
+    f.seek(0)
+    return f.read()
+
+
+@resumable.resumable_generator
+def squares(n):
+    for i in range(n):
+        yield i * i
+
+
+class TestResumable(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.dir, "data.txt")
+        with open(self.fname, "w") as f:
+            f.write("".join("line %d\n" % i for i in range(10)))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_lines(self):
+        lines = resumable.resumable_lines(self.fname)
+        next(lines)
+        next(lines)
+        restored = pickle.loads(dumps(lines))
+        self.assertEqual("line 2\n", next(restored))
+        self.assertEqual(7, len(list(restored)))
+
+    def test_binary_file(self):
+        with open(self.fname, "rb") as f:
+            it = enumerate(f)
+            next(it)
+            restored = pickle.loads(dumps(it))
+            self.assertEqual((1, b"line 1\n"), next(restored))
+
+    def test_text_file_being_iterated(self):
+        with open(self.fname) as f:
+            next(f)
+            with self.assertRaises(pickle.PicklingError):
+                dumps(f)
+
+    def test_file_open_for_writing(self):
+        with open(os.path.join(self.dir, "out"), "w") as f:
+            with self.assertRaises(pickle.PicklingError):
+                dumps(f)
+
+    def test_generator(self):
+        gen = zip(squares(10), range(10))
+        next(gen)
+        next(gen)
+        restored = pickle.loads(dumps(gen))
+        self.assertEqual((4, 2), next(restored))
@@ -0,0 +1,199 @@
+"""Test the retention policies in retention.py
+"""
+
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import function_checkpointing.retention as retention
+
+PROGRAM = """
+import time
+
+import function_checkpointing as ckpt
+
+
+def work():
+    return 1
+
+
+def other():
+    return 2
+
+
+def main():
+    for i in range(5):
+        # Let the policy's thread go back to waiting for the next save.
+        time.sleep(0.1)
+        work()
+        other()
+        ckpt.save_checkpoint_and_call_log(f"step{i}")
+
+
+ckpt.set_retention_policy(ckpt.KeepLast(100))
+ckpt.start_call_tracing([__file__])
+main()
+"""
+
+
+def checkpoints(mtimes, nbytes=1):
+    return [
+        retention.StoredCheckpoint("ckpt%d" % i, mtime, nbytes, [])
+        for i, mtime in enumerate(mtimes)
+    ]
+
+
+class TestPolicies(unittest.TestCase):
+    def test_keep_last(self):
+        c = checkpoints(range(10))
+        self.assertEqual({"ckpt8", "ckpt9"}, retention.KeepLast(2).select(c))
+
+    def test_keep_exponential(self):
+        # One checkpoint per second for 100 seconds.
+        c = checkpoints(range(100))
+        kept = retention.KeepExponential(min_interval=1, factor=2).select(c)
+
+        # Ages 0, 1, 2-3, 4-7, ..., 64-99 each keep one checkpoint.
+        self.assertEqual(8, len(kept))
+        self.assertIn("ckpt99", kept)
+        self.assertIn("ckpt0", kept)
+
+    def test_max_bytes(self):
+        c = checkpoints(range(10), nbytes=10)
+        policy = retention.RetentionPolicy(max_bytes=35)
+        self.assertEqual({"ckpt7", "ckpt8", "ckpt9"}, policy.select(c))
+
+    def test_max_bytes_keeps_newest(self):
+        c = checkpoints(range(3), nbytes=100)
+        policy = retention.RetentionPolicy(max_bytes=10)
+        self.assertEqual({"ckpt2"}, policy.select(c))
+
+    def test_max_bytes_drops_oldest_first(self):
+        c = [
+            retention.StoredCheckpoint("ckpt%d" % i, i, nbytes, [])
+            for i, nbytes in enumerate([1, 50, 10, 10])
+        ]
+        policy = retention.RetentionPolicy(max_bytes=30)
+        self.assertEqual({"ckpt2", "ckpt3"}, policy.select(c))
+
+    def test_union_of_keep_policies(self):
+        c = checkpoints(range(100))
+        policy = retention.RetentionPolicy(
+            [retention.KeepLast(3), retention.KeepExponential(1, 2)]
+        )
+        kept = policy.select(c)
+        self.assertTrue({"ckpt97", "ckpt98", "ckpt99", "ckpt0"} <= kept)
+
+
+class TestCollectGarbage(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def touch(self, name, mtime, content=b"x"):
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        os.utime(path, (mtime, mtime))
+
+    def touch_call_log(self, name, mtime, *functions):
+        funcall_log = {("f.py", f, 1): b"hash of " + f.encode() for f in functions}
+        self.touch("calltrace-" + name, mtime, pickle.dumps(funcall_log))
+
+    def read_call_log(self, name):
+        with open(os.path.join(self.dir, "calltrace-" + name), "rb") as f:
+            return sorted(qualname for _, qualname, _ in pickle.load(f))
+
+    def test_deletes_call_logs_with_checkpoints(self):
+        for i in range(5):
+            self.touch("step%d" % i, i)
+            self.touch_call_log("step%d" % i, i, "f%d" % i)
+        self.touch("calltrace-orphan", 0)
+
+        retention.collect_garbage(
+            self.dir, retention.RetentionPolicy([retention.KeepLast(2)])
+        )
+
+        self.assertEqual(
+            ["calltrace-step3", "calltrace-step4", "step3", "step4"],
+            sorted(os.listdir(self.dir)),
+        )
+        # The calls before the deleted checkpoints are still logged.
+        self.assertEqual(["f0", "f1", "f2", "f3"], self.read_call_log("step3"))
+        self.assertEqual(["f4"], self.read_call_log("step4"))
+
+    def test_merges_call_stats(self):
+        def stats(calls, interval):
+            return {
+                "calls": {("f.py", "f", 1): (calls, 1.0)},
+                "interval_seconds": interval,
+                "checkpoint_seconds": 0.5,
+                "checkpoint_bytes": 10,
+            }
+
+        for i in range(2):
+            self.touch("step%d" % i, i)
+            content = pickle.dumps({}) + pickle.dumps(stats(i + 1, 10.0))
+            self.touch("calltrace-step%d" % i, i, content)
+
+        retention.collect_garbage(
+            self.dir, retention.RetentionPolicy([retention.KeepLast(1)])
+        )
+
+        path = os.path.join(self.dir, "calltrace-step1")
+        with open(path, "rb") as f:
+            pickle.load(f)
+            merged = pickle.load(f)
+        self.assertEqual((3, 2.0), merged["calls"][("f.py", "f", 1)])
+        self.assertEqual(20.5, merged["interval_seconds"])
+
+    def test_waits_for_a_call_log_to_merge_into(self):
+        for i in range(3):
+            self.touch("step%d" % i, i)
+            self.touch_call_log("step%d" % i, i, "f%d" % i)
+        # The newest checkpoint's call log isn't written yet.
+        self.touch("step3", 3)
+        policy = retention.RetentionPolicy([retention.KeepLast(1)])
+
+        retention.collect_garbage(self.dir, policy)
+        self.assertIn("calltrace-step0", os.listdir(self.dir))
+
+        self.touch_call_log("step3", 3, "f3")
+        retention.collect_garbage(self.dir, policy)
+        self.assertEqual(["calltrace-step3", "step3"], sorted(os.listdir(self.dir)))
+        self.assertEqual(["f0", "f1", "f2", "f3"], self.read_call_log("step3"))
+
+
+class TestTracedLoop(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_calls_are_logged_while_enforcing(self):
+        with open(os.path.join(self.dir, "program.py"), "w") as f:
+            f.write(PROGRAM)
+        p = subprocess.run(
+            [sys.executable, "program.py"],
+            cwd=self.dir,
+            capture_output=True,
+            timeout=60,
+        )
+        self.assertEqual(0, p.returncode, p.stderr.decode())
+
+        # The policy's thread waits for work between saves. That mustn't turn
+        # the call tracer off for the loop.
+        for i in range(5):
+            path = os.path.join(self.dir, "__checkpoints__", "calltrace-step%d" % i)
+            with open(path, "rb") as f:
+                funcall_log = pickle.load(f)
+            qualnames = [qualname for _, qualname, _ in funcall_log]
+            self.assertIn("work", qualnames, "step%d" % i)
+            self.assertIn("other", qualnames, "step%d" % i)
@@ -3,10 +3,50 @@
 
 from typing import Callable, List, Sequence
 import dis
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
 
+import function_checkpointing.generators as generators
 import function_checkpointing.save_restore as save_restore
 
+GENERATOR_PROGRAM = """
+import os
+
+import function_checkpointing as ckpt
+
+
+def numbers():
+    for x in range(4):
+        if x == 2:
+            ckpt.save_checkpoint("generator")
+            if "EXIT" in os.environ:
+                os._exit(3)
+        yield x * 10
+    return "done"
+
+
+def delegate():
+    result = yield from numbers()
+    yield result
+
+
+def main():
+    results = []
+    for y in %s():
+        results.append(y)
+    print(results)
+
+
+if os.path.exists("__checkpoints__/generator"):
+    ckpt.resume_from_checkpoint("generator")
+else:
+    main()
+"""
+
 
 class TestLoopNestingLevel(unittest.TestCase):
     """Test the loop_nesting_level function."""
@@ -216,3 +256,83 @@ class TestCheckpoints(unittest.TestCase):
 
         c = func()
         self.assertEqual(c[0].stack_content[-1], save_restore.save_jump)
+
+
+class TestGeneratorFrames(unittest.TestCase):
+    def test_for_loop_over_generator(self):
+        def gen():
+            yield save_restore.save_jump()
+
+        def func():
+            for c in gen():
+                return c
+
+        c = func()
+        self.assertEqual(["gen", "func"], [f.co_name for f in c[:2]])
+        self.assertIsInstance(c[1].stack_content[-1], generators.SuspendedGenerator)
+
+    def test_yield_from(self):
+        def inner():
+            yield save_restore.save_jump()
+
+        def outer():
+            yield from inner()
+
+        def func():
+            return next(outer())
+
+        c = func()
+        self.assertEqual(["inner", "outer", "func"], [f.co_name for f in c[:3]])
+        # The generator being delegated to, and the value to send it.
+        self.assertIsInstance(c[1].stack_content[-2], generators.SuspendedGenerator)
+        self.assertIsNone(c[1].stack_content[-1])
+        # The argument to next().
+        self.assertIsInstance(c[2].stack_content[-1], generators.SuspendedGenerator)
+
+    def test_recreate(self):
+        def gen(a, b):
+            yield save_restore.save_jump()
+
+        def func():
+            for c in gen(1, 2):
+                return c
+
+        c = generators.recreate(func())
+        self.assertEqual("gen", c[1].stack_content[-1].__name__)
+
+
+class TestGeneratorRoundTrip(unittest.TestCase):
+    """Save inside a generator, and resume in a new process."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def save_and_resume(self, source: str) -> bytes:
+        with open(os.path.join(self.dir, "program.py"), "w") as f:
+            f.write(GENERATOR_PROGRAM % source)
+
+        def run(**env):
+            return subprocess.run(
+                [sys.executable, "program.py"],
+                cwd=self.dir,
+                env=dict(os.environ, **env),
+                capture_output=True,
+                timeout=60,
+            )
+
+        p = run(EXIT="1")
+        self.assertEqual(3, p.returncode, p.stderr.decode())
+        p = run()
+        self.assertEqual(0, p.returncode, p.stderr.decode())
+        return p.stdout
+
+    def test_for_loop_over_generator(self):
+        self.assertEqual(b"[0, 10, 20, 30]\n", self.save_and_resume("numbers"))
+
+    def test_yield_from(self):
+        self.assertEqual(
+            b"[0, 10, 20, 30, 'done']\n", self.save_and_resume("delegate")
+        )
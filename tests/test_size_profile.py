@@ -0,0 +1,51 @@
+"""Test the checkpoint size profiler in size_profile.py
+"""
+
+import pickle
+import unittest
+
+import function_checkpointing.save_restore as save_restore
+import function_checkpointing.size_profile as size_profile
+
+
+class TestSizeProfile(unittest.TestCase):
+    def test_largest_local(self):
+        def func():
+            small = 1
+            big = list(range(100000))
+            return save_restore.save_jump()
+
+        profile = size_profile.profile_checkpoint(func())
+
+        largest = next(c for c in profile.locals if c.depth == 0)
+        self.assertEqual(("func", "big"), (largest.function, largest.name))
+        self.assertEqual("func", profile.frames[0].function)
+        self.assertGreater(profile.frames[0].nbytes, 100000)
+
+    def test_shared_object(self):
+        def inner(shared):
+            return save_restore.save_jump()
+
+        def outer():
+            shared = list(range(10000))
+            return inner(shared)
+
+        profile = size_profile.profile_checkpoint(outer())
+
+        self.assertEqual("list", profile.shared[0].type)
+        self.assertEqual([0, 1], profile.shared[0].frames)
+        self.assertEqual(
+            len(pickle.dumps(list(range(10000)), pickle.HIGHEST_PROTOCOL)),
+            profile.shared[0].nbytes,
+        )
+        self.assertGreater(profile.shared[0].seconds, 0)
+
+    def test_unpicklable_local(self):
+        def func():
+            unpicklable = lambda: None
+            return save_restore.save_jump()
+
+        profile = size_profile.profile_checkpoint(func())
+
+        [cost] = [c for c in profile.locals if c.name == "unpicklable"]
+        self.assertIsNotNone(cost.error)
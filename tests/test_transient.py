@@ -0,0 +1,176 @@
+"""Test the transient locals in transient.py
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+import function_checkpointing.checkpoint_file as checkpoint_file
+import function_checkpointing.save_restore as save_restore
+import function_checkpointing.transient as transient
+
+PROGRAM = """
+import os
+import threading
+
+import function_checkpointing as ckpt
+
+
+class Connection(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+
+ckpt.register_transient_type(Connection, rehydrate=Connection)
+
+
+class Worker(object):
+    def __init__(self):
+        self.conn = Connection()
+
+
+@ckpt.transient_locals(cache=lambda: {"rebuilt": True})
+def process():
+    cache = {"rebuilt": False}
+    worker = Worker()
+    ckpt.save_checkpoint("process")
+    # The comprehension captures cache in a cell.
+    print([cache[k] for k in cache], worker.conn.pid == os.getpid())
+
+
+if os.path.exists("__checkpoints__/process"):
+    ckpt.resume_from_checkpoint("process")
+else:
+    process()
+"""
+
+
+class Resource(object):
+    """Can't be pickled, like a database connection."""
+
+    def __init__(self, url):
+        self.url = url
+        self.lock = threading.Lock()
+
+
+transient.register_transient_type(
+    Resource, save=lambda r: r.url, rehydrate=lambda url: Resource(url)
+)
+
+
+class Client(object):
+    def __init__(self, resource):
+        self.resource = resource
+
+
+class Replica(Resource):
+    pass
+
+
+def inner(r, client):
+    # Leave out the test runner's frames, which can't be pickled.
+    return save_restore.save_jump(2)
+
+
+def outer():
+    r = Resource("db://x")
+    return inner(r, Client(r))
+
+
+class TestTransient(unittest.TestCase):
+    def test_transient_local(self):
+        @transient.transient_locals(cache=dict)
+        def func():
+            cache = {"a": 1}
+            kept = {"b": 2}
+            return save_restore.save_jump()
+
+        c = func()
+        self.assertEqual(transient.TransientLocal, type(c[0].stack_content[0]))
+        self.assertEqual({"b": 2}, c[0].stack_content[1])
+
+        rehydrated = transient.rehydrate(c)
+        self.assertEqual({}, rehydrated[0].stack_content[0])
+        # The snapshot itself is untouched.
+        self.assertEqual(transient.TransientLocal, type(c[0].stack_content[0]))
+
+    def test_transient_cell(self):
+        @transient.transient_locals(cache=dict)
+        def func():
+            cache = {"a": 1}
+            c = save_restore.save_jump()
+            return c, lambda: cache
+
+        c, _ = func()
+        cell_slot = func.__code__.co_nlocals
+        self.assertEqual(transient.TransientCell, type(c[0].stack_content[cell_slot]))
+
+        # The rebuilt local is put back in a cell.
+        cell = transient.rehydrate(c)[0].stack_content[cell_slot]
+        self.assertEqual({}, cell.cell_contents)
+
+    def test_transient_type_shared_across_frames(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "ckpt")
+            checkpoint_file.write_checkpoint(path, outer())
+            c = checkpoint_file.read_checkpoint(path)
+        inner_r, client = c[0].stack_content[:2]
+        outer_r = c[1].stack_content[0]
+        self.assertEqual("db://x", inner_r.url)
+        self.assertIs(inner_r, outer_r)
+        # Instances referenced by other objects are rebuilt too.
+        self.assertIs(inner_r, client.resource)
+
+    def test_transient_subclass(self):
+        def func():
+            r = Replica("db://y")
+            return save_restore.save_jump(1)
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "ckpt")
+            checkpoint_file.write_checkpoint(path, func())
+            c = checkpoint_file.read_checkpoint(path)
+        self.assertEqual(Resource, type(c[0].stack_content[0]))
+        self.assertEqual("db://y", c[0].stack_content[0].url)
+
+    def test_unknown_local(self):
+        with self.assertRaises(ValueError):
+
+            @transient.transient_locals(nope=dict)
+            def func():
+                pass
+
+
+class TestResume(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, "program.py"), "w") as f:
+            f.write(PROGRAM)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_program(self) -> bytes:
+        p = subprocess.run(
+            [sys.executable, "program.py"],
+            cwd=self.dir,
+            capture_output=True,
+            timeout=60,
+        )
+        self.assertEqual(0, p.returncode, p.stderr.decode())
+        return p.stdout
+
+    def test_resume(self):
+        self.assertEqual(b"[False] True\n", self.run_program())
+        # The cache captured by the comprehension is rebuilt, and so is the
+        # worker's connection, with its lock.
+        self.assertEqual(b"[True] True\n", self.run_program())
+
+
+if __name__ == "__main__":
+    unittest.main()